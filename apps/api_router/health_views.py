@@ -260,6 +260,56 @@ def _check_cmc_keys_health():
     
     return cmc_keys_status
 
+def _get_cmc_credit_budget():
+    """
+    导出各CMC令牌桶当前剩余的credit（按经过时间计算恢复量）
+    """
+    try:
+        import time
+        from apps.cmc_proxy.consts import CMC_CREDIT_BUCKETS, CMC_CREDIT_BUCKET_KEY
+
+        redis_client = redis.from_url(settings.REDIS_CMC_URL, decode_responses=True)
+        pattern = CMC_CREDIT_BUCKET_KEY % {'key_id': '*', 'endpoint_class': '*'}
+        now = time.time()
+        budget = {}
+
+        for key in redis_client.scan_iter(match=pattern, count=100):
+            endpoint_class = key.rsplit(':', 1)[-1]
+            config = CMC_CREDIT_BUCKETS.get(endpoint_class)
+            state = redis_client.hgetall(key)
+            if not config or not state:
+                continue
+
+            tokens = float(state.get('tokens', config['capacity']))
+            elapsed = max(0.0, now - float(state.get('ts', now)))
+            remaining = min(config['capacity'], tokens + elapsed * config['refill_per_minute'] / 60)
+            budget.setdefault(state.get('label', 'unknown'), {})[endpoint_class] = {
+                'remaining_credits': round(remaining, 2),
+                'capacity': config['capacity'],
+                'refill_per_minute': config['refill_per_minute'],
+            }
+
+        return budget
+
+    except Exception as e:
+        return {'error': str(e)}
+
+def _get_cmc_market_data_stats():
+    """
+    获取CMC市场数据SWR缓存的累计计数（命中、过期命中、未命中、后台刷新）
+    """
+    try:
+        from apps.cmc_proxy.consts import CMC_MARKET_DATA_STATS_KEY
+
+        redis_client = redis.from_url(settings.REDIS_CMC_URL, decode_responses=True)
+        stats = {field: int(value) for field, value in redis_client.hgetall(CMC_MARKET_DATA_STATS_KEY).items()}
+        for field in ('hits', 'stale_hits', 'misses', 'refreshes', 'refresh_failed'):
+            stats.setdefault(field, 0)
+        return stats
+
+    except Exception as e:
+        return {'error': str(e)}
+
 @require_http_methods(["GET"])
 def beat_health(request):
     """
@@ -354,6 +404,12 @@ def beat_health(request):
         # 添加CMC Keys状态检查
         cmc_keys_status = _check_cmc_keys_health()
         
+        # 添加CMC credit预算（各令牌桶剩余额度）
+        cmc_credit_budget = _get_cmc_credit_budget()
+        
+        # 添加CMC市场数据缓存计数
+        cmc_market_data_stats = _get_cmc_market_data_stats()
+        
         response_data = {
             'status': overall_status,
             'timestamp': datetime.now().isoformat(),
@@ -361,7 +417,9 @@ def beat_health(request):
             'critical_tasks': critical_status,
             'data_freshness': data_freshness,
             'execution_stats': task_execution_stats,
-            'cmc_keys': cmc_keys_status
+            'cmc_keys': cmc_keys_status,
+            'cmc_credit_budget': cmc_credit_budget,
+            'cmc_market_data_cache': cmc_market_data_stats
         }
         
         # 根据数据新鲜度和CMC Keys状态调整整体状态
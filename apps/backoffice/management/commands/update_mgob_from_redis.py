@@ -59,16 +59,21 @@ class Command(BaseCommand):
         
         # 用于调试的交易所ID集合
         exchange_ids = set()
+        # 价格读取游标：首次读取全部价格，之后只读取上次读取以来有更新的价格
+        cursor = 0
         
         while True:
             start_time = time.time()
             try:
-                # 从Redis获取所有价格数据
-                prices = await redis_persistor.get_all_prices()
+                # 从Redis获取自上次读取以来更新的价格数据
+                prices, next_cursor = await redis_persistor.get_prices_since(cursor)
                 if not prices:
-                    logger.warning("Redis中没有找到价格数据")
+                    if cursor:
+                        logger.info("Redis中没有新的价格更新")
+                    else:
+                        logger.warning("Redis中没有找到价格数据")
                 else:
-                    logger.info(f"从Redis获取到{len(prices)}条价格记录")
+                    logger.info(f"从Redis获取到{len(prices)}条价格记录（游标 {cursor}）")
                     
                     # 将Redis数据转换为PriceUpdateInfo对象
                     price_updates = []
@@ -131,6 +136,9 @@ class Command(BaseCommand):
                         
                     # 打印收集到的交易所ID列表
                     logger.info(f"从Redis中收集到的交易所ID列表: {sorted(exchange_ids)}")
+
+                # 写入数据库之后再推进游标，本轮失败时下一轮重新读取这些价格
+                cursor = next_cursor
             
             except Exception as e:
                 logger.error(f"同步过程中出错: {e}", exc_info=True)
@@ -7,16 +7,54 @@ CMC_N1 = 200  # 获取的"主要热门代币"数量
 CMC_TTL_HOT = 600  # 获取的"主要热门代币"在Redis中的缓存时间（秒）
 CMC_T1_MERGE_WINDOW_SECONDS = 1  # 合并用户请求的最大等待时间窗口（秒）
 CMC_N2_BATCH_TARGET_SIZE = 100  # 批量查询的目标代币数量
+CMC_COALESCE_FLUSH_DELAY_SECONDS = 0.05  # 进程内合并缓存未命中请求的最长等待时间（秒），批次满额时立即发送
+CMC_COALESCE_WAIT_TIMEOUT_SECONDS = 15  # 等待合并请求返回的超时时间（秒）
 CMC_N3_SUPPLEMENT_POOL_RANGE = 200  # "次热门补充池"的代币数量
 CMC_TTL_WARM_COLD = 600  # 获取的代币在Redis中的缓存时间（秒）
 CMC_TTL_BASE = 3600  # 每日全量更新的代币在Redis中的基础缓存时间（秒）
 CMC_MARKET_DATA_TTL = 600  # 市场数据缓存时间（秒） - 10分钟
+CMC_MARKET_DATA_REFRESH_COOLDOWN = 60  # 单个代币后台刷新的跨进程去重标记有效期（秒），刷新成功后期间不再重复刷新
+CMC_MARKET_DATA_STATS_FLUSH_INTERVAL = 10  # 市场数据SWR计数器在进程内累加后写入Redis的间隔（秒）
 CMC_PRICE_FALLBACK_WARNING_THRESHOLD = 900  # CMC价格回退警告阈值（秒） - 15分钟
 CCXT_PRICE_STALE_THRESHOLD = 300  # CCXT价格过期阈值（秒） - 5分钟
+CMC_KLINES_REFILL_BATCH_SIZE = 100  # 后台补齐K线任务每次处理的代币数量
+CMC_SYNC_CHUNK_SIZE = 500  # Redis→数据库同步时每块处理的键数量（一次MGET + 两条批量写入）
+CMC_KLINE_MAX_HOURS = 744  # K线接口支持的最长查询窗口（小时），即1个月
+CMC_KLINE_SERIES_MAX_POINTS = 800  # Redis K线序列缓存保留的最大数据点数，需覆盖 CMC_KLINE_MAX_HOURS
+CMC_KLINE_SERIES_TTL = 86400  # Redis K线序列缓存的过期时间（秒），仅在从数据库回填时设置，追加不刷新
 CMC_DAILY_FULL_SYNC_SCHEDULE = "0 3 * * *"  # 每日全量更新任务的执行时间（Cron格式）
 
+# CoinMarketCap API credit 预算：每个 API Key × 端点类型一个令牌桶，单位为credit
+# capacity 为桶容量（允许的突发量），refill_per_minute 为每分钟恢复的credit数，需按套餐额度调整
+CMC_CREDIT_BUCKETS = {
+    'listings': {'capacity': 100, 'refill_per_minute': 10, 'units_per_credit': 200},  # 每200条数据1 credit
+    'quotes': {'capacity': 60, 'refill_per_minute': 20, 'units_per_credit': 100},  # 每100个代币1 credit
+    'ohlcv': {'capacity': 300, 'refill_per_minute': 30, 'units_per_credit': 100},  # 每100个数据点1 credit
+}
+CMC_PRIORITY_USER = 0  # 优先级通道：外部用户请求（报价、单资产K线回退）
+CMC_PRIORITY_KLINES = 1  # 优先级通道：K线增量更新与补齐
+CMC_PRIORITY_FULL_SYNC = 2  # 优先级通道：每日全量同步
+CMC_CREDIT_PRIORITY_RESERVE = {  # 各通道消耗后桶内至少保留的容量比例，预留给更高优先级的请求
+    CMC_PRIORITY_USER: 0.0,
+    CMC_PRIORITY_KLINES: 0.2,
+    CMC_PRIORITY_FULL_SYNC: 0.5,
+}
+CMC_CREDIT_PRIORITY_MAX_WAIT = {  # 各通道预算不足时最长推迟等待时间（秒），超时放弃本次调用
+    CMC_PRIORITY_USER: 2,
+    CMC_PRIORITY_KLINES: 120,
+    CMC_PRIORITY_FULL_SYNC: 600,
+}
+CMC_CREDIT_BUCKET_TTL = 86400  # 令牌桶状态的过期时间（秒），长时间未使用时视为满桶
+
 # CoinMarketCap Redis 键名模式
 CMC_QUOTE_DATA_KEY = "cmc:quote_data:%(symbol_id)s"
 CMC_SUPPLEMENT_POOL_KEY = "cmc:supplement_pool_by_marketcap"
 CMC_BATCH_REQUESTS_PENDING_KEY = "cmc:batch_requests_pending"  # Key for Redis list storing pending requests
 CMC_BATCH_PROCESSING_LOCK_KEY = "cmc:lock:batch_processing"  # Lock for the batch processing task
+# ZSET of "epoch|high|low|<serialized kline JSON>" scored by epoch seconds; v2 = pre-serialized rows
+CMC_KLINE_SERIES_KEY = "cmc:kline_series:v2:%(cmc_id)s:%(timeframe)s"
+CMC_KLINE_SERIES_VERSION_KEY = "cmc:kline_series:v2:%(cmc_id)s:%(timeframe)s:version"  # INCR on every append; guards backfill
+CMC_KLINES_REFILL_PENDING_KEY = "cmc:klines_refill_pending"  # Redis set of cmc_ids waiting for background kline refill
+CMC_MARKET_DATA_REFRESH_KEY = "cmc:market_data_refresh:%(cmc_id)s"  # NX marker: one background refresh per cmc_id
+CMC_MARKET_DATA_STATS_KEY = "cmc:stats:market_data"  # Hash of SWR counters: hits, stale_hits, misses, refreshes, refresh_failed
+CMC_CREDIT_BUCKET_KEY = "cmc:credit_bucket:%(key_id)s:%(endpoint_class)s"  # Hash: tokens, ts, label
@@ -1,5 +1,6 @@
+import json
 from datetime import timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from django.apps import apps
 from django.utils import timezone
@@ -36,10 +37,18 @@ class MarketDataFormatter:
             return None
 
     @staticmethod
-    def format_market_data_item(item) -> Dict[str, Any]:
-        """格式化单个市场数据项，使用CCXT价格替换CMC价格"""
+    def format_market_data_item(item, ccxt_prices: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """格式化单个市场数据项，使用CCXT价格替换CMC价格
+
+        Args:
+            item: CmcMarketData 实例
+            ccxt_prices: get_ccxt_prices_for_cmc_assets 预先批量加载的价格，未提供时单独查询
+        """
         # 尝试获取CCXT价格
-        ccxt_data = MarketDataFormatter.get_ccxt_price_for_cmc_asset(item.asset)
+        if ccxt_prices is not None:
+            ccxt_data = ccxt_prices.get(item.asset.cmc_id)
+        else:
+            ccxt_data = MarketDataFormatter.get_ccxt_price_for_cmc_asset(item.asset)
         
         # 使用CCXT价格（如果可用），否则回退到CMC价格
         if ccxt_data:
@@ -89,38 +98,88 @@ class MarketDataFormatter:
             
             if not price_obj:
                 # 如果没有找到关联，尝试通过symbol查找最新价格
-                base_asset = cmc_asset.symbol.lower()
+                base_asset = cmc_asset.symbol.upper()
                 price_obj = AssetPrice.objects.filter(base_asset=base_asset).order_by('-updated_at').first()
             
             if price_obj:
-                # 检查价格数据的新鲜度
-                age_minutes = (timezone.now() - price_obj.updated_at).total_seconds() / 60
-                age_seconds = (timezone.now() - price_obj.updated_at).total_seconds()
-                if age_seconds > CCXT_PRICE_STALE_THRESHOLD:
-                    logger.info(f"CCXT price for {cmc_asset.symbol} is {age_minutes:.1f} minutes old, may be stale")
-                
-                return {
-                    'price_usd': float(price_obj.price),
-                    'price_change_24h': float(price_obj.price_change_24h) if price_obj.price_change_24h else None,
-                    'volume_24h': float(price_obj.volume_24h) if price_obj.volume_24h else None,
-                    'price_timestamp': price_obj.price_timestamp,
-                    'exchange': price_obj.exchange,
-                    'data_age_minutes': age_minutes
-                }
+                return MarketDataFormatter._build_ccxt_price_data(price_obj, cmc_asset.symbol)
         except Exception as e:
             # 如果CCXT价格获取失败，记录错误但不影响主流程
             logger.warning(f"Failed to get CCXT price for CMC asset {cmc_asset.symbol} (cmc_id: {cmc_asset.cmc_id}): {e}")
         return None
 
     @staticmethod
-    def format_market_data_from_db(market_data) -> Dict[str, Any]:
+    async def get_ccxt_prices_for_cmc_assets(cmc_assets) -> Dict[int, Dict[str, Any]]:
+        """
+        批量获取CMC资产对应的CCXT价格数据，查询次数与资产数量无关。
+        先按 cmc_asset 关联查询，未命中的再按大写 symbol 匹配 base_asset。
+
+        Returns:
+            {cmc_id: ccxt_price_data}，没有价格的资产不在结果中
+        """
+        assets = [asset for asset in cmc_assets if asset]
+        if not assets:
+            return {}
+
+        prices = {}
+        try:
+            AssetPrice = apps.get_model('price_oracle', 'AssetPrice')
+            assets_by_pk = {asset.pk: asset for asset in assets}
+
+            # 1. 按 cmc_asset 关联批量查询，每个资产保留最新一条
+            linked_qs = AssetPrice.objects.filter(cmc_asset_id__in=list(assets_by_pk)).order_by('-updated_at')
+            async for price_obj in linked_qs:
+                asset = assets_by_pk[price_obj.cmc_asset_id]
+                if asset.cmc_id not in prices:
+                    prices[asset.cmc_id] = MarketDataFormatter._build_ccxt_price_data(price_obj, asset.symbol)
+
+            # 2. 未关联的资产按 symbol 回退查询
+            missing_by_symbol = {}
+            for asset in assets:
+                if asset.cmc_id not in prices and asset.symbol:
+                    missing_by_symbol.setdefault(asset.symbol.upper(), []).append(asset)
+
+            if missing_by_symbol:
+                symbol_qs = AssetPrice.objects.filter(base_asset__in=list(missing_by_symbol)).order_by('-updated_at')
+                async for price_obj in symbol_qs:
+                    for asset in missing_by_symbol.get(price_obj.base_asset.upper(), []):
+                        if asset.cmc_id not in prices:
+                            prices[asset.cmc_id] = MarketDataFormatter._build_ccxt_price_data(price_obj, asset.symbol)
+        except Exception as e:
+            # 如果CCXT价格获取失败，记录错误但不影响主流程
+            logger.warning(f"Failed to bulk load CCXT prices for {len(assets)} CMC assets: {e}")
+        return prices
+
+    @staticmethod
+    def _build_ccxt_price_data(price_obj, symbol) -> Dict[str, Any]:
+        """将 AssetPrice 转换为格式化函数使用的价格字典"""
+        # 检查价格数据的新鲜度
+        age_seconds = (timezone.now() - price_obj.updated_at).total_seconds()
+        age_minutes = age_seconds / 60
+        if age_seconds > CCXT_PRICE_STALE_THRESHOLD:
+            logger.info(f"CCXT price for {symbol} is {age_minutes:.1f} minutes old, may be stale")
+
+        return {
+            'price_usd': float(price_obj.price),
+            'price_change_24h': float(price_obj.price_change_24h) if price_obj.price_change_24h else None,
+            'volume_24h': float(price_obj.volume_24h) if price_obj.volume_24h else None,
+            'price_timestamp': price_obj.price_timestamp,
+            'exchange': price_obj.exchange,
+            'data_age_minutes': age_minutes
+        }
+
+    @staticmethod
+    def format_market_data_from_db(market_data, ccxt_prices: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         混合数据源格式化：
         - CMC数据：市值、排名、供应量等（来自缓存的CMC数据，节省credit）
         - 价格数据：实时CCXT价格（无缓存，保证时效性）
         """
         # 获取实时CCXT价格数据
-        ccxt_data = MarketDataFormatter.get_ccxt_price_for_cmc_asset(market_data.asset)
+        if ccxt_prices is not None:
+            ccxt_data = ccxt_prices.get(market_data.asset.cmc_id)
+        else:
+            ccxt_data = MarketDataFormatter.get_ccxt_price_for_cmc_asset(market_data.asset)
         
         # 价格相关字段：优先使用CCXT实时数据
         if ccxt_data:
@@ -194,21 +253,75 @@ class MarketDataFormatter:
 class KlineDataProcessor:
     """K线数据处理工具"""
 
+    @staticmethod
+    def serialize_kline(k) -> Dict[str, Any]:
+        """序列化单条K线"""
+        return {
+            'timestamp': k.timestamp.isoformat(),
+            'open': float(k.open),
+            'high': float(k.high),
+            'low': float(k.low),
+            'close': float(k.close),
+            'volume': float(k.volume),
+            'volume_token_count': float(k.volume_token_count) if k.volume_token_count else None,
+        }
+
     @staticmethod
     async def serialize_klines_data(klines_qs):
         """序列化K线数据"""
-        return [
-            {
-                'timestamp': k.timestamp.isoformat(),
-                'open': float(k.open),
-                'high': float(k.high),
-                'low': float(k.low),
-                'close': float(k.close),
-                'volume': float(k.volume),
-                'volume_token_count': float(k.volume_token_count) if k.volume_token_count else None,
-            }
-            async for k in klines_qs
-        ]
+        return [KlineDataProcessor.serialize_kline(k) async for k in klines_qs]
+
+    @staticmethod
+    async def group_klines_by_asset(klines_qs) -> Dict[int, List[Any]]:
+        """按资产分组K线查询结果，保持查询集内的时间顺序
+
+        Returns:
+            {asset_id: [CmcKline, ...]}
+        """
+        grouped = {}
+        async for k in klines_qs:
+            grouped.setdefault(k.asset_id, []).append(k)
+        return grouped
+
+    @staticmethod
+    def encode_series_member(kline) -> Tuple[int, str]:
+        """
+        将K线编码为序列缓存成员：(epoch, "epoch|high|low|<serialize_kline 的 JSON>")。
+        写入时即完成序列化，读取时只需切分和按时间切片；high/low 单独存放用于计算24小时高低价。
+        """
+        epoch = int(kline.timestamp.timestamp())
+        row = json.dumps(KlineDataProcessor.serialize_kline(kline), separators=(',', ':'))
+        return epoch, f"{epoch}|{float(kline.high)!r}|{float(kline.low)!r}|{row}"
+
+    @staticmethod
+    def decode_series(members: List[str], start_time, end_time, start_time_24h) -> Dict[str, Any]:
+        """
+        按时间范围切片按时间排序的序列缓存成员，窗口内的已序列化K线一次性解析，
+        并在同一次遍历中计算24小时高低价。输出格式与 serialize_klines_data 一致。
+        """
+        start_ts = start_time.timestamp()
+        end_ts = end_time.timestamp()
+        start_ts_24h = start_time_24h.timestamp()
+
+        rows = []
+        high_24h = low_24h = None
+        for member in members:
+            epoch_str, high, low, row = member.split('|', 3)
+            epoch = int(epoch_str)
+            if epoch < start_ts or epoch > end_ts:
+                continue
+            rows.append(row)
+
+            if epoch >= start_ts_24h:
+                high = float(high)
+                low = float(low)
+                if high_24h is None or high > high_24h:
+                    high_24h = high
+                if low_24h is None or low < low_24h:
+                    low_24h = low
+
+        klines = json.loads(f"[{','.join(rows)}]") if rows else []
+        return {'klines': klines, 'high_24h': high_24h, 'low_24h': low_24h}
 
     @staticmethod
     def calculate_high_low_24h(klines: List[Dict[str, Any]], start_time_24h) -> tuple:
@@ -1,19 +1,30 @@
+from decimal import Decimal, InvalidOperation
+
 from django.db import models
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from apps.price_oracle.models import AssetPrice
+from common.helpers import getLogger
 from common.model_fields import DecField
 from common.models import BaseModel
 
+logger = getLogger(__name__)
+
+# 按小数位数预先构造的 quantize 精度，避免每个值都重新创建
+_DECIMAL_QUANTIZERS = {8: Decimal('1e-8'), 18: Decimal('1e-18')}
+
 
 class CmcAssetManager(models.Manager):
-    async def update_or_create_from_api_data(self, api_data: dict):
-        cmc_id = api_data.get('id')
-        if not cmc_id:
-            return None, False
+    UPSERT_FIELDS = (
+        'name', 'symbol', 'slug', 'platform', 'num_market_pairs', 'date_added', 'tags', 'max_supply',
+        'infinite_supply', 'self_reported_circulating_supply', 'self_reported_market_cap', 'tvl_ratio',
+    )
 
-        defaults = {
+    @staticmethod
+    def _build_fields_from_api_data(api_data: dict) -> dict:
+        """从API数据提取资产字段，过滤掉None值，避免用None覆盖已有数据"""
+        fields = {
             'name': api_data.get('name'),
             'symbol': api_data.get('symbol'),
             'slug': api_data.get('slug'),
@@ -27,21 +38,82 @@ class CmcAssetManager(models.Manager):
             'self_reported_market_cap': api_data.get('self_reported_market_cap'),
             'tvl_ratio': api_data.get('tvl_ratio'),
         }
-        # 过滤掉None值，避免用None覆盖已有数据
-        defaults = {k: v for k, v in defaults.items() if v is not None}
+        return {k: v for k, v in fields.items() if v is not None}
 
+    async def update_or_create_from_api_data(self, api_data: dict):
+        cmc_id = api_data.get('id')
+        if not cmc_id:
+            return None, False
+
+        defaults = self._build_fields_from_api_data(api_data)
         return await self.aupdate_or_create(cmc_id=cmc_id, defaults=defaults)
 
+    async def bulk_upsert_from_api_data(self, api_data_list, existing_assets: dict):
+        """
+        批量写入资产元数据：一条 INSERT ... ON CONFLICT (cmc_id) DO UPDATE。
+        API数据中缺失的字段沿用已有资产的值，与 update_or_create_from_api_data 语义一致。
+
+        Args:
+            api_data_list: CMC API 代币数据列表
+            existing_assets: 已存在的资产 {cmc_id: CmcAsset}
+
+        Returns:
+            ({cmc_id: CmcAsset}, created_count, updated_count)
+        """
+        objs = {}
+        for api_data in api_data_list:
+            cmc_id = api_data.get('id')
+            fields = self._build_fields_from_api_data(api_data)
+            existing = existing_assets.get(cmc_id)
+            if existing is not None:
+                for field_name in self.UPSERT_FIELDS:
+                    fields.setdefault(field_name, getattr(existing, field_name))
+            if not cmc_id or not fields.get('name') or not fields.get('symbol'):
+                continue
+            objs[cmc_id] = self.model(cmc_id=cmc_id, **fields)
+
+        if not objs:
+            return {}, 0, 0
+
+        # PostgreSQL 在 update_conflicts 时会回填主键
+        await self.abulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=['cmc_id'],
+            update_fields=list(self.UPSERT_FIELDS) + ['updated_at'],
+        )
+        updated_count = sum(1 for cmc_id in objs if cmc_id in existing_assets)
+        return objs, len(objs) - updated_count, updated_count
+
 
 class CmcMarketDataManager(models.Manager):
-    async def update_or_create_from_api_data(self, asset, api_data: dict):
+    DECIMAL_FIELDS = (
+        'price_usd', 'market_cap', 'fully_diluted_market_cap', 'volume_24h',
+        'tvl', 'volume_24h_token_count', 'circulating_supply', 'total_supply',
+    )
+    UPSERT_FIELDS = (
+        'timestamp', 'price_usd', 'market_cap', 'fully_diluted_market_cap', 'volume_24h', 'volume_change_24h',
+        'percent_change_1h', 'percent_change_24h', 'percent_change_7d', 'percent_change_30d',
+        'percent_change_60d', 'percent_change_90d', 'market_cap_dominance', 'tvl', 'volume_24h_token_count',
+        'circulating_supply', 'total_supply', 'cmc_rank',
+    )
+
+    @staticmethod
+    def parse_last_updated(api_data: dict):
+        """解析API数据中的 last_updated，缺失或无法解析时返回None"""
         timestamp_str = api_data.get('last_updated')
-        timestamp = timezone.now()
-        if timestamp_str:
-            # 解析 ISO 8601 时间字符串
-            dt = parse_datetime(timestamp_str)
-            if dt is not None:
-                timestamp = timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+        if not timestamp_str:
+            return None
+        # 解析 ISO 8601 时间字符串
+        dt = parse_datetime(timestamp_str)
+        if dt is None:
+            return None
+        return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+    @classmethod
+    def _build_fields_from_api_data(cls, asset, api_data: dict) -> dict:
+        """从API数据提取行情字段，过滤掉None值并验证数据精度"""
+        timestamp = cls.parse_last_updated(api_data) or timezone.now()
 
         defaults = {
             'timestamp': timestamp,
@@ -81,15 +153,16 @@ class CmcMarketDataManager(models.Manager):
         for k, v in defaults.items():
             if v is not None:
                 # 对Decimal字段进行验证
-                if k in ['price_usd', 'market_cap', 'fully_diluted_market_cap', 'volume_24h', 
-                        'tvl', 'volume_24h_token_count', 'circulating_supply', 'total_supply']:
+                if k in cls.DECIMAL_FIELDS:
                     validated_value = CmcKlineManager._validate_decimal_value(k, v, asset.symbol)
                     if validated_value is not None:
                         validated_defaults[k] = validated_value
                 else:
                     validated_defaults[k] = v
-        
-        defaults = validated_defaults
+        return validated_defaults
+
+    async def update_or_create_from_api_data(self, asset, api_data: dict):
+        defaults = self._build_fields_from_api_data(asset, api_data)
 
         # 如果除了时间戳之外没有任何有效数据，可能就不需要更新
         if len(defaults) <= 1:
@@ -100,17 +173,47 @@ class CmcMarketDataManager(models.Manager):
             defaults=defaults,
         )
 
+    async def bulk_upsert_from_api_data(self, asset_data_list, existing_market_data: dict) -> int:
+        """
+        批量写入最新行情：一条 INSERT ... ON CONFLICT (asset_id) DO UPDATE。
+        API数据中缺失的字段沿用已有行情的值，与 update_or_create_from_api_data 语义一致。
+
+        Args:
+            asset_data_list: [(CmcAsset, api_data), ...]
+            existing_market_data: 已存在的行情 {asset_id: CmcMarketData}
+
+        Returns:
+            写入的行数
+        """
+        objs = {}
+        for asset, api_data in asset_data_list:
+            fields = self._build_fields_from_api_data(asset, api_data)
+            if len(fields) <= 1:
+                continue
+            existing = existing_market_data.get(asset.pk)
+            if existing is not None:
+                for field_name in self.UPSERT_FIELDS:
+                    fields.setdefault(field_name, getattr(existing, field_name))
+            objs[asset.pk] = self.model(asset=asset, **fields)
+
+        if not objs:
+            return 0
+
+        await self.abulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=['asset'],
+            update_fields=list(self.UPSERT_FIELDS) + ['updated_at'],
+        )
+        return len(objs)
+
 
 class CmcKlineManager(models.Manager):
-    
+    REQUIRED_PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
     @staticmethod
     def _validate_decimal_value(field_name, value, symbol=None):
         """验证和调整数值以适应数据库字段限制"""
-        from decimal import Decimal, InvalidOperation
-        import logging
-        
-        logger = logging.getLogger(__name__)
-        
         try:
             # 转换为Decimal进行精确计算
             if isinstance(value, (int, float)):
@@ -148,39 +251,41 @@ class CmcKlineManager(models.Manager):
             # 计算整数部分最大位数
             max_integer_digits = max_digits - decimal_places
             
-            # 检查整数部分是否超出限制
-            integer_part = abs(decimal_value).to_integral_value()
-            if len(str(integer_part)) > max_integer_digits:
+            # 检查整数部分是否超出限制（adjusted() 为最高位的指数，避免字符串转换）
+            integer_digits = max(decimal_value.adjusted() + 1, 1)
+            if integer_digits > max_integer_digits:
                 logger.warning(
                     f"Decimal value {value} for {field_name} on {symbol} exceeds max_digits limit. "
-                    f"Integer digits: {len(str(integer_part))}, Max allowed: {max_integer_digits}"
+                    f"Integer digits: {integer_digits}, Max allowed: {max_integer_digits}"
                 )
                 # 返回最大允许值
                 max_value = Decimal('9' * max_integer_digits + '.' + '9' * decimal_places)
                 return max_value if decimal_value > 0 else -max_value
             
             # 调整小数位数
-            adjusted_value = decimal_value.quantize(Decimal('0.' + '0' * decimal_places))
+            adjusted_value = decimal_value.quantize(_DECIMAL_QUANTIZERS[decimal_places])
             
             return adjusted_value
             
         except (InvalidOperation, ValueError, OverflowError) as e:
             logger.error(f"Error validating decimal value {value} for {field_name} on {symbol}: {e}")
             return None
-    async def update_or_create_from_api_data(self, asset, quote_data: dict, timeframe='1h'):
+    @staticmethod
+    def _parse_api_quote(asset, quote_data: dict):
+        """解析单条K线API数据，返回 (开盘时间, 已验证精度的字段) 或 None"""
         time_open_str = quote_data.get('time_open')
         if not time_open_str:
-            return None, False
+            return None
             
         # 解析开盘时间
         dt = parse_datetime(time_open_str)
         if dt is None:
-            return None, False
+            return None
         timestamp = timezone.make_aware(dt) if timezone.is_naive(dt) else dt
             
         usd_quote = quote_data.get('quote', {}).get('USD', {})
         if not usd_quote:
-            return None, False
+            return None
             
         # 计算token数量交易量
         price = usd_quote.get('close') or usd_quote.get('open')
@@ -207,10 +312,16 @@ class CmcKlineManager(models.Manager):
                 if validated_value is not None:
                     validated_defaults[k] = validated_value
         
-        defaults = validated_defaults
-        
-        if not defaults:
+        if not validated_defaults:
+            return None
+
+        return timestamp, validated_defaults
+
+    async def update_or_create_from_api_data(self, asset, quote_data: dict, timeframe='1h'):
+        parsed = self._parse_api_quote(asset, quote_data)
+        if parsed is None:
             return None, False
+        timestamp, defaults = parsed
             
         return await self.aupdate_or_create(
             asset=asset,
@@ -219,6 +330,50 @@ class CmcKlineManager(models.Manager):
             defaults=defaults,
         )
 
+    async def bulk_upsert_from_api_data(self, asset_quotes, timeframe='1h'):
+        """
+        批量写入一个API批次的K线数据：在内存中完成验证与精度调整，
+        再通过一条 INSERT ... ON CONFLICT DO UPDATE 写入数据库。
+
+        Args:
+            asset_quotes: [(asset, quote_data), ...]
+            timeframe: K线周期
+
+        Returns:
+            (klines, created_count, updated_count)
+        """
+        klines = {}
+        for asset, quote_data in asset_quotes:
+            parsed = self._parse_api_quote(asset, quote_data)
+            if parsed is None:
+                continue
+            timestamp, fields = parsed
+            if not all(fields.get(k) is not None for k in self.REQUIRED_PRICE_FIELDS):
+                logger.warning(f"Skipping kline for {asset.symbol} at {timestamp}: missing OHLC values")
+                continue
+            # 同一批次内的重复时间戳以最后一条为准，ON CONFLICT 不允许同一语句两次更新同一行
+            klines[(asset.pk, timestamp)] = self.model(asset=asset, timeframe=timeframe, timestamp=timestamp, **fields)
+
+        if not klines:
+            return [], 0, 0
+
+        # 一次查询统计已存在的行，用于区分新建与更新数量
+        asset_ids = {asset_id for asset_id, _ in klines}
+        timestamps = {timestamp for _, timestamp in klines}
+        existing_qs = self.filter(
+            asset_id__in=asset_ids, timeframe=timeframe, timestamp__in=timestamps
+        ).values_list('asset_id', 'timestamp')
+        existing = {key async for key in existing_qs}
+        updated_count = sum(1 for key in klines if key in existing)
+
+        objs = await self.abulk_create(
+            list(klines.values()),
+            update_conflicts=True,
+            unique_fields=['asset', 'timeframe', 'timestamp'],
+            update_fields=['open', 'high', 'low', 'close', 'volume', 'volume_token_count', 'updated_at'],
+        )
+        return objs, len(objs) - updated_count, updated_count
+
 
 class CmcAsset(BaseModel):
     cmc_id = models.BigIntegerField(unique=True, db_index=True)
@@ -1,19 +1,26 @@
 import asyncio
-import json
+import hashlib
 import logging
-from datetime import datetime
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 
 import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 from apps.cmc_proxy.consts import CMC_N1, CMC_BATCH_PROCESSING_LOCK_KEY, CMC_BATCH_REQUESTS_PENDING_KEY, \
-    CMC_T1_MERGE_WINDOW_SECONDS, CMC_QUOTE_DATA_KEY, CMC_TTL_BASE, CMC_MARKET_DATA_TTL
+    CMC_TTL_BASE, CMC_MARKET_DATA_TTL, CMC_N2_BATCH_TARGET_SIZE, CMC_TTL_WARM_COLD, \
+    CMC_COALESCE_FLUSH_DELAY_SECONDS, CMC_COALESCE_WAIT_TIMEOUT_SECONDS, CMC_KLINES_REFILL_PENDING_KEY, \
+    CMC_KLINE_MAX_HOURS, CMC_PRIORITY_USER, CMC_PRIORITY_KLINES, CMC_PRIORITY_FULL_SYNC, \
+    CMC_MARKET_DATA_REFRESH_KEY, CMC_MARKET_DATA_REFRESH_COOLDOWN, CMC_MARKET_DATA_STATS_FLUSH_INTERVAL
 from apps.cmc_proxy.helpers import KlineDataProcessor, MarketDataFormatter
 from apps.cmc_proxy.models import CmcAsset, CmcKline, CmcMarketData
-from apps.cmc_proxy.utils import CMCRedisClient
+from apps.cmc_proxy.utils import CMCRedisClient, RequestCoalescer, CMCCreditBudget, CMCBudgetExceeded
 from apps.cmc_proxy.utils import acquire_lock, release_lock
 from common.helpers import getLogger
 
@@ -21,10 +28,19 @@ logger = getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
+def _is_retryable_cmc_error(exc: BaseException) -> bool:
+    """预算不足、429和鉴权/额度类错误重试只会继续消耗credit，不重试"""
+    if isinstance(exc, CMCBudgetExceeded):
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code not in (401, 402, 403, 429)
+    return True
+
+
 class CoinMarketCapClient:
     BASE_URL = "https://pro-api.coinmarketcap.com"
 
-    def __init__(self, timeout=20, client_type="klines"):
+    def __init__(self, timeout=20, client_type="klines", budget_redis_getter=None):
         # 根据客户端类型选择不同的API Key
         if client_type == "external":
             self.api_key = getattr(settings, 'COINMARKETCAP_API_KEY_EXTERNAL', None)
@@ -57,6 +73,15 @@ class CoinMarketCapClient:
         }
         self.timeout = timeout
         self._http_client = httpx.AsyncClient(timeout=self.timeout)
+
+        # credit 预算按实际使用的Key划分，降级到默认Key时与K线任务共享同一组令牌桶
+        self.budget = None
+        if budget_redis_getter is not None:
+            self.budget = CMCCreditBudget(
+                budget_redis_getter,
+                key_id=hashlib.sha1(self.api_key.encode()).hexdigest()[:12],
+                label="external" if self.client_type == "external" else "default",
+            )
         
     def _is_valid_api_key(self, api_key: str) -> bool:
         """验证API Key格式（CMC API Key通常是UUID格式）"""
@@ -65,36 +90,48 @@ class CoinMarketCapClient:
         # 基本格式检查，避免明显错误的配置
         return api_key.replace('-', '').replace('_', '').isalnum()
 
-    async def _make_api_request(self, endpoint, params):
-        logger.info(f"Calling CMC API ({self.client_type}): {endpoint} with params: {params}")
+    async def _make_api_request(self, endpoint, params, endpoint_class, units, priority):
+        remaining = None
+        if self.budget:
+            cost = self.budget.estimate_cost(endpoint_class, units)
+            remaining = await self.budget.acquire(endpoint_class, cost, priority)
+        logger.info(f"Calling CMC API ({self.client_type}): {endpoint} with params: {params}, "
+                    f"remaining {endpoint_class} credits: {remaining}")
         response = await self._http_client.get(endpoint, headers=self.headers, params=params)
+        if response.status_code == 429 and self.budget:
+            await self.budget.exhaust(endpoint_class)
         response.raise_for_status()
         # data = await to_thread(response.json)  # JSON数据量很大的时候使用
         return response.json()
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
-    async def get_listings_latest(self, start=1, limit=None):
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10),
+           retry=retry_if_exception(_is_retryable_cmc_error))
+    async def get_listings_latest(self, start=1, limit=None, priority=CMC_PRIORITY_FULL_SYNC):
         endpoint = f"{self.BASE_URL}/v1/cryptocurrency/listings/latest"
         params = {
             'start': start,
             'limit': limit or CMC_N1
         }
-        return await self._make_api_request(endpoint, params)
+        return await self._make_api_request(endpoint, params, 'listings', params['limit'], priority)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
-    async def get_quotes_latest(self, ids=None):
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10),
+           retry=retry_if_exception(_is_retryable_cmc_error))
+    async def get_quotes_latest(self, ids=None, priority=CMC_PRIORITY_USER):
         endpoint = f"{self.BASE_URL}/v2/cryptocurrency/quotes/latest"
         params = {'id': ','.join(map(str, ids))}
-        return await self._make_api_request(endpoint, params)
+        return await self._make_api_request(endpoint, params, 'quotes', len(ids), priority)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
-    async def get_ohlcv_historical(self, coin_ids, count=24):
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10),
+           retry=retry_if_exception(_is_retryable_cmc_error))
+    async def get_ohlcv_historical(self, coin_ids, count=24, priority=CMC_PRIORITY_KLINES):
         endpoint = f"{self.BASE_URL}/v2/cryptocurrency/ohlcv/historical"
         # 支持批量获取多个代币数据
         if isinstance(coin_ids, (list, tuple)):
             ids_param = ','.join(map(str, coin_ids))
+            ids_count = len(coin_ids)
         else:
             ids_param = str(coin_ids)
+            ids_count = 1
 
         params = {
             'id': ids_param,
@@ -102,7 +139,7 @@ class CoinMarketCapClient:
             'count': count,
             'interval': 'hourly'
         }
-        return await self._make_api_request(endpoint, params)
+        return await self._make_api_request(endpoint, params, 'ohlcv', ids_count * count, priority)
 
     async def close(self):
         await self._http_client.aclose()
@@ -130,14 +167,18 @@ class CoinMarketCapService:
         self._client = None
         self._client_type = client_type
         self._cmc_redis = None
+        self._coalescer = None
         self._initialized = False
         self._init_lock = asyncio.Lock()
+        self.loop = None  # 服务绑定的事件循环，Redis连接池和HTTP客户端不能跨事件循环复用
 
     @property
     def client(self):
         """懒加载API客户端"""
         if self._client is None:
-            self._client = CoinMarketCapClient(client_type=self._client_type)
+            # 令牌桶通过服务当前的Redis连接读写，连接重建后自动使用新连接
+            self._client = CoinMarketCapClient(client_type=self._client_type,
+                                               budget_redis_getter=lambda: self._cmc_redis)
         return self._client
 
     @property
@@ -155,6 +196,7 @@ class CoinMarketCapService:
                     logger.info("Async initializing CoinMarketCapService")
                     try:
                         self._cmc_redis = await CMCRedisClient.create(self.redis_url)
+                        self.loop = asyncio.get_running_loop()
                         self._initialized = True
                     except Exception as e:
                         logger.error(f"Failed to initialize CoinMarketCapService: {e}", exc_info=True)
@@ -221,18 +263,13 @@ class CoinMarketCapService:
                 logger.warning("Failed to acquire lock for fetching top N1 listings after retries")
                 return None
 
-            response_data = await self.client.get_listings_latest()
+            response_data = await self.client.get_listings_latest(priority=CMC_PRIORITY_USER)
             tokens_data = response_data.get('data', [])
-            # 使用 Redis pipeline 批量缓存热门列表数据
-            pipe = self.cmc_redis.pipeline()
-            for token_item in tokens_data:
-                cmc_id = token_item.get('id')
-                symbol = token_item.get('symbol')
-                if not cmc_id or not symbol:
-                    continue
-                key_data = CMC_QUOTE_DATA_KEY % {"symbol_id": str(cmc_id)}
-                await pipe.set(key_data, json.dumps(token_item), ex=ttl_hot)
-            await pipe.execute()
+            # 一次 pipeline 往返批量缓存热门列表数据
+            await self.cmc_redis.cache_token_quote_data_many({
+                str(token_item['id']): token_item
+                for token_item in tokens_data if token_item.get('id') and token_item.get('symbol')
+            }, ttl_hot)
 
             # 尝试获取目标代币数据
             target_data = await self.cmc_redis.get_token_quote_data(target_symbol_id)
@@ -248,9 +285,52 @@ class CoinMarketCapService:
                 except Exception as e:
                     logger.error(f"Error releasing lock: {e}", exc_info=True)
 
+    def _get_coalescer(self) -> RequestCoalescer:
+        """获取绑定当前事件循环的请求合并器"""
+        loop = asyncio.get_running_loop()
+        if self._coalescer is None or self._coalescer.loop is not loop:
+            self._coalescer = RequestCoalescer(
+                self._fetch_and_cache_quotes,
+                batch_size=CMC_N2_BATCH_TARGET_SIZE,
+                flush_delay=CMC_COALESCE_FLUSH_DELAY_SECONDS,
+            )
+        return self._coalescer
+
+    async def _fetch_and_cache_quotes(self, symbol_ids: List[str]) -> Dict[str, Any]:
+        """
+        批量获取代币报价并写入缓存，供请求合并器调用。
+        批次不足 CMC_N2_BATCH_TARGET_SIZE 时用补充池中的代币补齐，不额外消耗credit。
+
+        Returns:
+            {symbol_id: token_data}
+        """
+        request_ids = list(symbol_ids)
+        try:
+            supplement_count = CMC_N2_BATCH_TARGET_SIZE - len(request_ids)
+            if supplement_count > 0:
+                supplement_ids = await self.cmc_redis.get_from_supplement_pool(CMC_N2_BATCH_TARGET_SIZE)
+                requested = set(request_ids)
+                request_ids.extend([_id for _id in supplement_ids if _id not in requested][:supplement_count])
+
+            response_data = await self.client.get_quotes_latest(ids=request_ids)
+        except Exception:
+            # 上游失败时交给定时批处理任务兜底重试
+            await self.cmc_redis.rpush(CMC_BATCH_REQUESTS_PENDING_KEY, *symbol_ids)
+            raise
+
+        results = {
+            str(token_data['id']): token_data
+            for token_data in response_data.get('data', {}).values()
+            if token_data.get('id') and token_data.get('symbol')
+        }
+        await self.cmc_redis.cache_token_quote_data_many(results, CMC_TTL_WARM_COLD)
+
+        logger.info(f"Coalesced batch fetched {len(results)} quotes for {len(symbol_ids)} requested IDs")
+        return results
+
     async def initiate_batch_request_processing(self, symbol_id):
         """
-        将请求添加到待处理批次，等待合并窗口，然后尝试从缓存获取数据。
+        将缓存未命中的请求交给进程内请求合并器，与并发请求共享一次上游批量调用。
         Args:
             symbol_id: 代币ID
             
@@ -263,19 +343,7 @@ class CoinMarketCapService:
 
         try:
             await self._ensure_initialized()
-
-            symbol_id = str(symbol_id)
-            position = await self.cmc_redis.lpos(CMC_BATCH_REQUESTS_PENDING_KEY, symbol_id)
-            if position is not None:
-                logger.debug(f"Request for {symbol_id} already in pending batch")
-            else:
-                await self.cmc_redis.rpush(CMC_BATCH_REQUESTS_PENDING_KEY, symbol_id)
-                logger.debug(f"Added {symbol_id} to pending batch")
-
-            await asyncio.sleep(CMC_T1_MERGE_WINDOW_SECONDS)
-
-            data = await self.cmc_redis.get_token_quote_data(symbol_id)
-            return data
+            return await self._get_coalescer().request(str(symbol_id), timeout=CMC_COALESCE_WAIT_TIMEOUT_SECONDS)
         except Exception as e:
             logger.error(f"Error in initiate_batch_request_processing for symbol_id {symbol_id}: {e}", exc_info=True)
             return None
@@ -308,7 +376,8 @@ class CoinMarketCapService:
             logger.error(f"Error getting market data for symbol_id {symbol_id}: {e}", exc_info=True)
             return None
 
-    async def fetch_and_store_klines_batch(self, cmc_ids, count=1, delay_between_calls=2.0, batch_size=100):
+    async def fetch_and_store_klines_batch(self, cmc_ids, count=1, delay_between_calls=2.0, batch_size=100,
+                                           priority=CMC_PRIORITY_KLINES):
         """
         批量获取并存储K线数据，支持大批量处理和速率限制
         
@@ -317,13 +386,14 @@ class CoinMarketCapService:
             count: 获取的K线数据点数量 (初始化时24，增量更新时1)
             delay_between_calls: API调用间隔秒数 (避免触发速率限制)
             batch_size: 每批处理的资产数量 (默认100)
+            priority: credit 预算的优先级通道
             
         Returns:
-            dict: {成功数量, 失败数量, 总K线数}
+            dict: {成功数量, 失败数量, 总K线数, 因预算不足推迟的ID列表}
         """
         try:
             if not cmc_ids:
-                return {'success': 0, 'failed': 0, 'total_klines': 0}
+                return {'success': 0, 'failed': 0, 'total_klines': 0, 'deferred_ids': []}
 
             total_success = 0
             total_failed = 0
@@ -353,7 +423,9 @@ class CoinMarketCapService:
 
                 try:
                     # 批量获取K线数据
-                    response_data = await self.client.get_ohlcv_historical(list(assets_map.keys()), count)
+                    response_data = await self.client.get_ohlcv_historical(
+                        list(assets_map.keys()), count, priority=priority
+                    )
 
                     # 处理返回的数据
                     batch_result = await self._process_klines_response(response_data, assets_map)
@@ -363,8 +435,15 @@ class CoinMarketCapService:
                     total_klines += batch_result['total_klines']
 
                     logger.info(
-                        f"Batch {batch_num} completed: success={batch_result['success']}, failed={batch_result['failed']}, klines={batch_result['total_klines']}")
-
+                        f"Batch {batch_num} completed: success={batch_result['success']}, failed={batch_result['failed']}, klines={batch_result['total_klines']}, "
+                        f"created={batch_result.get('created', 0)}, updated={batch_result.get('updated', 0)}")
+
+                except CMCBudgetExceeded as e:
+                    # 预算不足时推迟剩余批次，由下一次调度继续处理
+                    deferred_ids = list(cmc_ids[i:])
+                    logger.warning(f"Deferring {len(deferred_ids)} assets from batch {batch_num}: {e}")
+                    return {'success': total_success, 'failed': total_failed, 'total_klines': total_klines,
+                            'deferred_ids': deferred_ids}
                 except Exception as e:
                     logger.error(f"Error processing batch {batch_num}: {e}", exc_info=True)
                     total_failed += len(batch_ids)
@@ -376,11 +455,12 @@ class CoinMarketCapService:
 
             logger.info(
                 f"All batches completed: success={total_success}, failed={total_failed}, total_klines={total_klines}")
-            return {'success': total_success, 'failed': total_failed, 'total_klines': total_klines}
+            return {'success': total_success, 'failed': total_failed, 'total_klines': total_klines,
+                    'deferred_ids': []}
 
         except Exception as e:
             logger.error(f"Error in batch klines update: {e}", exc_info=True)
-            return {'success': 0, 'failed': len(cmc_ids), 'total_klines': 0}
+            return {'success': 0, 'failed': len(cmc_ids), 'total_klines': 0, 'deferred_ids': []}
 
     async def _process_klines_response(self, response_data, assets_map):
         """
@@ -391,7 +471,7 @@ class CoinMarketCapService:
             assets_map: 资产映射字典 {cmc_id: asset}
             
         Returns:
-            dict: {success, failed, total_klines}
+            dict: {success, failed, total_klines, created, updated}
         """
         success_count = 0
         failed_count = 0
@@ -407,6 +487,8 @@ class CoinMarketCapService:
             logger.error(f"Unexpected data format from CMC API: {type(data)}")
             return {'success': 0, 'failed': len(assets_map), 'total_klines': 0}
 
+        # 收集整个批次的K线数据，一次批量写入
+        asset_quotes = []
         for cmc_id_str, asset_data in data.items():
             try:
                 cmc_id = int(cmc_id_str)
@@ -421,27 +503,41 @@ class CoinMarketCapService:
                     failed_count += 1
                     continue
 
-                # 存储K线数据
-                asset_klines_count = 0
-                for quote_data in quotes_data:
-                    kline, created = await CmcKline.objects.update_or_create_from_api_data(
-                        asset, quote_data, timeframe='1h'
-                    )
-                    if kline:
-                        asset_klines_count += 1
-
-                if asset_klines_count > 0:
-                    success_count += 1
-                    total_klines_stored += asset_klines_count
-                    logger.debug(f"Stored {asset_klines_count} klines for {asset.symbol}")
-                else:
-                    failed_count += 1
+                asset_quotes.extend((asset, quote_data) for quote_data in quotes_data)
 
             except Exception as e:
                 logger.error(f"Error processing klines for cmc_id {cmc_id_str}: {e}")
                 failed_count += 1
 
-        return {'success': success_count, 'failed': failed_count, 'total_klines': total_klines_stored}
+        if not asset_quotes:
+            return {'success': success_count, 'failed': failed_count, 'total_klines': 0}
+
+        requested_cmc_ids = {asset.cmc_id for asset, _ in asset_quotes}
+        try:
+            klines, created_count, updated_count = await CmcKline.objects.bulk_upsert_from_api_data(
+                asset_quotes, timeframe='1h'
+            )
+        except Exception as e:
+            logger.error(f"Error bulk storing klines for {len(requested_cmc_ids)} assets: {e}", exc_info=True)
+            return {'success': success_count, 'failed': failed_count + len(requested_cmc_ids), 'total_klines': 0}
+
+        series_points = {}
+        for kline in klines:
+            series_points.setdefault(kline.asset.cmc_id, []).append(KlineDataProcessor.encode_series_member(kline))
+
+        success_count += len(series_points)
+        failed_count += len(requested_cmc_ids - set(series_points))
+        total_klines_stored = len(klines)
+        logger.debug(f"Stored {total_klines_stored} klines for {len(series_points)} assets "
+                     f"(created={created_count}, updated={updated_count})")
+
+        # 同步追加到Redis K线序列缓存，读取接口无需再查询数据库
+        if series_points:
+            await self._ensure_initialized()
+            await self.cmc_redis.append_kline_series(series_points, timeframe='1h')
+
+        return {'success': success_count, 'failed': failed_count, 'total_klines': total_klines_stored,
+                'created': created_count, 'updated': updated_count}
 
     async def process_klines(
             self,
@@ -508,35 +604,66 @@ class CoinMarketCapService:
         self._initialized = False
 
 
-# 服务实例缓存
+# 服务实例缓存：{client_type: CoinMarketCapService}，每个实例绑定创建时的事件循环
 _service_instances = {}
-_service_lock = asyncio.Lock()
+
 
 async def get_cmc_service(client_type="klines") -> CoinMarketCapService:
-    """获取指定类型的CoinMarketCapService实例，使用实例缓存避免重复创建"""
-    async with _service_lock:
-        if client_type not in _service_instances:
+    """获取指定类型的CoinMarketCapService实例，同一事件循环内复用，事件循环变化时重新创建"""
+    loop = asyncio.get_running_loop()
+    service = _service_instances.get(client_type)
+    if service is None or service.loop is not loop:
+        stale = service
+        if stale is not None:
+            logger.info(f"CoinMarketCapService for {client_type} is bound to another event loop, recreating")
+        else:
             logger.info(f"Creating new CoinMarketCapService instance for {client_type}")
-            service = CoinMarketCapService(client_type=client_type)
-            await service.async_init()
-            _service_instances[client_type] = service
-        return _service_instances[client_type]
+        # async_init 内部没有挂起点，检查与赋值之间不会被其他协程打断
+        service = CoinMarketCapService(client_type=client_type)
+        await service.async_init()
+        _service_instances[client_type] = service
+        if stale is not None:
+            await _discard_cmc_service(stale)
+    return service
+
+
+async def _discard_cmc_service(service: CoinMarketCapService) -> None:
+    """
+    尽力关闭被替换的旧实例（WSGI下每个请求一个事件循环，不关闭会泄漏HTTP会话与Redis连接池）：
+    原事件循环仍在运行时在其上关闭，否则在当前事件循环上关闭，失败仅记录日志。
+    """
+    if service.loop is not None and service.loop.is_running():
+        asyncio.run_coroutine_threadsafe(service.close(), service.loop)
+        return
+    try:
+        await service.close()
+    except Exception as e:
+        logger.warning(f"Error closing replaced CoinMarketCapService for {service._client_type}: {e}")
+
+
+async def close_cmc_services():
+    """
+    关闭并清空缓存的所有服务实例（HTTP会话与Redis连接池）。
+    绑定在其他（通常是已关闭的）事件循环上的实例只能尽力关闭，关闭失败仅记录日志。
+    """
+    loop = asyncio.get_running_loop()
+    for client_type, service in list(_service_instances.items()):
+        _service_instances.pop(client_type, None)
+        if service.loop is not loop:
+            logger.warning(f"CoinMarketCapService for {client_type} is bound to another event loop, closing best-effort")
+        await service.close()
 
 
 async def get_klines_for_asset(asset: CmcAsset, timeframe: str, start_time: datetime, end_time: datetime,
                                start_time_24h: datetime) -> Dict[str, Any]:
     """
-    从数据库获取并处理单个资产的K线数据。
+    获取并处理单个资产的K线数据（优先读取Redis K线序列缓存）。
     如果数据库没有数据，使用Redis缓存防止重复CMC API调用。
     """
-    klines_qs = CmcKline.objects.filter(
-        asset=asset,
-        timeframe=timeframe,
-        timestamp__gte=start_time,
-        timestamp__lte=end_time
-    ).order_by('timestamp')
-
-    klines = await KlineDataProcessor.serialize_klines_data(klines_qs)
+    kline_data = (await get_klines_for_assets(
+        [asset], timeframe, start_time, end_time, start_time_24h, queue_missing=False
+    ))[asset.cmc_id]
+    klines = kline_data['klines']
 
     # 如果数据库没有K线数据，检查缓存防止重复API调用
     if not klines:
@@ -564,18 +691,15 @@ async def get_klines_for_asset(asset: CmcAsset, timeframe: str, start_time: date
             logger.info(f"No klines found for asset {asset.symbol} (cmc_id: {asset.cmc_id}), attempting to fetch from CMC")
             
             # 获取24小时的历史数据用于初始化
-            result = await service.fetch_and_store_klines_batch([asset.cmc_id], count=24, batch_size=1)
+            result = await service.fetch_and_store_klines_batch([asset.cmc_id], count=24, batch_size=1,
+                                                                priority=CMC_PRIORITY_USER)
 
             if result['success'] > 0:
                 logger.info(f"Successfully fetched and stored {result['total_klines']} klines for {asset.symbol}")
-                # 重新查询数据库获取刚存储的K线数据
-                klines_qs = CmcKline.objects.filter(
-                    asset=asset,
-                    timeframe=timeframe,
-                    timestamp__gte=start_time,
-                    timestamp__lte=end_time
-                ).order_by('timestamp')
-                klines = await KlineDataProcessor.serialize_klines_data(klines_qs)
+                # 重新读取刚存储的K线数据（序列缓存未命中时会从数据库回填）
+                kline_data = (await get_klines_for_assets(
+                    [asset], timeframe, start_time, end_time, start_time_24h, queue_missing=False
+                ))[asset.cmc_id]
             else:
                 logger.warning(f"Failed to fetch klines for {asset.symbol} from CMC API")
             
@@ -591,23 +715,189 @@ async def get_klines_for_asset(asset: CmcAsset, timeframe: str, start_time: date
             except:
                 pass
 
-    high_24h, low_24h = KlineDataProcessor.calculate_high_low_24h(klines, start_time_24h)
+    return kline_data
 
-    return {
-        'klines': klines,
-        'high_24h': high_24h,
-        'low_24h': low_24h,
-    }
+
+async def get_klines_for_assets(assets: List[CmcAsset], timeframe: str, start_time: datetime, end_time: datetime,
+                                start_time_24h: datetime, queue_missing: bool = True) -> Dict[int, Dict[str, Any]]:
+    """
+    批量获取多个资产的K线数据，并计算24小时高低价。
+    优先从Redis K线序列缓存切片读取；序列不存在的资产一次查询从数据库回填完整窗口并写回缓存。
+    没有K线数据的资产加入后台补齐队列，由 refill_missing_klines 任务异步拉取，不在请求内调用CMC API。
+
+    Returns:
+        {cmc_id: {'klines': [...], 'high_24h': float, 'low_24h': float}}
+    """
+    if not assets:
+        return {}
+
+    service = await get_cmc_service(client_type="external")
+    cmc_ids = [asset.cmc_id for asset in assets]
+
+    try:
+        series, versions = await service.cmc_redis.get_kline_series_many(
+            cmc_ids, timeframe, start_time.timestamp(), end_time.timestamp()
+        )
+    except Exception as e:
+        logger.error(f"Failed to read kline series from Redis, falling back to database: {e}", exc_info=True)
+        series, versions = {}, None
+
+    # 序列缓存未命中的资产，从数据库回填 CMC_KLINE_MAX_HOURS 的完整窗口
+    uncached_assets = [asset for asset in assets if series.get(asset.cmc_id) is None]
+    if uncached_assets:
+        backfill_start = min(start_time, end_time - timedelta(hours=CMC_KLINE_MAX_HOURS))
+        klines_qs = CmcKline.objects.filter(
+            asset_id__in=[asset.pk for asset in uncached_assets],
+            timeframe=timeframe,
+            timestamp__gte=backfill_start,
+            timestamp__lte=end_time
+        ).order_by('asset_id', 'timestamp')
+        grouped = await KlineDataProcessor.group_klines_by_asset(klines_qs)
+
+        backfill = {}
+        for asset in uncached_assets:
+            points = [KlineDataProcessor.encode_series_member(k) for k in grouped.get(asset.pk, [])]
+            backfill[asset.cmc_id] = points
+            series[asset.cmc_id] = [member for _, member in points]
+
+        # 读取缓存失败时没有版本号，无法判断回填期间是否有新的追加，不写回缓存
+        if versions is not None:
+            try:
+                await service.cmc_redis.replace_kline_series(backfill, timeframe, versions)
+            except Exception as e:
+                logger.error(f"Failed to backfill kline series for {len(backfill)} assets: {e}", exc_info=True)
+
+    results = {}
+    missing_ids = []
+    for asset in assets:
+        kline_data = KlineDataProcessor.decode_series(series[asset.cmc_id], start_time, end_time, start_time_24h)
+        if not kline_data['klines']:
+            missing_ids.append(str(asset.cmc_id))
+        results[asset.cmc_id] = kline_data
+
+    if missing_ids and queue_missing:
+        try:
+            await service.cmc_redis.sadd(CMC_KLINES_REFILL_PENDING_KEY, *missing_ids)
+            logger.info(f"Queued {len(missing_ids)} assets without {timeframe} klines for background refill")
+        except Exception as e:
+            logger.error(f"Failed to queue klines refill for {len(missing_ids)} assets: {e}", exc_info=True)
+
+    return results
+
+
+# 市场数据SWR计数器先在进程内累加，每 CMC_MARKET_DATA_STATS_FLUSH_INTERVAL 秒合并写入一次Redis，
+# 避免每个请求一次 HINCRBY 往返；进程退出时未写入的少量计数会丢失
+_market_data_stats = Counter()
+_market_data_stats_lock = threading.Lock()
+_market_data_stats_flushed_at = 0.0
+
+
+async def _record_market_data_stat(service: "CoinMarketCapService", field: str) -> None:
+    global _market_data_stats_flushed_at
+    with _market_data_stats_lock:
+        _market_data_stats[field] += 1
+        now = time.monotonic()
+        if now - _market_data_stats_flushed_at < CMC_MARKET_DATA_STATS_FLUSH_INTERVAL:
+            return
+        _market_data_stats_flushed_at = now
+        counts = dict(_market_data_stats)
+        _market_data_stats.clear()
+    if not await service.cmc_redis.incr_market_data_stats(counts):
+        # 写入失败时放回进程内，下次再试
+        with _market_data_stats_lock:
+            _market_data_stats.update(counts)
+
+
+def _is_fresh_quote(api_data: Optional[Dict[str, Any]]) -> bool:
+    """报价数据的 last_updated 是否仍在 CMC_MARKET_DATA_TTL 之内"""
+    if not api_data:
+        return False
+    last_updated = CmcMarketData.objects.parse_last_updated(api_data)
+    return last_updated is not None and (timezone.now() - last_updated).total_seconds() <= CMC_MARKET_DATA_TTL
+
+
+async def _write_through_market_data(api_data: Dict[str, Any]) -> None:
+    """将刷新得到的报价写入数据库（Redis已由报价获取流程写入）"""
+    asset, _ = await CmcAsset.objects.update_or_create_from_api_data(api_data)
+    if asset:
+        await CmcMarketData.objects.update_or_create_from_api_data(asset, api_data)
+
+
+async def _clear_market_data_refresh_marker(service: CoinMarketCapService, cmc_id: int) -> None:
+    """刷新未成功时删除去重标记，下一次过期读取可以立即重新安排刷新"""
+    try:
+        await service.cmc_redis.delete(CMC_MARKET_DATA_REFRESH_KEY % {"cmc_id": cmc_id})
+    except Exception as e:
+        logger.error(f"Failed to clear market data refresh marker for cmc_id {cmc_id}: {e}")
+
+
+async def refresh_market_data(cmc_id: int) -> bool:
+    """
+    刷新单个代币的市场数据（由 refresh_cmc_market_data Celery 任务执行）：
+    Redis中的报价仍新鲜时直接使用，否则经请求合并器调用CMC API，再写入数据库。
+    刷新失败或被取消时删除去重标记；成功时标记保留到冷却期结束。
+
+    Returns:
+        是否刷新成功
+    """
+    service = await get_cmc_service(client_type="external")
+    refreshed = False
+    try:
+        data = await service.cmc_redis.get_token_quote_data(str(cmc_id))
+        if not _is_fresh_quote(data):
+            data = await service.initiate_batch_request_processing(cmc_id)
+        if data:
+            await _write_through_market_data(data)
+            refreshed = True
+            logger.info(f"Refreshed stale CMC market data for cmc_id {cmc_id}")
+    except Exception as e:
+        logger.error(f"Error refreshing market data for cmc_id {cmc_id}: {e}", exc_info=True)
+    finally:
+        if not refreshed:
+            await _clear_market_data_refresh_marker(service, cmc_id)
+        await service.cmc_redis.incr_market_data_stats({'refreshes' if refreshed else 'refresh_failed': 1})
+    return refreshed
+
+
+async def _schedule_market_data_refresh(service: CoinMarketCapService, cmc_id: int) -> bool:
+    """
+    为过期的市场数据投递一次后台刷新（Celery任务，不依赖请求所在的事件循环存活）。
+    跨进程通过 Redis NX 标记去重，刷新成功后标记在冷却期内保留，CMC 本身更新较慢的代币不会被反复刷新。
+
+    Returns:
+        是否投递了新的刷新任务
+    """
+    from apps.cmc_proxy.tasks import refresh_cmc_market_data
+
+    marker_key = CMC_MARKET_DATA_REFRESH_KEY % {"cmc_id": cmc_id}
+    try:
+        if not await service.cmc_redis.set(marker_key, "1", ex=CMC_MARKET_DATA_REFRESH_COOLDOWN, nx=True):
+            return False
+    except Exception as e:
+        # Redis 不可用时无法跨进程去重，跳过本次刷新，调用方照常返回旧数据
+        logger.error(f"Failed to set market data refresh marker for cmc_id {cmc_id}, skipping refresh: {e}")
+        return False
+
+    try:
+        await sync_to_async(refresh_cmc_market_data.delay)(cmc_id)
+    except Exception as e:
+        logger.error(f"Failed to enqueue market data refresh for cmc_id {cmc_id}: {e}")
+        await _clear_market_data_refresh_marker(service, cmc_id)
+        return False
+    return True
 
 
 async def get_latest_market_data(cmc_id: int) -> Optional[Dict[str, Any]]:
     """
-    获取单个代币的最新市场数据（混合数据源）。
-    - CMC数据：从数据库获取（10分钟缓存，节省credit）
+    获取单个代币的最新市场数据（混合数据源，stale-while-revalidate）。
+    - CMC数据：从数据库获取，过期时先返回旧数据，再由去重的后台任务刷新Redis与数据库
     - 价格数据：实时CCXT价格（无缓存，保证时效性）
     """
     logger.info(f"get_latest_market_data called for cmc_id: {cmc_id}")
 
+    # 外部请求使用专用Key
+    service = await get_cmc_service(client_type="external")
+
     try:
         # 1. 获取CMC基础数据（可以缓存10分钟）
         market_data = await CmcMarketData.objects.select_related('asset').aget(asset__cmc_id=cmc_id)
@@ -617,22 +907,27 @@ async def get_latest_market_data(cmc_id: int) -> Optional[Dict[str, Any]]:
         # - 基础数据(市值、排名等): 10分钟过期
         # - 价格数据回退: 10分钟过期（平衡成本与时效性）
         if age > CMC_MARKET_DATA_TTL:  # 使用配置的市场数据TTL，平衡CMC credit消耗与数据新鲜度
-            logger.info(f"CMC market data for cmc_id {cmc_id} is stale (age: {age}s), initiating async refresh")
-            # 外部请求使用专用Key
-            service = await get_cmc_service(client_type="external")
-            asyncio.create_task(service.get_token_market_data(cmc_id))
+            await _record_market_data_stat(service, 'stale_hits')
+            if await _schedule_market_data_refresh(service, cmc_id):
+                logger.info(f"CMC market data for cmc_id {cmc_id} is stale (age: {age}s), scheduled background refresh")
+        else:
+            await _record_market_data_stat(service, 'hits')
 
         # 3. 返回混合数据（CMC基础数据 + 实时CCXT价格）
-        return MarketDataFormatter.format_market_data_from_db(market_data)
+        ccxt_prices = await MarketDataFormatter.get_ccxt_prices_for_cmc_assets([market_data.asset])
+        return MarketDataFormatter.format_market_data_from_db(market_data, ccxt_prices)
 
     except CmcMarketData.DoesNotExist:
-        # 4. 数据库没有数据，从CMC获取
+        # 4. 数据库没有数据，从CMC获取并写入数据库，后续请求直接命中
         logger.info(f"Market data for cmc_id {cmc_id} not found in database, fetching from CMC")
-        # 外部请求使用专用Key
-        service = await get_cmc_service(client_type="external")
+        await _record_market_data_stat(service, 'misses')
         data = await service.get_token_market_data(cmc_id)
 
         if data:
+            try:
+                await _write_through_market_data(data)
+            except Exception as e:
+                logger.error(f"Failed to write market data for cmc_id {cmc_id} to database: {e}", exc_info=True)
             return MarketDataFormatter.format_market_data_from_api(data)
         else:
             return None
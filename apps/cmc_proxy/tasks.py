@@ -2,13 +2,13 @@ import asyncio
 import json
 
 from celery import shared_task
-from django.conf import settings
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 from django_celery_beat.models import PeriodicTask
 
-from apps.cmc_proxy import consts
+from apps.cmc_proxy import consts, services
 from apps.cmc_proxy.models import CmcAsset, CmcKline, CmcMarketData
-from apps.cmc_proxy.services import CoinMarketCapClient, get_cmc_service
-from apps.cmc_proxy.utils import CMCRedisClient, acquire_lock, release_lock
+from apps.cmc_proxy.services import close_cmc_services, get_cmc_service
+from apps.cmc_proxy.utils import CMCRedisClient, CMCBudgetExceeded, acquire_lock, release_lock
 from common.helpers import getLogger
 
 logger = getLogger(__name__)
@@ -52,16 +52,63 @@ async def _get_top_market_cap_ids_from_db(count: int, exclude_ids: list = None)
         return []
 
 
-def _run_async_with_new_loop(coro):
-    """创建新的事件循环并运行异步协程的辅助函数"""
-    loop = None
+# 每个worker进程持有一个常驻事件循环，任务之间复用其上的Redis连接池和HTTP会话（TLS）。
+# prefork/solo 池中同一进程一次只执行一个任务，因此可以安全地在任务线程中 run_until_complete。
+_worker_loop = None
+
+
+def _get_worker_loop():
+    """获取当前worker进程的常驻事件循环，不存在或已关闭时创建"""
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        replaced = _worker_loop is not None
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+        if replaced and services._service_instances:
+            # 旧循环已被外部关闭，其上缓存的服务实例不会再被复用，在新循环上尽力关闭后清空
+            logger.warning("Worker event loop was closed externally, closing CMC services bound to it")
+            try:
+                _worker_loop.run_until_complete(close_cmc_services())
+            except Exception as e:
+                logger.warning(f"Error closing CMC services bound to the closed worker loop: {e}")
+    return _worker_loop
+
+
+def _run_async_in_worker_loop(coro):
+    """在worker进程的常驻事件循环中运行异步协程"""
+    return _get_worker_loop().run_until_complete(coro)
+
+
+async def _get_shared_cmc_redis() -> CMCRedisClient:
+    """获取当前事件循环上共享的CMC Redis客户端，由服务实例持有，任务结束时不关闭"""
+    service = await get_cmc_service(client_type="klines")
+    return service.cmc_redis
+
+
+@worker_process_init.connect
+def _reset_worker_loop(**kwargs):
+    """prefork 子进程启动时丢弃从父进程继承的事件循环和连接"""
+    global _worker_loop
+    _worker_loop = None
+    services._service_instances.clear()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _close_worker_loop(**kwargs):
+    """worker进程退出时关闭共享客户端和常驻事件循环"""
+    global _worker_loop
+    loop = _worker_loop
+    _worker_loop = None
+    if loop is None or loop.is_closed():
+        return
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(coro)
+        loop.run_until_complete(close_cmc_services())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    except Exception as e:
+        logger.warning(f"Error closing CMC clients on worker shutdown: {e}")
     finally:
-        if loop and not loop.is_closed():
-            loop.close()
+        loop.close()
 
 
 async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
@@ -73,7 +120,7 @@ async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
     batch_lock_acquired = False
 
     try:
-        cmc_redis = await CMCRedisClient.create(settings.REDIS_CMC_URL)
+        cmc_redis = await _get_shared_cmc_redis()
 
         # 尝试获取任务级别锁（防止同一定时任务的多个实例）
         task_lock_acquired = await acquire_lock(cmc_redis, task_lock_key, timeout=5)
@@ -111,6 +158,7 @@ async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
 
         # 去重
         unique_ids = list(set(pending_ids))
+        requested_ids = list(unique_ids)
         logger.info(f"Got {len(unique_ids)} unique IDs from pending requests")
 
         # 只有在有实际待处理请求时才从数据库获取热门ID补充，避免无限重复请求
@@ -131,11 +179,12 @@ async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
             return
 
         # 这个任务服务外部用户请求，使用外部专用Key
-        client = CoinMarketCapClient(client_type="external")
+        client = (await get_cmc_service(client_type="external")).client
         try:
             response_data = await client.get_quotes_latest(ids=unique_ids)
             quotes_data = response_data.get('data', {})
 
+            tokens_to_cache = {}
             for cmc_id_str, token_data in quotes_data.items():
                 cmc_id = token_data.get('id')
                 if not cmc_id:
@@ -147,10 +196,17 @@ async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
                     logger.warning(f"Token data missing symbol for id: {cmc_id}")
                     continue
 
-                await cmc_redis.cache_token_quote_data(str(cmc_id), token_data, consts.CMC_TTL_WARM_COLD)
+                tokens_to_cache[str(cmc_id)] = token_data
+
+            await cmc_redis.cache_token_quote_data_many(tokens_to_cache, consts.CMC_TTL_WARM_COLD)
 
             logger.info(f"Successfully processed {len(quotes_data)} tokens in this batch")
 
+        except CMCBudgetExceeded as e:
+            # 预算不足，把用户请求的ID放回队列等待下一轮，补充的热门ID直接丢弃
+            logger.warning(f"Deferring {len(requested_ids)} pending quote requests: {e}")
+            if requested_ids:
+                await cmc_redis.rpush(consts.CMC_BATCH_REQUESTS_PENDING_KEY, *requested_ids)
         except Exception as e:
             logger.error(f"Error fetching quotes from CMC API: {e}", exc_info=True)
 
@@ -161,8 +217,6 @@ async def _process_pending_cmc_batch_requests_with_lock(task_lock_key):
             await release_lock(cmc_redis, task_lock_key)
         if batch_lock_acquired and cmc_redis:
             await release_lock(cmc_redis, consts.CMC_BATCH_PROCESSING_LOCK_KEY)
-        if cmc_redis:
-            await cmc_redis.aclose()
 
 
 async def _daily_full_data_sync_with_lock():
@@ -172,7 +226,7 @@ async def _daily_full_data_sync_with_lock():
     lock_acquired = False
 
     try:
-        cmc_redis = await CMCRedisClient.create(settings.REDIS_CMC_URL)
+        cmc_redis = await _get_shared_cmc_redis()
 
         # 尝试获取任务锁
         lock_acquired = await acquire_lock(cmc_redis, task_lock_key, timeout=10)
@@ -188,8 +242,6 @@ async def _daily_full_data_sync_with_lock():
     finally:
         if lock_acquired and cmc_redis:
             await release_lock(cmc_redis, task_lock_key)
-        if cmc_redis:
-            await cmc_redis.aclose()
 
 
 async def _daily_full_data_sync_implementation(cmc_redis):
@@ -208,7 +260,7 @@ async def _daily_full_data_sync_implementation(cmc_redis):
         logger.warning("Batch request task not found, continuing without disabling")
 
     # 系统维护任务，使用K线任务专用Key
-    client = CoinMarketCapClient(client_type="klines")
+    client = (await get_cmc_service(client_type="klines")).client
     try:
         page_size = 5000
         start = 1
@@ -225,6 +277,8 @@ async def _daily_full_data_sync_implementation(cmc_redis):
                 all_tokens_data.extend(tokens_page)
                 logger.info(f"Fetched {len(tokens_page)} tokens, total so far: {len(all_tokens_data)}")
 
+                # 每页一次 pipeline 往返写入缓存
+                tokens_to_cache = {}
                 for token_item in tokens_page:
                     cmc_id = token_item.get('id')
                     symbol = token_item.get('symbol')
@@ -232,7 +286,9 @@ async def _daily_full_data_sync_implementation(cmc_redis):
                         logger.warning(f"Token item missing id or symbol: {token_item.get('slug')}")
                         continue
 
-                    await cmc_redis.cache_token_quote_data(str(cmc_id), token_item, consts.CMC_TTL_BASE)
+                    tokens_to_cache[str(cmc_id)] = token_item
+
+                await cmc_redis.cache_token_quote_data_many(tokens_to_cache, consts.CMC_TTL_BASE)
 
                 if len(tokens_page) < page_size:
                     break
@@ -240,6 +296,9 @@ async def _daily_full_data_sync_implementation(cmc_redis):
                 start += page_size
                 await asyncio.sleep(1)
 
+            except CMCBudgetExceeded as e:
+                logger.warning(f"Daily sync deferred remaining pages from start={start}: {e}")
+                break
             except Exception as e:
                 logger.error(f"Error fetching a page during daily sync: {e}", exc_info=True)
                 break
@@ -307,7 +366,7 @@ async def _process_cmc_klines_with_lock(task_lock_key, count: int, only_missing:
     lock_acquired = False
 
     try:
-        cmc_redis = await CMCRedisClient.create(settings.REDIS_CMC_URL)
+        cmc_redis = await _get_shared_cmc_redis()
 
         # 尝试获取任务锁
         lock_acquired = await acquire_lock(cmc_redis, task_lock_key, timeout=10)
@@ -323,8 +382,42 @@ async def _process_cmc_klines_with_lock(task_lock_key, count: int, only_missing:
     finally:
         if lock_acquired and cmc_redis:
             await release_lock(cmc_redis, task_lock_key)
-        if cmc_redis:
-            await cmc_redis.aclose()
+
+
+async def _refill_missing_klines_with_lock(task_lock_key):
+    """带锁的K线补齐函数，处理列表接口中缺失K线的资产"""
+    cmc_redis = None
+    lock_acquired = False
+
+    try:
+        cmc_redis = await _get_shared_cmc_redis()
+
+        lock_acquired = await acquire_lock(cmc_redis, task_lock_key, timeout=60)
+        if not lock_acquired:
+            logger.info("Refill klines task lock not acquired, another instance is running")
+            return 0
+
+        pending_ids = await cmc_redis.spop(consts.CMC_KLINES_REFILL_PENDING_KEY, consts.CMC_KLINES_REFILL_BATCH_SIZE)
+        if not pending_ids:
+            return 0
+
+        cmc_ids = [int(_id) for _id in pending_ids if str(_id).isdigit()]
+        logger.info(f"Refilling klines for {len(cmc_ids)} assets from the pending set")
+
+        # 补齐请求来源于外部用户的列表查询，使用外部专用Key
+        service = await get_cmc_service(client_type="external")
+        result = await service.fetch_and_store_klines_batch(cmc_ids, count=24, batch_size=len(cmc_ids))
+        if result['deferred_ids']:
+            # 预算不足推迟的资产放回补齐队列
+            await cmc_redis.sadd(consts.CMC_KLINES_REFILL_PENDING_KEY, *map(str, result['deferred_ids']))
+        return result['total_klines']
+
+    except Exception as e:
+        logger.error(f"Error in _refill_missing_klines_with_lock: {e}", exc_info=True)
+        return 0
+    finally:
+        if lock_acquired and cmc_redis:
+            await release_lock(cmc_redis, task_lock_key)
 
 
 async def _sync_cmc_data_with_lock():
@@ -334,7 +427,7 @@ async def _sync_cmc_data_with_lock():
     lock_acquired = False
 
     try:
-        cmc_redis = await CMCRedisClient.create(settings.REDIS_CMC_URL)
+        cmc_redis = await _get_shared_cmc_redis()
 
         # 尝试获取任务锁
         lock_acquired = await acquire_lock(cmc_redis, task_lock_key, timeout=5)
@@ -350,72 +443,116 @@ async def _sync_cmc_data_with_lock():
     finally:
         if lock_acquired and cmc_redis:
             await release_lock(cmc_redis, task_lock_key)
-        if cmc_redis:
-            await cmc_redis.aclose()
 
 
 async def _sync_data_from_redis_implementation(cmc_redis):
-    """直接实现数据同步逻辑，避免 asyncio.run() 冲突"""
-    from apps.cmc_proxy.consts import CMC_QUOTE_DATA_KEY
-
-    # 使用 scan_iter 高效地遍历所有代币数据的键
-    pattern = CMC_QUOTE_DATA_KEY.replace("%(symbol_id)s", "*")
-    keys = [key async for key in cmc_redis.scan_iter(match=pattern)]
+    """
+    将Redis中的CMC报价缓存同步到数据库。
+    按 CMC_SYNC_CHUNK_SIZE 分块流式扫描键，每块一次 MGET 读取、两条批量 upsert 写入，
+    last_updated 与数据库一致的代币直接跳过。
 
-    if not keys:
+    Returns:
+        同步统计信息字典
+    """
+    pattern = consts.CMC_QUOTE_DATA_KEY.replace("%(symbol_id)s", "*")
+    stats = {'total': 0, 'assets_created': 0, 'assets_updated': 0, 'market_data_updated': 0,
+             'unchanged': 0, 'failed': 0}
+
+    chunk = []
+    async for key in cmc_redis.scan_iter(match=pattern, count=consts.CMC_SYNC_CHUNK_SIZE):
+        chunk.append(key)
+        if len(chunk) >= consts.CMC_SYNC_CHUNK_SIZE:
+            await _sync_quote_chunk(cmc_redis, chunk, stats)
+            chunk = []
+    if chunk:
+        await _sync_quote_chunk(cmc_redis, chunk, stats)
+
+    if not stats['total']:
         logger.warning("No CMC data keys found in Redis to sync.")
-        return
-
-    logger.info(f"Found {len(keys)} CMC data keys in Redis.")
+        return stats
 
-    assets_created_count = 0
-    assets_updated_count = 0
-    market_data_updated_count = 0
-    failed_count = 0
-    total_count = len(keys)
+    logger.info(f'Successfully synchronized CMC data. '
+                f'Total Processed: {stats["total"]}, '
+                f'Assets Created: {stats["assets_created"]}, '
+                f'Assets Updated: {stats["assets_updated"]}, '
+                f'Market Data Touched: {stats["market_data_updated"]}, '
+                f'Unchanged: {stats["unchanged"]}, '
+                f'Failed: {stats["failed"]}')
+    return stats
+
+
+async def _sync_quote_chunk(cmc_redis, keys, stats):
+    """同步一块报价缓存键"""
+    stats['total'] += len(keys)
+    try:
+        raw_values = await cmc_redis.mget(keys)
+    except Exception as e:
+        logger.error(f"Error reading {len(keys)} CMC data keys from Redis: {e}", exc_info=True)
+        stats['failed'] += len(keys)
+        return
 
-    for key in keys:
+    api_data_map = {}
+    for key, raw_data in zip(keys, raw_values):
+        if not raw_data:
+            stats['failed'] += 1
+            continue
         try:
-            raw_data = await cmc_redis.get(key)
-            if not raw_data:
-                failed_count += 1
-                continue
-
             api_data = json.loads(raw_data)
-            cmc_id = api_data.get('id')
-            if not cmc_id:
-                logger.warning(f"Skipping key {key} due to missing 'id' field.")
-                failed_count += 1
-                continue
+        except json.JSONDecodeError:
+            logger.error(f"Failed to decode JSON from key {key}.")
+            stats['failed'] += 1
+            continue
 
-            # 1. 同步 CmcAsset (资产元数据)
-            asset, created = await CmcAsset.objects.update_or_create_from_api_data(api_data)
-            if not asset:
-                failed_count += 1
-                continue
+        cmc_id = api_data.get('id')
+        if not cmc_id:
+            logger.warning(f"Skipping key {key} due to missing 'id' field.")
+            stats['failed'] += 1
+            continue
+        api_data_map[cmc_id] = api_data
 
-            if created:
-                assets_created_count += 1
-            else:
-                assets_updated_count += 1
+    if not api_data_map:
+        return
 
-            # 2. 同步 CmcMarketData (最新行情)
-            await CmcMarketData.objects.update_or_create_from_api_data(asset, api_data)
-            market_data_updated_count += 1
+    try:
+        existing_assets = {
+            asset.cmc_id: asset
+            async for asset in CmcAsset.objects.filter(cmc_id__in=list(api_data_map)).select_related('market_data')
+        }
+
+        # 跳过自上次同步以来 last_updated 没有变化的代币
+        changed = []
+        for cmc_id, api_data in api_data_map.items():
+            asset = existing_assets.get(cmc_id)
+            market_data = getattr(asset, 'market_data', None) if asset else None
+            last_updated = CmcMarketData.objects.parse_last_updated(api_data)
+            if market_data is not None and last_updated is not None and market_data.timestamp == last_updated:
+                stats['unchanged'] += 1
+                continue
+            changed.append(api_data)
 
-        except json.JSONDecodeError:
-            logger.error(f"Failed to decode JSON from key {key}.")
-            failed_count += 1
-        except Exception as e:
-            logger.error(f"Error processing data for key {key}: {e}", exc_info=True)
-            failed_count += 1
+        if not changed:
+            return
 
-    logger.info(f'Successfully synchronized CMC data. '
-                f'Total Processed: {total_count}, '
-                f'Assets Created: {assets_created_count}, '
-                f'Assets Updated: {assets_updated_count}, '
-                f'Market Data Touched: {market_data_updated_count}, '
-                f'Failed: {failed_count}')
+        # 1. 同步 CmcAsset (资产元数据)
+        assets, created_count, updated_count = await CmcAsset.objects.bulk_upsert_from_api_data(
+            changed, existing_assets
+        )
+        stats['assets_created'] += created_count
+        stats['assets_updated'] += updated_count
+        stats['failed'] += len(changed) - len(assets)
+
+        # 2. 同步 CmcMarketData (最新行情)
+        existing_market_data = {
+            asset.pk: asset.market_data
+            for asset in existing_assets.values() if getattr(asset, 'market_data', None) is not None
+        }
+        stats['market_data_updated'] += await CmcMarketData.objects.bulk_upsert_from_api_data(
+            [(asset, api_data_map[cmc_id]) for cmc_id, asset in assets.items()],
+            existing_market_data,
+        )
+    except Exception as e:
+        logger.error(f"Error syncing chunk of {len(api_data_map)} CMC tokens: {e}", exc_info=True)
+        stats['failed'] += len(api_data_map)
 
 
 # Celery任务包装器
@@ -423,30 +560,43 @@ async def _sync_data_from_redis_implementation(cmc_redis):
 def process_pending_cmc_batch_requests(self):
     """处理待处理的CoinMarketCap批量请求 (Celery任务)"""
     task_lock_key = f"cmc:lock:batch_processing_task"
-    return _run_async_with_new_loop(_process_pending_cmc_batch_requests_with_lock(task_lock_key))
+    return _run_async_in_worker_loop(_process_pending_cmc_batch_requests_with_lock(task_lock_key))
 
 
 @shared_task(bind=True)
 def daily_full_data_sync(self):
     """每日全量同步 CoinMarketCap 数据 (Celery任务)"""
-    return _run_async_with_new_loop(_daily_full_data_sync_with_lock())
+    return _run_async_in_worker_loop(_daily_full_data_sync_with_lock())
 
 
 @shared_task(bind=True)
 def update_cmc_klines(self, count=1, only_missing=False):
     """更新CMC K线数据 (Celery任务) - 增量更新"""
     task_lock_key = "cmc:lock:update_klines_task"
-    return _run_async_with_new_loop(_process_cmc_klines_with_lock(task_lock_key, count, only_missing))
+    return _run_async_in_worker_loop(_process_cmc_klines_with_lock(task_lock_key, count, only_missing))
 
 
 @shared_task(bind=True)
 def initialize_missing_klines(self, count=24, only_missing=True):
     """初始化缺失的K线数据 (Celery任务) - 专门处理缺失数据"""
     task_lock_key = "cmc:lock:initialize_missing_klines_task"
-    return _run_async_with_new_loop(_process_cmc_klines_with_lock(task_lock_key, count, only_missing))
+    return _run_async_in_worker_loop(_process_cmc_klines_with_lock(task_lock_key, count, only_missing))
+
+
+@shared_task(bind=True)
+def refill_missing_klines(self):
+    """补齐列表接口中缺失K线的资产 (Celery任务)"""
+    task_lock_key = "cmc:lock:refill_missing_klines_task"
+    return _run_async_in_worker_loop(_refill_missing_klines_with_lock(task_lock_key))
+
+
+@shared_task(bind=True)
+def refresh_cmc_market_data(self, cmc_id):
+    """后台刷新单个过期代币的市场数据 (Celery任务)，由 get_latest_market_data 按 cmc_id 去重后投递"""
+    return _run_async_in_worker_loop(services.refresh_market_data(cmc_id))
 
 
 @shared_task(bind=True)
 def sync_cmc_data_task(self):
     """同步CMC数据到数据库 (Celery任务)"""
-    return _run_async_with_new_loop(_sync_cmc_data_with_lock())
+    return _run_async_in_worker_loop(_sync_cmc_data_with_lock())
@@ -1,15 +1,80 @@
+import asyncio
 import json
-from typing import Optional, List, Dict, Any
+import math
+import time
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Tuple
 
 import redis.asyncio as aioredis
 
-from apps.cmc_proxy.consts import CMC_QUOTE_DATA_KEY, CMC_SUPPLEMENT_POOL_KEY
+from apps.cmc_proxy.consts import CMC_QUOTE_DATA_KEY, CMC_SUPPLEMENT_POOL_KEY, CMC_KLINE_SERIES_KEY, \
+    CMC_KLINE_SERIES_VERSION_KEY, \
+    CMC_KLINE_SERIES_MAX_POINTS, CMC_KLINE_SERIES_TTL, CMC_CREDIT_BUCKETS, CMC_CREDIT_BUCKET_KEY, \
+    CMC_CREDIT_BUCKET_TTL, CMC_CREDIT_PRIORITY_RESERVE, CMC_CREDIT_PRIORITY_MAX_WAIT, CMC_MARKET_DATA_STATS_KEY
 from common.helpers import getLogger
 from common.redis_client import get_async_redis_client
 
 logger = getLogger(__name__)
 
 
+# 先递增序列版本号，使写入前读取数据库的回填失效；仅在序列已存在时追加K线（不存在说明尚未从数据库回填，
+# 追加会得到不完整的序列）。同一时间戳的旧数据点先删除再写入，最后按数量裁剪。
+# 不刷新序列的过期时间，序列至少每 CMC_KLINE_SERIES_TTL 秒从数据库重建一次。
+# KEYS: 序列, 版本号; ARGV: 最大点数, 版本号过期时间, (时间戳, 数据点)...
+APPEND_KLINE_SERIES_SCRIPT = """
+redis.call("incr", KEYS[2])
+redis.call("expire", KEYS[2], ARGV[2])
+if redis.call("exists", KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call("zremrangebyscore", KEYS[1], ARGV[i], ARGV[i])
+    redis.call("zadd", KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call("zremrangebyrank", KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+return 1
+"""
+
+# 用数据库回填的数据覆盖序列，仅当版本号与读取数据库前一致（期间没有新的追加）时生效，
+# 避免较旧的回填覆盖掉更新的写入。KEYS: 序列, 版本号; ARGV: 读取时的版本号, 最大点数, 过期时间, (时间戳, 数据点)...
+REPLACE_KLINE_SERIES_SCRIPT = """
+if (redis.call("get", KEYS[2]) or "") ~= ARGV[1] then
+    return 0
+end
+redis.call("del", KEYS[1])
+for i = 4, #ARGV, 2 do
+    redis.call("zadd", KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call("zremrangebyrank", KEYS[1], 0, -tonumber(ARGV[2]) - 1)
+redis.call("expire", KEYS[1], ARGV[3])
+return 1
+"""
+
+# 令牌桶：先按经过的时间恢复credit，剩余量不低于 threshold 时扣除 cost（允许扣成负数，即透支由后续请求顺延），
+# 否则返回还需等待的秒数。浮点数以字符串返回，避免被Redis截断为整数
+CREDIT_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local threshold = tonumber(ARGV[4])
+local now = tonumber(ARGV[5])
+local state = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = 0
+local wait = 0
+if tokens >= threshold then
+    tokens = tokens - cost
+    granted = 1
+else
+    wait = (threshold - tokens) / rate
+end
+redis.call("hset", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now), "label", ARGV[6])
+redis.call("expire", KEYS[1], ARGV[7])
+return {granted, tostring(tokens), tostring(wait)}
+"""
+
+
 class CMCRedisClient(aioredis.Redis):
     """CoinMarketCap专用Redis客户端，处理代币数据缓存和检索"""
 
@@ -31,6 +96,29 @@ class CMCRedisClient(aioredis.Redis):
         except Exception as e:
             logger.error(f"Failed to cache token quote data for {symbol_id}: {e}", exc_info=True)
 
+    async def cache_token_quote_data_many(self, tokens_data: Dict[str, Dict[str, Any]], ttl: int) -> int:
+        """通过一次pipeline往返批量缓存代币报价数据
+
+        Args:
+            tokens_data: {symbol_id: token_data}
+            ttl: 缓存过期时间（秒）
+
+        Returns:
+            写入的键数量
+        """
+        if not tokens_data:
+            return 0
+
+        try:
+            pipe = self.pipeline(transaction=False)
+            for symbol_id, data in tokens_data.items():
+                pipe.set(CMC_QUOTE_DATA_KEY % {"symbol_id": symbol_id}, json.dumps(data), ex=ttl)
+            await pipe.execute()
+            return len(tokens_data)
+        except Exception as e:
+            logger.error(f"Failed to cache quote data for {len(tokens_data)} tokens: {e}", exc_info=True)
+            return 0
+
     async def get_token_quote_data(self, symbol_id: str) -> Optional[Dict[str, Any]]:
         """获取缓存的代币报价数据"""
         if not symbol_id:
@@ -50,7 +138,7 @@ class CMCRedisClient(aioredis.Redis):
             return None
 
     async def update_supplement_pool(self, tokens_data_list: List[Dict[str, Any]]) -> None:
-        """更新补充池"""
+        """更新补充池：写入临时键后 RENAME 原子替换，读取方不会看到空的补充池"""
         if not tokens_data_list:
             return
 
@@ -66,20 +154,98 @@ class CMCRedisClient(aioredis.Redis):
                 except (TypeError, ValueError) as e:
                     logger.error(f"Error processing token data for supplement pool: {e}")
 
-            # 清空现有的补充池
-            await self.delete(CMC_SUPPLEMENT_POOL_KEY)
+            if not token_ids_with_market_cap:
+                await self.delete(CMC_SUPPLEMENT_POOL_KEY)
+                return
 
-            # 添加新的数据
-            if token_ids_with_market_cap:
-                # 按市值降序排序
-                token_ids_with_market_cap.sort(key=lambda x: x[1], reverse=True)
+            # 按市值降序排序，使用负索引作为分数，确保排序
+            token_ids_with_market_cap.sort(key=lambda x: x[1], reverse=True)
+            members = {token_id: -i for i, (token_id, _) in enumerate(token_ids_with_market_cap)}
 
-                # 添加到有序集合
-                for i, (token_id, market_cap) in enumerate(token_ids_with_market_cap):
-                    await self.zadd(CMC_SUPPLEMENT_POOL_KEY, {token_id: -i})  # 使用负索引作为分数，确保排序
+            tmp_key = f"{CMC_SUPPLEMENT_POOL_KEY}:tmp"
+            pipe = self.pipeline(transaction=True)
+            pipe.delete(tmp_key)
+            pipe.zadd(tmp_key, members)
+            pipe.rename(tmp_key, CMC_SUPPLEMENT_POOL_KEY)
+            await pipe.execute()
         except Exception as e:
             logger.error(f"Failed to update supplement pool: {e}", exc_info=True)
 
+    async def get_kline_series_many(self, cmc_ids: List[int], timeframe: str, start_ts: float,
+                                    end_ts: float) -> Tuple[Dict[int, Optional[List[str]]], Dict[int, str]]:
+        """
+        一次往返批量读取多个资产在时间范围内的K线序列缓存及其版本号。
+
+        Returns:
+            ({cmc_id: [member, ...]}, {cmc_id: 版本号})，序列不存在时值为None；
+            版本号用于 replace_kline_series 判断回填期间是否有新的追加
+        """
+        pipe = self.pipeline(transaction=False)
+        for cmc_id in cmc_ids:
+            key = CMC_KLINE_SERIES_KEY % {"cmc_id": cmc_id, "timeframe": timeframe}
+            pipe.exists(key)
+            pipe.zrangebyscore(key, start_ts, end_ts)
+            pipe.get(CMC_KLINE_SERIES_VERSION_KEY % {"cmc_id": cmc_id, "timeframe": timeframe})
+        results = await pipe.execute()
+
+        series, versions = {}, {}
+        for i, cmc_id in enumerate(cmc_ids):
+            exists, members, version = results[3 * i:3 * i + 3]
+            series[cmc_id] = members if exists else None
+            versions[cmc_id] = version or ""
+        return series, versions
+
+    async def replace_kline_series(self, series: Dict[int, List[Tuple[int, str]]], timeframe: str,
+                                   versions: Dict[int, str]) -> None:
+        """用数据库回填的完整数据覆盖K线序列缓存；读取后版本号已变化（有新的追加）的资产跳过，下次读取时重新回填"""
+        pipe = self.pipeline(transaction=False)
+        for cmc_id, points in series.items():
+            if not points:
+                continue
+            params = {"cmc_id": cmc_id, "timeframe": timeframe}
+            args = [versions.get(cmc_id, ""), CMC_KLINE_SERIES_MAX_POINTS, CMC_KLINE_SERIES_TTL]
+            for epoch, member in points:
+                args.extend((epoch, member))
+            pipe.eval(REPLACE_KLINE_SERIES_SCRIPT, 2, CMC_KLINE_SERIES_KEY % params,
+                      CMC_KLINE_SERIES_VERSION_KEY % params, *args)
+        await pipe.execute()
+
+    async def append_kline_series(self, series: Dict[int, List[Tuple[int, str]]], timeframe: str) -> None:
+        """将新写入数据库的K线追加到已存在的序列缓存；追加失败时删除相关序列，下次读取从数据库重建"""
+        keys = []
+        try:
+            pipe = self.pipeline(transaction=False)
+            for cmc_id, points in series.items():
+                if not points:
+                    continue
+                params = {"cmc_id": cmc_id, "timeframe": timeframe}
+                keys.append(CMC_KLINE_SERIES_KEY % params)
+                args = [CMC_KLINE_SERIES_MAX_POINTS, CMC_KLINE_SERIES_TTL]
+                for epoch, member in points:
+                    args.extend((epoch, member))
+                pipe.eval(APPEND_KLINE_SERIES_SCRIPT, 2, keys[-1], CMC_KLINE_SERIES_VERSION_KEY % params, *args)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to append kline series for {len(series)} assets, invalidating them: {e}",
+                         exc_info=True)
+            try:
+                if keys:
+                    await self.delete(*keys)
+            except Exception as e:
+                logger.error(f"Failed to invalidate kline series for {len(keys)} assets: {e}", exc_info=True)
+
+    async def incr_market_data_stats(self, counts: Dict[str, int]) -> bool:
+        """通过一次pipeline往返累加市场数据SWR缓存的计数器（hits / stale_hits / misses / refreshes / refresh_failed）"""
+        try:
+            pipe = self.pipeline(transaction=False)
+            for field, amount in counts.items():
+                pipe.hincrby(CMC_MARKET_DATA_STATS_KEY, field, amount)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.debug(f"Failed to increment market data stats {counts}: {e}")
+            return False
+
     async def get_from_supplement_pool(self, count: int) -> List[str]:
         """从补充池中获取代币ID"""
         if count <= 0:
@@ -94,6 +260,151 @@ class CMCRedisClient(aioredis.Redis):
             return []
 
 
+class RequestCoalescer:
+    """
+    进程内单飞请求合并器。
+
+    同一事件循环内并发的缓存未命中共享同一个 Future：相同ID只会发起一次上游请求，
+    不同ID会被合并到同一批次。批次达到 batch_size 时立即发送，否则在 flush_delay
+    秒后发送，批次返回后等待方立即被唤醒。
+    """
+
+    def __init__(self, fetch_batch: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+                 batch_size: int, flush_delay: float):
+        self._fetch_batch = fetch_batch
+        self._batch_size = batch_size
+        self._flush_delay = flush_delay
+        self._pending: Dict[str, asyncio.Future] = {}  # 等待发送的请求
+        self._inflight: Dict[str, asyncio.Future] = {}  # 已发送、等待返回的请求
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()  # 持有批次任务的引用，避免被垃圾回收
+        self.loop = asyncio.get_running_loop()
+
+    async def request(self, key: str, timeout: float) -> Optional[Any]:
+        """提交一个请求并等待所在批次返回，超时返回None"""
+        future = self._inflight.get(key) or self._pending.get(key)
+        if future is None:
+            future = self.loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = self.loop.call_later(self._flush_delay, self._flush)
+        else:
+            logger.debug(f"Request for {key} joined an existing batch")
+
+        try:
+            # shield 保证单个等待方超时不会取消其他等待方共享的 Future
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out after {timeout}s waiting for coalesced request {key}")
+            return None
+
+    def _flush(self):
+        """将待发送请求按 batch_size 切分成批次并发送"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            keys = list(self._pending)[:self._batch_size]
+            batch = {key: self._pending.pop(key) for key in keys}
+            self._inflight.update(batch)
+            task = self.loop.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: Dict[str, asyncio.Future]):
+        results = {}
+        try:
+            results = await self._fetch_batch(list(batch)) or {}
+        except Exception as e:
+            logger.error(f"Coalesced batch request for {len(batch)} keys failed: {e}", exc_info=True)
+        finally:
+            for key, future in batch.items():
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+class CMCBudgetExceeded(Exception):
+    """CMC API credit 预算不足，推迟等待后仍未获得额度"""
+
+
+class CMCCreditBudget:
+    """
+    CMC API credit 预算，基于Redis令牌桶在所有进程间共享。
+
+    每个 API Key × 端点类型一个令牌桶。低优先级通道扣除后桶内需保留
+    CMC_CREDIT_PRIORITY_RESERVE 比例的容量留给更高优先级，额度不足时按通道的最长等待时间推迟，
+    仍不足则抛出 CMCBudgetExceeded。Redis不可用时直接放行，不影响用户请求。
+    """
+
+    def __init__(self, redis_getter: Callable[[], Optional[aioredis.Redis]], key_id: str, label: str):
+        self._redis_getter = redis_getter
+        self.key_id = key_id  # API Key 的摘要，共用同一个Key的客户端共享令牌桶
+        self.label = label  # 监控中展示的Key名称
+
+    @staticmethod
+    def estimate_cost(endpoint_class: str, units: int) -> int:
+        """按CMC计费规则估算一次调用消耗的credit"""
+        return max(1, math.ceil(units / CMC_CREDIT_BUCKETS[endpoint_class]['units_per_credit']))
+
+    def _bucket_key(self, endpoint_class: str) -> str:
+        return CMC_CREDIT_BUCKET_KEY % {"key_id": self.key_id, "endpoint_class": endpoint_class}
+
+    async def acquire(self, endpoint_class: str, cost: int, priority: int) -> Optional[float]:
+        """
+        扣除一次调用的credit，额度不足时推迟等待。
+
+        Returns:
+            扣除后桶内剩余的credit，预算不可用时返回None
+        """
+        config = CMC_CREDIT_BUCKETS[endpoint_class]
+        capacity = config['capacity']
+        rate = config['refill_per_minute'] / 60
+        # 单次消耗超过桶容量时只要求满桶，避免大请求永远无法执行
+        threshold = min(cost + capacity * CMC_CREDIT_PRIORITY_RESERVE[priority], capacity)
+        deadline = time.monotonic() + CMC_CREDIT_PRIORITY_MAX_WAIT[priority]
+
+        while True:
+            redis_client = self._redis_getter()
+            if redis_client is None:
+                return None
+            try:
+                granted, remaining, wait = await redis_client.eval(
+                    CREDIT_BUCKET_SCRIPT, 1, self._bucket_key(endpoint_class),
+                    capacity, rate, cost, threshold, time.time(), self.label, CMC_CREDIT_BUCKET_TTL
+                )
+            except Exception as e:
+                logger.warning(f"CMC credit budget unavailable, allowing {endpoint_class} call: {e}")
+                return None
+
+            remaining, wait = float(remaining), float(wait)
+            if int(granted):
+                return remaining
+
+            if wait > deadline - time.monotonic():
+                raise CMCBudgetExceeded(
+                    f"CMC {endpoint_class} budget exhausted for {self.label} "
+                    f"(remaining {remaining:.1f}, cost {cost}, priority {priority})"
+                )
+            logger.info(f"CMC {endpoint_class} budget low for {self.label} (remaining {remaining:.1f}), "
+                        f"deferring priority {priority} call by {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    async def exhaust(self, endpoint_class: str) -> None:
+        """收到429时清空令牌桶，后续调用等待额度恢复而不是继续重试"""
+        redis_client = self._redis_getter()
+        if redis_client is None:
+            return
+        try:
+            await redis_client.hset(self._bucket_key(endpoint_class),
+                                    mapping={"tokens": 0, "ts": time.time(), "label": self.label})
+        except Exception as e:
+            logger.warning(f"Failed to exhaust CMC {endpoint_class} budget for {self.label}: {e}")
+
+
 async def acquire_lock(redis_client, lock_key, timeout=30, retry_count=3, retry_delay=1.0):
     """获取Redis分布式锁，支持重试机制"""
     import uuid
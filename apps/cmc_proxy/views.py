@@ -3,7 +3,7 @@ import math
 from django.views import View
 
 from apps.cmc_proxy.models import CmcAsset, CmcMarketData
-from apps.cmc_proxy.services import get_klines_for_asset, get_latest_market_data
+from apps.cmc_proxy.services import get_klines_for_asset, get_klines_for_assets, get_latest_market_data
 from apps.cmc_proxy.helpers import TimeRangeCalculator, MarketDataFormatter, ViewParameterValidator
 from common.helpers import ok_json, error_json, getLogger, parse_int, PAGE_SIZE
 
@@ -75,12 +75,12 @@ class CmcKlinesView(View):
         slice_qs = assets_qs[offset:offset + page_size]
         assets = [asset async for asset in slice_qs]
 
+        klines_map = await get_klines_for_assets(assets, timeframe, start_time, end_time, start_time_24h)
         results = []
         for asset in assets:
-            kline_data = await get_klines_for_asset(asset, timeframe, start_time, end_time, start_time_24h)
             results.append({
                 **MarketDataFormatter.format_asset_info(asset),
-                **kline_data
+                **klines_map[asset.cmc_id]
             })
 
         pages = math.ceil(total / page_size) if page_size else 1
@@ -174,11 +174,13 @@ class CmcMarketDataView(View):
 
         qs = CmcMarketData.objects.select_related('asset').filter(asset__cmc_id__in=id_list).order_by('-market_cap')
         items = [item async for item in qs]
+        assets = [item.asset for item in items]
+        ccxt_prices = await MarketDataFormatter.get_ccxt_prices_for_cmc_assets(assets)
+        klines_map = await get_klines_for_assets(assets, **kline_params)
         results = []
         for item in items:
-            kline_data = await get_klines_for_asset(item.asset, **kline_params)
-            result_item = MarketDataFormatter.format_market_data_item(item)
-            result_item.update(kline_data)
+            result_item = MarketDataFormatter.format_market_data_item(item, ccxt_prices)
+            result_item.update(klines_map[item.asset.cmc_id])
             results.append(result_item)
         return ok_json({'results': results})
 
@@ -197,11 +199,13 @@ class CmcMarketDataView(View):
         slice_qs = qs[offset:offset + page_size]
         items = [item async for item in slice_qs]
         pages = math.ceil(total / page_size) if page_size else 1
+        assets = [item.asset for item in items]
+        ccxt_prices = await MarketDataFormatter.get_ccxt_prices_for_cmc_assets(assets)
+        klines_map = await get_klines_for_assets(assets, **kline_params)
         results = []
         for item in items:
-            kline_data = await get_klines_for_asset(item.asset, **kline_params)
-            result_item = MarketDataFormatter.format_market_data_item(item)
-            result_item.update(kline_data)
+            result_item = MarketDataFormatter.format_market_data_item(item, ccxt_prices)
+            result_item.update(klines_map[item.asset.cmc_id])
             results.append(result_item)
         return ok_json({
             'page': page,
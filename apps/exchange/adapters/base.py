@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 import ccxt  # Import for ccxt.base.errors
 import ccxt.async_support as async_ccxt
@@ -9,10 +9,12 @@ from apps.exchange.ccxt_client import get_client
 from apps.exchange.consts import (
     STABLECOIN_MAX_RETRIES,
     STABLECOIN_RETRY_DELAY,
-    EXCHANGE_TICKERS_BATCH_SIZE
+    EXCHANGE_TICKERS_BATCH_SIZE,
+    EXCHANGE_TICKERS_MAX_CONCURRENCY
 )
 from apps.exchange.data_structures import MarketInfo, TickerData, PairDefinition, PairIdentifier
 from apps.exchange.interfaces import ExchangeInterface
+from apps.exchange.rate_limit import AsyncTokenBucket, create_request_limits
 
 logger = getLogger(__name__)
 
@@ -23,6 +25,8 @@ class BaseExchangeAdapter(ExchangeInterface):
         self.ccxt_config = ccxt_config or {}
         self.client: Optional[async_ccxt.Exchange] = self._get_client()
         self._markets_cache: Optional[Dict[str, MarketInfo]] = None  # exchange_symbol -> MarketInfo
+        self._request_semaphore: Optional[asyncio.Semaphore] = None
+        self._rate_limiter: Optional[AsyncTokenBucket] = None
 
     def _get_client(self) -> object | None:
         """
@@ -185,7 +189,71 @@ class BaseExchangeAdapter(ExchangeInterface):
         """Public method to be implemented by concrete adapters."""
         raise NotImplementedError("Concrete adapters must implement fetch_tickers")
 
+    def _request_limits(self) -> Tuple[asyncio.Semaphore, AsyncTokenBucket]:
+        """同一交易所所有行情请求共享的并发上限与令牌桶（按 CCXT rateLimit 恢复）"""
+        if self._request_semaphore is None:
+            self._request_semaphore, self._rate_limiter = create_request_limits(
+                self.client, self.exchange_id, EXCHANGE_TICKERS_MAX_CONCURRENCY)
+        return self._request_semaphore, self._rate_limiter
+
+    async def _rate_limited(self, method, *args, **kwargs):
+        """在并发上限与令牌桶约束下调用 CCXT 方法"""
+        semaphore, rate_limiter = self._request_limits()
+        async with semaphore:
+            await rate_limiter.acquire()
+            return await method(*args, **kwargs)
+
+    async def _fetch_ticker_batch(self, batch_symbols: List[str], pair_def_map: Dict[str, PairDefinition],
+                                  batch_label: str) -> Dict[str, TickerData]:
+        """获取一个批次的行情，失败时只重试该批次（指数退避），达到重试上限后放弃该批次"""
+        fetched: Dict[str, TickerData] = {}
+        current_retry = 0
+        while current_retry <= STABLECOIN_MAX_RETRIES:
+            try:
+                raw_batch_tickers = await self._rate_limited(self.client.fetch_tickers, symbols=batch_symbols)
+
+                if raw_batch_tickers:
+                    for ex_symbol, ticker_data in raw_batch_tickers.items():
+                        corresponding_pair_def = pair_def_map.get(ex_symbol)
+                        if corresponding_pair_def:
+                            fetched[ex_symbol] = self._map_ccxt_ticker_to_tickerdata(ticker_data, corresponding_pair_def)
+                        else:
+                            logger.warning(
+                                f"[{self.exchange_id}] Received ticker for unrequested/unmappable symbol: {ex_symbol}")
+                break
+
+            except asyncio.TimeoutError as te:
+                logger.warning(
+                    f"[{self.exchange_id}] Timeout fetching ticker batch {batch_label} (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {te}")
+                current_retry += 1
+            except ccxt.NetworkError as ne:
+                logger.warning(
+                    f"[{self.exchange_id}] NetworkError fetching ticker batch {batch_label} (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {ne}")
+                current_retry += 1
+            except ccxt.ExchangeError as ee:
+                logger.error(
+                    f"[{self.exchange_id}] ExchangeError fetching ticker batch {batch_label}. Details: {ee}. Not retrying this batch.",
+                    exc_info=True)
+                break
+            except Exception as e:
+                logger.error(
+                    f"[{self.exchange_id}] Unexpected error fetching ticker batch {batch_label} (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {e}",
+                    exc_info=True)
+                current_retry += 1
+
+            if current_retry > STABLECOIN_MAX_RETRIES:
+                logger.error(
+                    f"[{self.exchange_id}] Max retries reached for batch {batch_label} starting with {batch_symbols[0]}. Skipping this batch.")
+                break
+
+            if current_retry > 0:
+                delay = STABLECOIN_RETRY_DELAY * (2 ** (current_retry - 1))
+                logger.info(f"[{self.exchange_id}] Retrying batch {batch_label} in {delay}s...")
+                await asyncio.sleep(delay)
+        return fetched
+
     async def _fetch_tickers_by_symbols_batched(self, pair_defs: List[PairDefinition]) -> Dict[str, TickerData]:
+        """按 EXCHANGE_TICKERS_BATCH_SIZE 分批并发获取行情，并发数与请求速率由 _request_limits 约束"""
         if not self.client:
             logger.warning(f"[{self.exchange_id}] Client not available for _fetch_tickers_by_symbols_batched.")
             return {}
@@ -197,61 +265,35 @@ class BaseExchangeAdapter(ExchangeInterface):
         symbols_to_fetch = [pd.exchange_symbol for pd in pair_defs]
         pair_def_map = {pd.exchange_symbol: pd for pd in pair_defs}
 
-        all_fetched_tickers: Dict[str, TickerData] = {}
         batch_size = EXCHANGE_TICKERS_BATCH_SIZE.get(self.exchange_id, EXCHANGE_TICKERS_BATCH_SIZE.get('default', 100))
+        batches = [symbols_to_fetch[i:i + batch_size] for i in range(0, len(symbols_to_fetch), batch_size)]
+        logger.debug(f"[{self.exchange_id}] Fetching {len(symbols_to_fetch)} tickers in {len(batches)} concurrent batches.")
 
-        for i in range(0, len(symbols_to_fetch), batch_size):
-            batch_symbols = symbols_to_fetch[i:i + batch_size]
-            if not batch_symbols:
-                continue
-
-            logger.debug(
-                f"[{self.exchange_id}] Fetching ticker batch {i // batch_size + 1}/{(len(symbols_to_fetch) + batch_size - 1) // batch_size} with {len(batch_symbols)} symbols.")
-
-            current_retry = 0
-            while current_retry <= STABLECOIN_MAX_RETRIES:
-                try:
-                    raw_batch_tickers = await self.client.fetch_tickers(symbols=batch_symbols)
-
-                    if raw_batch_tickers:
-                        for ex_symbol, ticker_data in raw_batch_tickers.items():
-                            corresponding_pair_def = pair_def_map.get(ex_symbol)
-                            if corresponding_pair_def:
-                                mapped_ticker = self._map_ccxt_ticker_to_tickerdata(ticker_data, corresponding_pair_def)
-                                all_fetched_tickers[ex_symbol] = mapped_ticker
-                            else:
-                                logger.warning(
-                                    f"[{self.exchange_id}] Received ticker for unrequested/unmappable symbol: {ex_symbol}")
-                    break
-
-                except asyncio.TimeoutError as te:
-                    logger.warning(
-                        f"[{self.exchange_id}] Timeout fetching ticker batch (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {te}")
-                    current_retry += 1
-                except ccxt.NetworkError as ne:
-                    logger.warning(
-                        f"[{self.exchange_id}] NetworkError fetching ticker batch (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {ne}")
-                    current_retry += 1
-                except ccxt.ExchangeError as ee:
-                    logger.error(
-                        f"[{self.exchange_id}] ExchangeError fetching ticker batch. Details: {ee}. Not retrying this batch.",
-                        exc_info=True)
-                    break
-                except Exception as e:
-                    logger.error(
-                        f"[{self.exchange_id}] Unexpected error fetching ticker batch (attempt {current_retry + 1}/{STABLECOIN_MAX_RETRIES + 1}). Details: {e}",
-                        exc_info=True)
-
-                if current_retry > STABLECOIN_MAX_RETRIES:
-                    logger.error(
-                        f"[{self.exchange_id}] Max retries reached for batch starting with {batch_symbols[0]}. Skipping this batch.")
-                    break
-
-                if current_retry > 0:
-                    delay = STABLECOIN_RETRY_DELAY * (2 ** (current_retry - 1))
-                    logger.info(f"[{self.exchange_id}] Retrying batch in {delay}s...")
-                    await asyncio.sleep(delay)
+        results = await asyncio.gather(*(
+            self._fetch_ticker_batch(batch, pair_def_map, f"{index + 1}/{len(batches)}")
+            for index, batch in enumerate(batches)
+        ))
+        all_fetched_tickers: Dict[str, TickerData] = {}
+        for batch_tickers in results:
+            all_fetched_tickers.update(batch_tickers)
 
         logger.info(
             f"[{self.exchange_id}] _fetch_tickers_by_symbols_batched completed. Fetched {len(all_fetched_tickers)} tickers out of {len(symbols_to_fetch)} requested symbols.")
         return all_fetched_tickers
+
+    async def _fetch_tickers_individually(self, pair_defs: List[PairDefinition]) -> Dict[str, TickerData]:
+        """逐个交易对并发调用 fetch_ticker，单个交易对失败不影响其他交易对"""
+
+        async def fetch_one(pair_def: PairDefinition) -> Optional[TickerData]:
+            try:
+                raw_ticker = await self._rate_limited(self.client.fetch_ticker, pair_def.exchange_symbol)
+            except Exception as e:
+                logger.error(f"[{self.exchange_id}] 单个获取失败 ({pair_def.exchange_symbol}): {e}")
+                return None
+            return self._map_ccxt_ticker_to_tickerdata(raw_ticker, pair_def) if raw_ticker else None
+
+        results = await asyncio.gather(*(fetch_one(pair_def) for pair_def in pair_defs))
+        return {
+            pair_def.exchange_symbol: ticker
+            for pair_def, ticker in zip(pair_defs, results) if ticker is not None
+        }
@@ -1,4 +1,3 @@
-import asyncio
 from typing import Dict, List
 
 from common.helpers import getLogger
@@ -61,26 +60,8 @@ class BinanceAdapter(BaseExchangeAdapter):
             logger.error(f"[{self.exchange_id}] 获取所有交易对行情失败: {e}, 错误类型: {type(e)}")
             logger.info(f"[{self.exchange_id}] 改用逐个获取{len(pair_defs)}个交易对")
 
-            # 如果批量获取失败，改用逐个获取
-            counter = 0
-            for pair_def in pair_defs:
-                try:
-                    raw_ticker = await self.client.fetch_ticker(pair_def.exchange_symbol)
-                    if raw_ticker:
-                        mapped_ticker = self._map_ccxt_ticker_to_tickerdata(raw_ticker, pair_def)
-                        all_fetched_tickers[pair_def.exchange_symbol] = mapped_ticker
-                        counter += 1
-
-                        # 每获取10个交易对后显示一次进度
-                        if counter % 10 == 0:
-                            logger.debug(f"[{self.exchange_id}] 已获取{counter}/{len(pair_defs)}个交易对")
-
-                        # 每获取50个交易对后休眠1秒，避免触发频率限制
-                        if counter % 50 == 0:
-                            await asyncio.sleep(1)
-
-                except Exception as e2:
-                    logger.error(f"[{self.exchange_id}] 单个获取失败 ({pair_def.exchange_symbol}): {e2}")
+            # 如果批量获取失败，改用逐个获取（并发执行，受交易所并发上限与令牌桶限速）
+            all_fetched_tickers.update(await self._fetch_tickers_individually(pair_defs))
 
         logger.info(
             f"[{self.exchange_id}] fetch_tickers completed. Fetched {len(all_fetched_tickers)} tickers out of {len(pair_defs)} requested symbols."
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ExchangeConfig(AppConfig):
     name = 'apps.exchange'
+
+    def ready(self):
+        from apps.exchange.metadata_cache import connect_signals
+        connect_signals()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cache_ops 的原生 asyncio 版本，供爬虫协程使用，缓存读写不再阻塞驱动 CCXT 请求的事件循环。
+
+键名、快照编码与 cache_ops 完全一致，两者可以混用：
+  - global_redis 的键经 django_redis 客户端生成键名并序列化，与 Django 缓存读写兼容；
+  - 批量接口（aset_24tickers / aset_orderbooks / aget_orderbooks）把一轮抓取中多个交易对的写入
+    合并为每个 Redis 实例一次 pipeline 往返。
+与 GlobalRedisWrapper 不同，global 连接失败时不会回退到本地 Redis，异常直接抛出由调用方处理。
+"""
+import asyncio
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.clock import ntp_clock
+from common.helpers import getLogger
+from common.redis_client import async_global_redis, async_local_redis
+from apps.exchange.cache_ops import (
+    APPEND_HISTORY_SCRIPT,
+    DRAIN_DIRTY_SCRIPT,
+    accept_orderbook,
+    build_merged_orderbook,
+    get_merge_exchange_names,
+    hide_crossed_levels,
+    history_args,
+    history_score,
+    prepare_24ticker,
+    validate_orderbook,
+)
+from apps.exchange.consts import (
+    EXCHANGE_MARKET_DATA_KEY,
+    EXCHANGE_MARKET_DATA_TTL,
+    EXCHANGE_OHLCV_KEY,
+    EXCHANGE_OHLCV_TTL,
+    EXCHANGE_ORDERBOOKS_KEY,
+    EXCHANGE_TICKERS_KEY,
+    NRDS_DIRTY_ORDERBOOKS_KEY,
+    NRDS_EXCHANGE_ORDERBOOKS_KEY,
+    NRDS_EXCHANGE_TICKERS_KEY,
+    NRDS_LATEST_KEY,
+    NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY,
+    SYMBOL_MERGE_ORDERBOOKS_KEY,
+)
+from apps.exchange.exceptions import OrderbookNotFound
+from apps.exchange.history_codec import decode_orderbook, decode_ticker, get_history_codec
+from apps.exchange.models import TradingPair
+from apps.exchange.types import Orderbook
+
+logger = getLogger(__name__)
+
+
+def _global_key(key: str):
+    return cache.client.make_key(key)
+
+
+def _global_value(value: Any):
+    return cache.client.encode(value)
+
+
+def _global_load(value: Optional[bytes]) -> Any:
+    return None if value is None else cache.client.decode(value)
+
+
+def _queue_history(pipe, zkey: str, raw, score: int, dirty_symbol: Optional[str] = None) -> None:
+    """在 pipeline 中追加一条历史快照，与 cache_ops.append_history 使用同一脚本"""
+    keys, args = history_args(zkey, raw, score, dirty_symbol)
+    pipe.eval(APPEND_HISTORY_SCRIPT, len(keys), *keys, *args)
+
+
+async def _execute(*pipes) -> None:
+    """并发执行 local / global 两个实例上的 pipeline"""
+    results = await asyncio.gather(*(pipe.execute() for pipe in pipes), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+
+
+async def aset_24tickers(exchange_name: str, tickers: Dict[str, Dict[str, Any]], timeout: int = 120) -> int:
+    """批量写入同一交易所的 ticker，时间戳异常的交易对单独跳过。返回写入的交易对数量"""
+    local_pipe = async_local_redis().pipeline(transaction=False)
+    global_pipe = async_global_redis().pipeline(transaction=False)
+    written = 0
+    for symbol, data in tickers.items():
+        try:
+            ticker_raw, tsmp_score = prepare_24ticker(data)
+        except AssertionError as e:
+            logger.error(f"Rejecting ticker {exchange_name}.{symbol}: {e}")
+            continue
+        _queue_history(local_pipe, NRDS_EXCHANGE_TICKERS_KEY % (exchange_name, symbol), ticker_raw, tsmp_score)
+        global_pipe.set(_global_key(EXCHANGE_TICKERS_KEY % (exchange_name, symbol)), _global_value(ticker_raw), ex=timeout)
+        written += 1
+    if written:
+        await _execute(local_pipe, global_pipe)
+    logger.debug(f"aset_24tickers: {exchange_name} {written}/{len(tickers)} tickers written")
+    return written
+
+
+async def aset_24ticker(exchange_name: str, symbol: str, data: Dict[str, Any], timeout: int = 120) -> None:
+    await aset_24tickers(exchange_name, {symbol: data}, timeout=timeout)
+
+
+async def aget_24ticker(exchange_name: str, symbol: str) -> Optional[Dict[str, Any]]:
+    data = _global_load(await async_global_redis().get(_global_key(EXCHANGE_TICKERS_KEY % (exchange_name, symbol))))
+    return decode_ticker(data) if data else None
+
+
+async def aset_orderbooks(exchange_name: str, books: Dict[str, Dict[str, Any]]) -> int:
+    """
+    批量写入同一交易所的订单簿：一次 MGET 读取各交易对当前最新快照用于时间戳比较，
+    再以每个实例一次 pipeline 写入最新快照与历史。返回写入历史的交易对数量
+    """
+    prepared = []
+    for symbol, data in books.items():
+        ts_new = validate_orderbook(exchange_name, symbol, data)
+        if ts_new is None:
+            continue
+        try:
+            tsmp = history_score(data["timestamp"])
+        except AssertionError as e:
+            logger.error(f"Rejecting orderbook {exchange_name}.{symbol}: {e}")
+            continue
+        prepared.append((symbol, data, ts_new, tsmp, get_history_codec().encode_orderbook(data)))
+    if not prepared:
+        return 0
+
+    global_client = async_global_redis()
+    global_keys = [_global_key(EXCHANGE_ORDERBOOKS_KEY % (exchange_name, item[0])) for item in prepared]
+    existing = await global_client.mget(global_keys)
+
+    local_pipe = async_local_redis().pipeline(transaction=False)
+    global_pipe = global_client.pipeline(transaction=False)
+    for (symbol, data, ts_new, tsmp, orderbook_raw), global_key, current in zip(prepared, global_keys, existing):
+        if accept_orderbook(exchange_name, symbol, data, _global_load(current), ts_new):
+            global_pipe.set(global_key, _global_value(orderbook_raw), ex=cache.default_timeout)
+        _queue_history(local_pipe, NRDS_EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol), orderbook_raw, tsmp,
+                       dirty_symbol=symbol)
+    await _execute(local_pipe, global_pipe)
+    return len(prepared)
+
+
+async def aset_orderbook(exchange_name: str, symbol: str, data: Dict[str, Any]) -> None:
+    await aset_orderbooks(exchange_name, {symbol: data})
+
+
+async def aget_orderbooks(pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Orderbook]:
+    """一次 MGET 读取多个 (交易所, 交易对) 的最新订单簿，不存在的交易对不出现在结果中"""
+    pairs = list(pairs)
+    if not pairs:
+        return {}
+    keys = [NRDS_LATEST_KEY % (NRDS_EXCHANGE_ORDERBOOKS_KEY % pair) for pair in pairs]
+    result = {}
+    for (exchange_name, symbol_name), data in zip(pairs, await async_local_redis().mget(keys)):
+        if data:
+            ob = decode_orderbook(data)
+            ob.exchange = ob.exchange or exchange_name
+            result[(exchange_name, symbol_name)] = ob
+    return result
+
+
+async def aget_orderbook(exchange_name: str, symbol_name: str) -> Orderbook:
+    books = await aget_orderbooks([(exchange_name, symbol_name)])
+    if not books:
+        raise OrderbookNotFound(f"{exchange_name} {symbol_name}")
+    return books[(exchange_name, symbol_name)]
+
+
+async def adrain_dirty_orderbooks(symbol_names: Iterable[str]) -> Set[str]:
+    """取走给定交易对中自上次取走后最新订单簿有更新的那些，一次往返"""
+    symbol_names = list(symbol_names)
+    if not symbol_names:
+        return set()
+    drained = await async_local_redis().eval(DRAIN_DIRTY_SCRIPT, 1, NRDS_DIRTY_ORDERBOOKS_KEY, *symbol_names)
+    return {member.decode() for member in drained}
+
+
+async def aset_merged_orderbook(symbol_name: str, orderbook: Orderbook) -> None:
+    logger.info(f"aset_merged_orderbook: {symbol_name}")
+    orderbook_raw = json.dumps(orderbook.as_json())
+    tsmp = history_score(ntp_clock.now_ms() if orderbook.timestamp is None else orderbook.timestamp)
+    local_pipe = async_local_redis().pipeline(transaction=False)
+    global_pipe = async_global_redis().pipeline(transaction=False)
+    global_pipe.set(_global_key(SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name), _global_value(orderbook_raw),
+                    ex=cache.default_timeout)
+    _queue_history(local_pipe, NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name, orderbook_raw, tsmp)
+    await _execute(local_pipe, global_pipe)
+
+
+async def aget_merged_orderbook(symbol_name: str) -> Orderbook:
+    dbdata = _global_load(await async_global_redis().get(_global_key(SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name)))
+    if not dbdata:
+        raise OrderbookNotFound(f"merged {symbol_name}")
+    return Orderbook.from_json(json.loads(dbdata))
+
+
+async def amerge_usds_orderbooks(symbol: TradingPair):
+    symbols_dict = settings.EXCHANGE_FUTURES_SYMBOLS[symbol.quote_asset.name]
+    pairs = [(exchange_name, symbols[0]) for exchange_name, symbols in symbols_dict.items()]
+    books = await aget_orderbooks(pairs)
+    return build_merged_orderbook([(pair[1], books[pair]) for pair in pairs if pair in books])
+
+
+async def amerge_usdt_orderbooks(symbol: TradingPair):
+    exchange_names = await get_merge_exchange_names(symbol)
+    if exchange_names is None:
+        return Orderbook(), {}
+
+    pairs = [(exchange_name, symbol.symbol_display) for exchange_name in exchange_names]
+    books = await aget_orderbooks(pairs)
+    merged: List[Tuple[str, Orderbook]] = []
+    for pair in pairs:
+        if pair not in books:
+            logger.warning(f"Orderbook not found for {pair[0]} {symbol.symbol_display}. Skipping.")
+            continue
+        if symbol.category == "Spot":
+            merged.append((symbol.symbol_display, books[pair]))
+    return build_merged_orderbook(merged)
+
+
+async def amerge_orderbooks(symbol: TradingPair) -> None:
+    """cache_ops.merge_orderbooks 的异步版本，各交易所最新订单簿一次 MGET 读取"""
+    if symbol.symbol_display in ['BTC/USDS', 'ETH/USDS']:
+        orderbook, messages = await amerge_usds_orderbooks(symbol)
+    else:
+        orderbook, messages = await amerge_usdt_orderbooks(symbol)
+    hide_crossed_levels(symbol, orderbook, messages)
+    await aset_merged_orderbook(symbol.symbol_display, orderbook)
+
+
+async def aset_ohlcv(exchange_name, symbol_name, timeframe, data: list) -> None:
+    """保存K线数据到Redis，30分钟过期"""
+    key = EXCHANGE_OHLCV_KEY % (exchange_name, symbol_name, timeframe)
+    await async_global_redis().set(_global_key(key), _global_value(json.dumps(data)), ex=EXCHANGE_OHLCV_TTL)
+
+
+async def aget_ohlcv(exchange_name, symbol_name, timeframe) -> Optional[list]:
+    key = EXCHANGE_OHLCV_KEY % (exchange_name, symbol_name, timeframe)
+    data = _global_load(await async_global_redis().get(_global_key(key)))
+    return json.loads(data) if data else None
+
+
+async def aset_market_data(exchange_name, symbol_name, data: dict) -> None:
+    """保存市场综合数据到Redis，5分钟过期"""
+    key = EXCHANGE_MARKET_DATA_KEY % (exchange_name, symbol_name)
+    await async_global_redis().set(_global_key(key), _global_value(json.dumps(data)), ex=EXCHANGE_MARKET_DATA_TTL)
+
+
+async def aget_market_data(exchange_name, symbol_name) -> Optional[dict]:
+    key = EXCHANGE_MARKET_DATA_KEY % (exchange_name, symbol_name)
+    data = _global_load(await async_global_redis().get(_global_key(key)))
+    return json.loads(data) if data else None
@@ -3,32 +3,106 @@
 
 import json
 import time
-from itertools import groupby
 from operator import attrgetter
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from asgiref.sync import sync_to_async
 from django.conf import settings
 
-from common.helpers import dec, getLogger
+from common.clock import ntp_clock
+from common.helpers import getLogger
 from common.redis_client import global_redis, local_redis
 from apps.exchange.consts import (
     EXCHANGE_ORDERBOOKS_KEY,
     EXCHANGE_TICKERS_KEY,
+    NRDS_DIRTY_ORDERBOOKS_KEY,
     NRDS_EXCHANGE_ORDERBOOKS_KEY,
     NRDS_EXCHANGE_TICKERS_KEY,
     NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY,
     SYMBOL_MERGE_ORDERBOOKS_KEY,
-    EXCHANGE_BLOCKING
+    EXCHANGE_BLOCKING,
+    EXCHANGE_MARKET_DATA_KEY,
+    EXCHANGE_MARKET_DATA_TTL,
+    EXCHANGE_OHLCV_KEY,
+    EXCHANGE_OHLCV_TTL,
+    EXCHANGE_HISTORY_MAX_LENGTH,
+    EXCHANGE_HISTORY_WINDOW,
+    MERGE_ORDERBOOK_DEPTH,
+    NRDS_LATEST_KEY
 )
 from apps.exchange.exceptions import OrderbookNotFound
+from apps.exchange.history_codec import decode_orderbook, decode_orderbook_timestamp, decode_ticker, \
+    get_history_codec
+from apps.exchange.metadata_cache import metadata_cache
 from apps.exchange.models import TradingPair
+from apps.exchange.orderbook_merge import merge_sorted_sides
 from apps.exchange.types import Orderbook, OrderEntry
 
 logger = getLogger(__name__)
 
 EXCHANGE_BLOCKING_PERIOD = 60 * 5
 
+# 追加一条历史快照并在同一次调用中裁剪：按最新分数保留 EXCHANGE_HISTORY_WINDOW 秒、最多 max_length 条，
+# 新快照不早于当前最新快照时同时更新最新指针，并在传入第3个键时把 ARGV[5] 加入该集合（标记待合并）。
+# KEYS: 历史ZSET, 最新指针[, 待合并集合]; ARGV: 快照, 分数(秒), 窗口, 最大条数[, 交易对]
+APPEND_HISTORY_SCRIPT = """
+local score = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local max_length = tonumber(ARGV[4])
+redis.call('ZADD', KEYS[1], score, ARGV[1])
+local newest = tonumber(redis.call('ZREVRANGE', KEYS[1], 0, 0, 'WITHSCORES')[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', newest - window)
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -max_length - 1)
+redis.call('EXPIRE', KEYS[1], window)
+if score >= newest then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', window)
+    if KEYS[3] then
+        redis.call('SADD', KEYS[3], ARGV[5])
+    end
+    return 1
+end
+return 0
+"""
+_append_history_script = local_redis().register_script(APPEND_HISTORY_SCRIPT)
+
+# 从待合并集合中取走给定的交易对，返回其中确实被标记过的。KEYS: 待合并集合; ARGV: 交易对...
+DRAIN_DIRTY_SCRIPT = """
+local drained = {}
+for _, member in ipairs(ARGV) do
+    if redis.call('SREM', KEYS[1], member) == 1 then
+        drained[#drained + 1] = member
+    end
+end
+return drained
+"""
+
+
+def history_args(zkey: str, raw, score: int, dirty_symbol: Optional[str] = None) -> Tuple[List, List]:
+    """APPEND_HISTORY_SCRIPT 的 keys / args；给出 dirty_symbol 时快照成为最新后把它标记为待合并"""
+    keys = [zkey, NRDS_LATEST_KEY % zkey]
+    args = [raw, score, EXCHANGE_HISTORY_WINDOW, EXCHANGE_HISTORY_MAX_LENGTH]
+    if dirty_symbol is not None:
+        keys.append(NRDS_DIRTY_ORDERBOOKS_KEY)
+        args.append(dirty_symbol)
+    return keys, args
+
+
+def append_history(zkey: str, raw, score: int, dirty_symbol: Optional[str] = None) -> bool:
+    """追加历史快照并裁剪窗口，一次往返。返回该快照是否成为最新快照"""
+    keys, args = history_args(zkey, raw, score, dirty_symbol)
+    return bool(_append_history_script(keys=keys, args=args))
+
+
+def get_latest_history(zkey: str):
+    return local_redis().get(NRDS_LATEST_KEY % zkey)
+
+
+def get_history_before(zkey: str, timestamp: int):
+    """读取 timestamp（秒）之前窗口内最新的一条快照，timestamp 为0时读取最新指针"""
+    if not timestamp:
+        return get_latest_history(zkey)
+    data = local_redis().zrevrangebyscore(zkey, timestamp, timestamp - EXCHANGE_HISTORY_WINDOW, start=0, num=1)
+    return data[0] if data else None
+
 
 def set_exchange_account_blocking(exg_name: str, api_account: str):
     key = EXCHANGE_BLOCKING % (exg_name, api_account)
@@ -50,49 +124,43 @@ def get_exchange_account_blocking(exg_name: str, api_account: str):
         return False
 
 
-def set_24ticker(
-        exchange_name: str, symbol: str, data: Dict[str, Any], timeout: int = 120
-) -> None:
-    key = EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
-    zkey = NRDS_EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
+def prepare_24ticker(data: Dict[str, Any]) -> Tuple[Any, int]:
+    """补齐并校验 ticker 时间戳后编码，返回 (快照, 历史分数秒)，同步与异步写入共用"""
     if "timestamp" not in data or data["timestamp"] is None:
-        tmstp = int(time.time() * 1000)
+        tmstp = ntp_clock.now_ms()
         data["timestamp"] = tmstp
     else:
         tmstp = int(data["timestamp"])
 
     tmstp_seconds = tmstp / 1000
-    current_time_seconds = time.time()
+    current_time_seconds = ntp_clock.now()
     assert current_time_seconds - 300 < tmstp_seconds < current_time_seconds + 300, \
         f"incorrect timestamp {tmstp} (seconds: {tmstp_seconds}), current time {current_time_seconds}"
 
-    tsmp_score = int(tmstp_seconds)
-    ticker_json = json.dumps(data)
-    tiker_map = {ticker_json: tsmp_score}
+    return get_history_codec().encode_ticker(data), int(tmstp_seconds)
+
+
+def set_24ticker(
+        exchange_name: str, symbol: str, data: Dict[str, Any], timeout: int = 120
+) -> None:
+    key = EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
+    zkey = NRDS_EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
+    ticker_raw, tsmp_score = prepare_24ticker(data)
 
-    redis_local = local_redis()
     redis_global = global_redis()
 
     logger.info(
-        f"Attempting to ZADD to local Redis (DB 2). Key: {zkey}, Score: {tsmp_score}, Member: {ticker_json[:100]}...")
+        f"Attempting to append history to local Redis (DB 2). Key: {zkey}, Score: {tsmp_score}, Member: {len(ticker_raw)} bytes")
     try:
-        zadd_result = redis_local.zadd(zkey, tiker_map)
-        logger.info(f"ZADD result for key {zkey}: {zadd_result} (1 means new element added)")
+        is_latest = append_history(zkey, ticker_raw, tsmp_score)
+        logger.info(f"Append history result for key {zkey}: latest={is_latest}")
     except Exception as e:
-        logger.error(f"Error during ZADD to key {zkey}", exc_info=True)
+        logger.error(f"Error during history append to key {zkey}", exc_info=True)
         return
 
-    remove_until_score = tsmp_score - 1200
-    logger.info(f"Attempting to ZREMRANGEBYSCORE for key {zkey}. Removing scores from 0 to {remove_until_score}")
-    try:
-        removed_count = redis_local.zremrangebyscore(zkey, 0, remove_until_score)
-        logger.info(f"ZREMRANGEBYSCORE result for key {zkey}: removed {removed_count} elements.")
-    except Exception as e:
-        logger.error(f"Error during ZREMRANGEBYSCORE for key {zkey}", exc_info=True)
-
     logger.info(f"Attempting to SET key in global_redis (Django Cache): {key}")
     try:
-        redis_global.set(key, ticker_json, timeout=timeout)
+        redis_global.set(key, ticker_raw, timeout=timeout)
         logger.info(f"SET completed for key {key} in global_redis (Django Cache)")
     except Exception as e:
         logger.error(f"Error during SET to key {key} in global_redis (Django Cache)", exc_info=True)
@@ -104,7 +172,7 @@ def get_24ticker(
     key = EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
     data = global_redis().get(key)
     if data:
-        ticker = json.loads(data)
+        ticker = decode_ticker(data)
         if time.time() - ticker["timestamp"] < timeout:
             return ticker
         else:
@@ -117,11 +185,9 @@ def get_history_24ticker(
         exchange_name: str, symbol: str, timestamp: int = 0, timeout: int = 120
 ):
     zkey = NRDS_EXCHANGE_TICKERS_KEY % (exchange_name, symbol)
-    score_end = timestamp or int(time.time())
-    score_start = score_end - 1200
-    data = local_redis().zrevrangebyscore(zkey, score_end, score_start)
-    if len(data) > 0:
-        ticker = json.loads(data[-1].decode())
+    data = get_history_before(zkey, timestamp)
+    if data:
+        ticker = decode_ticker(data)
         if time.time() - ticker["timestamp"] < timeout:
             return ticker
         else:
@@ -136,14 +202,12 @@ def get_orderbook(exchange_name: str, symbol_name: str) -> Orderbook:
     # data = global_redis().get(key)
 
     logger.info(f"get_orderbook_key: {key}")
-    score_end = int(time.time())
-    score_start = score_end - 1200
-    data = local_redis().zrevrangebyscore(key, score_end, score_start)
+    data = get_latest_history(key)
     if not data:
         raise OrderbookNotFound(f"{exchange_name} {symbol_name}")
-    p = json.loads(data[-1].decode())
-    p.setdefault("exchange", exchange_name)
-    return Orderbook.from_json(p)
+    ob = decode_orderbook(data)
+    ob.exchange = ob.exchange or exchange_name
+    return ob
 
 
 def get_history_orderbook(
@@ -156,55 +220,73 @@ def get_history_orderbook_lst(
         exchange_name: str, symbol: str, timestamp: Optional[int] = None
 ) -> List[Orderbook]:
     key = NRDS_EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol)
-    score_start = (timestamp or int(time.time())) - 1200
+    score_start = (timestamp or int(time.time())) - EXCHANGE_HISTORY_WINDOW
     score_end = int(time.time())
     data = local_redis().zrangebyscore(key, score_start, score_end)
     if not data:
         raise OrderbookNotFound(f"{exchange_name}.{symbol}")
-    data2ob = lambda _data: Orderbook.from_json(dict(exchange=exchange_name, **json.loads(_data.decode())))
-    return list(map(data2ob, data))
+    obs = list(map(decode_orderbook, data))
+    for ob in obs:
+        ob.exchange = exchange_name
+    return obs
 
 
 class OrderbookDelayError(Exception):
     pass
 
 
-def set_orderbook(exchange_name: str, symbol: str, data: Dict[str, Any]) -> None:
+def validate_orderbook(exchange_name: str, symbol: str, data: Dict[str, Any]) -> Optional[int]:
+    """校验订单簿字段，返回毫秒时间戳；时间戳格式错误时返回 None，调用方应丢弃该订单簿"""
     assert all(key in data for key in ("source", "bids", "asks", "timestamp")), \
         f'{data} must have attribute ' \
         f'("source", "bids", "asks", "timestamp")'
     assert data["timestamp"], f'{data} attribute "timestamp" is None'
 
     try:
-        ts_new = int(data["timestamp"])
+        return int(data["timestamp"])
     except (ValueError, TypeError):
         logger.error(f"Invalid timestamp format for {exchange_name}.{symbol}: {data['timestamp']}. Rejecting orderbook.")
-        return
+        return None
 
-    key = EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol)
-    logger.info(f"global_redis_key: {key}")
 
+def accept_orderbook(exchange_name: str, symbol: str, data: Dict[str, Any], existing, ts_new: int) -> bool:
+    """与当前最新快照比较时间戳，较旧的订单簿不覆盖最新快照（仍写入历史）"""
     try:
-        existing = global_redis().get(key)
         if existing:
-            ob_data = json.loads(existing)
-            ts_cur = ob_data.get("timestamp", None)
+            ts_cur = decode_orderbook_timestamp(existing)
             if ts_cur and ts_new and ts_cur > ts_new:
                 raise OrderbookDelayError
     except OrderbookDelayError:
         logger.info(f"{exchange_name}.{symbol}: {data['source']} data rejected.")
-    else:
-        ts_lag = time.time() * 1000 - ts_new
-        logger.info(f"{exchange_name}.{symbol}: {data['source']} data accepted. ts_lag {ts_lag:.4f} ms")
-        global_redis().set(key, json.dumps(data))  # timeout=None)
-    zkey = NRDS_EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol)
-    tsmp = int(int(data["timestamp"]) / 1000)  # milliseconds to seconds
-    current = int(time.time())
+        return False
+    ts_lag = ntp_clock.now() * 1000 - ts_new
+    logger.info(f"{exchange_name}.{symbol}: {data['source']} data accepted. ts_lag {ts_lag:.4f} ms")
+    return True
+
+
+def history_score(timestamp) -> int:
+    """毫秒时间戳转换为历史 ZSET 分数（秒），与当前时间相差超过5分钟视为错误"""
+    tsmp = int(int(timestamp) / 1000)  # milliseconds to seconds
+    current = int(ntp_clock.now())
     assert current - 300 < tsmp < current + 300, f"incorrect tsmp {tsmp}, current {current}"
-    orderbook_map = {json.dumps(data): tsmp}
-    logger.debug(f"orderbook_map: {orderbook_map}")
-    local_redis().zadd(zkey, orderbook_map)
-    local_redis().zremrangebyscore(zkey, 0, tsmp - 1200)
+    return tsmp
+
+
+def set_orderbook(exchange_name: str, symbol: str, data: Dict[str, Any]) -> None:
+    ts_new = validate_orderbook(exchange_name, symbol, data)
+    if ts_new is None:
+        return
+
+    key = EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol)
+    logger.info(f"global_redis_key: {key}")
+    orderbook_raw = get_history_codec().encode_orderbook(data)
+
+    if accept_orderbook(exchange_name, symbol, data, global_redis().get(key), ts_new):
+        global_redis().set(key, orderbook_raw)  # timeout=None)
+    zkey = NRDS_EXCHANGE_ORDERBOOKS_KEY % (exchange_name, symbol)
+    tsmp = history_score(data["timestamp"])
+    logger.debug(f"orderbook history: {len(orderbook_raw)} bytes, score {tsmp}")
+    append_history(zkey, orderbook_raw, tsmp, dirty_symbol=symbol)
 
 
 def get_merged_orderbook(symbol_name: str) -> Orderbook:
@@ -219,27 +301,20 @@ def get_merged_orderbook(symbol_name: str) -> Orderbook:
 def set_merged_orderbook(symbol_name: str, orderbook: Orderbook) -> None:
     logger.info(f"set_merged_orderbook: {symbol_name}")
     key = SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name
-    global_redis().set(key, json.dumps(orderbook.as_json()))
+    orderbook_raw = json.dumps(orderbook.as_json())
+    global_redis().set(key, orderbook_raw)
     zkey = NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name
-    if orderbook.timestamp is None:
-        tsmp = int(time.time())
-    else:
-        tsmp = int(int(orderbook.timestamp) / 1000)
-    assert int(time.time()) - 300 < tsmp < int(time.time()) + 300, f"incorrect tsmp {tsmp}"
-    merged_orderbook_map = {json.dumps(orderbook.as_json()): tsmp}
-    logger.debug(f"merged_orderbook_map: {merged_orderbook_map}")
-    local_redis().zadd(zkey, merged_orderbook_map)
-    local_redis().zremrangebyscore(zkey, 0, tsmp - 1200)  # remove expired data
+    tsmp = history_score(ntp_clock.now_ms() if orderbook.timestamp is None else orderbook.timestamp)
+    logger.debug(f"merged orderbook history: {orderbook_raw}")
+    append_history(zkey, orderbook_raw, tsmp)  # 追加并裁剪过期数据
 
 
 def get_history_merged_orderbook(symbol_name: str, timestamp: int = 0) -> Orderbook:
     zkey = NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY % symbol_name
-    score_end = timestamp or int(time.time())
-    score_start = score_end - 1200
-    dbdata = local_redis().zrevrangebyscore(zkey, score_end, score_start)
-    if len(dbdata) == 0:
+    dbdata = get_history_before(zkey, timestamp)
+    if not dbdata:
         raise OrderbookNotFound(f"merged {symbol_name}")
-    data: Dict[str, Any] = json.loads(dbdata[-1].decode())
+    data: Dict[str, Any] = json.loads(dbdata)
     return Orderbook.from_json(data)
 
 
@@ -257,22 +332,16 @@ def get_perpetual_orderbook() -> Orderbook:
 
 
 def merge_order_list(old: List[OrderEntry], new: List[OrderEntry], reverse=False):
-    output: List[OrderEntry] = []
-    mixed = sorted(old + new, key=lambda ent: ent.price)
-    for k, _ents in groupby(mixed, key=lambda ent: ent.price_str):
-        ents = list(_ents)
-        order = OrderEntry()
-        order.price = dec(k)
-        order.amount = dec(sum(e.amount for e in ents))
-        output.append(order)
-    return sorted(output, key=attrgetter("price"), reverse=reverse)
+    # 兼容未排序的输入；已排序的订单簿直接使用 merge_sorted_sides
+    sides = [sorted(side, key=attrgetter("price_ticks"), reverse=reverse) for side in (old, new)]
+    return merge_sorted_sides(sides, reverse=reverse)
 
 
-def save_merged_ob(symbol, orderbook, messages):
+def hide_crossed_levels(symbol, orderbook, messages):
     toggle = True
     bids, asks = orderbook.bids, orderbook.asks
     # 交叉盘/锁定盘处理。正常的单一交易所订单簿中，最高买价 应该永远低于 最低卖价
-    while bids and asks and bids[0].price >= asks[0].price:
+    while bids and asks and bids[0].price_ticks >= asks[0].price_ticks:
         bids, asks = (bids[1:], asks[:]) if toggle else (bids[:], asks[1:])
         toggle = not toggle
     bids_hidden = len(orderbook.bids) - len(bids)
@@ -289,29 +358,31 @@ def save_merged_ob(symbol, orderbook, messages):
     #     logger.warning(messages)
     # else:
     #     logger.debug(messages)
-    set_merged_orderbook(symbol.symbol_display, orderbook)
 
 
-def merge_usds_orderbooks(symbol: TradingPair):
-    orderbook = Orderbook()
-    symbols_dict = settings.EXCHANGE_FUTURES_SYMBOLS[symbol.quote_asset.name]
+def save_merged_ob(symbol, orderbook, messages):
+    hide_crossed_levels(symbol, orderbook, messages)
+    set_merged_orderbook(symbol.symbol_display, orderbook)
 
-    # TODO: what if symbols_dict is empty
+
+def build_merged_orderbook(books: List[Tuple[str, Orderbook]]):
+    """k 路归并各交易所 (交易对名称, 订单簿) 到 MERGE_ORDERBOOK_DEPTH 档，返回 (合并订单簿, messages)"""
     groups = []
-    for exchange_name, symbols in symbols_dict.items():
-        try:
-            ob = get_orderbook(exchange_name, symbols[0])
-        except OrderbookNotFound:
-            continue
+    bid_sides, ask_sides = [], []
+    for symbol_name, ob in books:
         groups.append({
-            'symbol': symbols[0],
+            'symbol': symbol_name,
             'timestamp': ob.timestamp,
             'source': ob.source,
             'exchange': ob.exchange,
             'detail': ob.as_json()
         })
-        orderbook.bids = merge_order_list(orderbook.bids, ob.bids, reverse=True)
-        orderbook.asks = merge_order_list(orderbook.asks, ob.asks)
+        bid_sides.append(ob.bids)
+        ask_sides.append(ob.asks)
+    orderbook = Orderbook()
+    # 各交易所订单簿已按价格排序，k 路归并到 MERGE_ORDERBOOK_DEPTH 档即停止
+    orderbook.bids = merge_sorted_sides(bid_sides, reverse=True, depth=MERGE_ORDERBOOK_DEPTH)
+    orderbook.asks = merge_sorted_sides(ask_sides, depth=MERGE_ORDERBOOK_DEPTH)
     messages = {
         'groups': groups,
         'bids': [bid.as_json() for bid in orderbook.bids],
@@ -322,6 +393,28 @@ def merge_usds_orderbooks(symbol: TradingPair):
     return orderbook, messages
 
 
+def merge_usds_orderbooks(symbol: TradingPair):
+    symbols_dict = settings.EXCHANGE_FUTURES_SYMBOLS[symbol.quote_asset.name]
+
+    # TODO: what if symbols_dict is empty
+    books = []
+    for exchange_name, symbols in symbols_dict.items():
+        try:
+            ob = get_orderbook(exchange_name, symbols[0])
+        except OrderbookNotFound:
+            continue
+        books.append((symbols[0], ob))
+    return build_merged_orderbook(books)
+
+
+def merge_source_symbols(symbol: TradingPair) -> Set[str]:
+    """合并该交易对时读取的各交易所订单簿的交易对名称，用于判断是否需要重新合并"""
+    if symbol.symbol_display in ['BTC/USDS', 'ETH/USDS']:
+        symbols_dict = settings.EXCHANGE_FUTURES_SYMBOLS[symbol.quote_asset.name]
+        return {symbols[0] for symbols in symbols_dict.values()}
+    return {symbol.symbol_display}
+
+
 async def merge_orderbooks(symbol: TradingPair):
     if symbol.symbol_display in ['BTC/USDS', 'ETH/USDS']:
         orderbook, messages = merge_usds_orderbooks(symbol)
@@ -330,61 +423,34 @@ async def merge_orderbooks(symbol: TradingPair):
     save_merged_ob(symbol, orderbook, messages)
 
 
-SPOT_EXG: Dict[str, Tuple[List, int]] = {}
-SPOT_EXG_UPDATE_INTERVAL = 60
-
-
-async def merge_usdt_orderbooks(symbol: TradingPair):
-    global SPOT_EXG, SPOT_EXG_UPDATE_INTERVAL
-
-    @sync_to_async
-    def get_active_cex_exchanges(sym):
-        return list(sym.exchanges.filter(market_type="Cex", status="Active")[:])
-
-    if symbol.symbol_display not in SPOT_EXG or SPOT_EXG[symbol.symbol_display][1] + SPOT_EXG_UPDATE_INTERVAL < time.time():
-        exchanges = await get_active_cex_exchanges(symbol)
-        last_update = int(time.time())
-        SPOT_EXG[symbol.symbol_display] = exchanges, last_update
-
-    groups = []
-    orderbook = Orderbook()
-
+async def get_merge_exchange_names(symbol: TradingPair) -> Optional[List[str]]:
+    """参与合并的现货交易所名称，交易对不在 MERGE_SYMBOL_CONFIG 中时返回 None。读取元数据缓存，不访问数据库"""
     try:
-        exchange_names = list(settings.MERGE_SYMBOL_CONFIG[symbol.symbol_display].keys())
+        exchange_names = settings.MERGE_SYMBOL_CONFIG[symbol.symbol_display].keys()
     except KeyError:
         logger.warning(f"Symbol {symbol.symbol_display} not found in MERGE_SYMBOL_CONFIG. Skipping merge.")
-        return orderbook, {}  # Return empty orderbook and messages
+        return None
 
-    @sync_to_async
-    def get_filtered_exchanges(sym, names):
-        return list(sym.exchanges.filter(market_type="Cex", status="Active", name__in=names))
+    snapshot = await metadata_cache.aget()
+    return [exchange.name for exchange in snapshot.spot_exchanges(symbol.id) if exchange.name in exchange_names]
 
-    filtered_exchanges = await get_filtered_exchanges(symbol, exchange_names)
-    for exchange in filtered_exchanges:
+
+async def merge_usdt_orderbooks(symbol: TradingPair):
+    exchange_names = await get_merge_exchange_names(symbol)
+    if exchange_names is None:
+        return Orderbook(), {}  # Return empty orderbook and messages
+
+    books = []
+    for exchange_name in exchange_names:
         try:
-            ob = get_orderbook(exchange.name, symbol.symbol_display)
+            ob = get_orderbook(exchange_name, symbol.symbol_display)
         except OrderbookNotFound:
-            logger.warning(f"Orderbook not found for {exchange.name} {symbol.symbol_display}. Skipping.")
+            logger.warning(f"Orderbook not found for {exchange_name} {symbol.symbol_display}. Skipping.")
             continue
 
         if symbol.category == "Spot":
-            groups.append({
-                'symbol': symbol.symbol_display,
-                'timestamp': ob.timestamp,
-                'source': ob.source,
-                'exchange': ob.exchange,
-                'detail': ob.as_json()
-            })
-            orderbook.bids = merge_order_list(orderbook.bids, ob.bids, reverse=True)
-            orderbook.asks = merge_order_list(orderbook.asks, ob.asks)
-    messages = {
-        'groups': groups,
-        'bids': [bid.as_json() for bid in orderbook.bids],
-        'asks': [ask.as_json() for ask in orderbook.asks],
-        'asks_hidden': 0,
-        'bids_hidden': 0,
-    }
-    return orderbook, messages
+            books.append((symbol.symbol_display, ob))
+    return build_merged_orderbook(books)
 
 
 def set_ohlcv(exchange_name, symbol_name, timeframe, data: list) -> None:
@@ -396,10 +462,10 @@ def set_ohlcv(exchange_name, symbol_name, timeframe, data: list) -> None:
         timeframe: 时间周期 (1min, 30m, 1h, 1d, 1w, 1month, 3months, 12months)
         data: K线数据列表 [[timestamp, open, high, low, close, volume], ...]
     """
-    key = f'{exchange_name}:{symbol_name}:ohlcv:{timeframe}'
+    key = EXCHANGE_OHLCV_KEY % (exchange_name, symbol_name, timeframe)
     global_redis().set(key, json.dumps(data))
     # 设置30分钟过期时间
-    global_redis().expire(key, 1800)
+    global_redis().expire(key, EXCHANGE_OHLCV_TTL)
 
 
 def get_ohlcv(exchange_name, symbol_name, timeframe) -> Optional[list]:
@@ -413,7 +479,7 @@ def get_ohlcv(exchange_name, symbol_name, timeframe) -> Optional[list]:
     Returns:
         K线数据列表 [[timestamp, open, high, low, close, volume], ...]
     """
-    key = f'{exchange_name}:{symbol_name}:ohlcv:{timeframe}'
+    key = EXCHANGE_OHLCV_KEY % (exchange_name, symbol_name, timeframe)
     data = global_redis().get(key)
     if data:
         return json.loads(data)
@@ -428,10 +494,10 @@ def set_market_data(exchange_name, symbol_name, data: dict) -> None:
         symbol_name: 交易对名称
         data: 市场数据字典，包含价格、涨幅、交易量等
     """
-    key = f'{exchange_name}:{symbol_name}:market_data'
+    key = EXCHANGE_MARKET_DATA_KEY % (exchange_name, symbol_name)
     global_redis().set(key, json.dumps(data))
     # 设置5分钟过期时间
-    global_redis().expire(key, 300)
+    global_redis().expire(key, EXCHANGE_MARKET_DATA_TTL)
 
 
 def get_market_data(exchange_name, symbol_name) -> Optional[dict]:
@@ -444,7 +510,7 @@ def get_market_data(exchange_name, symbol_name) -> Optional[dict]:
     Returns:
         市场数据字典
     """
-    key = f'{exchange_name}:{symbol_name}:market_data'
+    key = EXCHANGE_MARKET_DATA_KEY % (exchange_name, symbol_name)
     data = global_redis().get(key)
     if data:
         return json.loads(data)
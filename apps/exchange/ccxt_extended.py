@@ -13,7 +13,7 @@ from common.helpers import getLogger
 from common.decorators import retry_on
 from apps.exchange import ccxt_client
 from apps.exchange.models import TradingPair
-from apps.exchange.cache_ops import set_ohlcv, set_market_data
+from apps.exchange.async_cache_ops import aset_ohlcv, aset_market_data
 
 logger = getLogger(__name__)
 
@@ -64,7 +64,7 @@ class CCXTExtendedClient:
         try:
             ohlcv = await self.client.fetch_ohlcv(symbol_name, timeframe)
             normalized_timeframe = TIMEFRAMES.get(timeframe, timeframe)
-            set_ohlcv(self.exchange_name, symbol_name, normalized_timeframe, ohlcv)
+            await aset_ohlcv(self.exchange_name, symbol_name, normalized_timeframe, ohlcv)
             return ohlcv
         except Exception as e:
             self.logger.error(f"Error fetching OHLCV for {symbol_name} with timeframe {timeframe}", exc_info=True)
@@ -96,7 +96,7 @@ class CCXTExtendedClient:
             }
             
             # 存储市场数据
-            set_market_data(self.exchange_name, symbol_name, market_data)
+            await aset_market_data(self.exchange_name, symbol_name, market_data)
             return market_data
         except Exception as e:
             self.logger.error(f"Error fetching market data for {symbol_name}", exc_info=True)
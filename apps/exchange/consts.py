@@ -16,6 +16,19 @@ HIST_VOLA_KEY = 'crawler:%s:histvolatilti'
 
 SYMBOL_MERGE_ORDERBOOKS_KEY = 'crawler:%s:merge_orderbooks'
 NRDS_SYMBOL_MERGE_ORDERBOOKS_KEY = 'new:redis:crawler:%s:merge_orderbooks'
+# 各历史 ZSET 对应的最新快照指针，由追加脚本与 ZSET 同步写入，读取最新数据为 O(1)
+NRDS_LATEST_KEY = '%s:latest'
+# SET: 最新订单簿有更新、等待重新合并的交易对，由订单簿写入脚本添加，合并任务取走
+NRDS_DIRTY_ORDERBOOKS_KEY = 'new:redis:crawler:orderbooks:dirty'
+EXCHANGE_HISTORY_WINDOW = 1200  # 历史快照保留的时间窗口（秒）
+EXCHANGE_HISTORY_MAX_LENGTH = 600  # 每个 (交易所, 交易对) 历史快照的最大条数，按 3 秒抓取间隔覆盖整个时间窗口
+EXCHANGE_HISTORY_CODEC = getattr(settings, 'EXCHANGE_HISTORY_CODEC', 'binary')  # 订单簿/ticker快照写入编码：binary 或 json（回滚用）
+MERGE_ORDERBOOK_DEPTH = 15  # 合并订单簿每侧输出的档位数，与 crawler_fetch_orderbooks 的默认抓取深度一致
+
+EXCHANGE_OHLCV_KEY = '%s:%s:ohlcv:%s'  # 交易所:交易对:ohlcv:周期
+EXCHANGE_OHLCV_TTL = 1800
+EXCHANGE_MARKET_DATA_KEY = '%s:%s:market_data'
+EXCHANGE_MARKET_DATA_TTL = 300
 
 SYMBOL_PRICE_KEY = 'crawler:%s:%s:price'
 API_RESPONSE_KEY = 'crawler:%s:api_name'
@@ -29,25 +42,44 @@ SLEEP_CONFIG = {
     "crawler_fetch_orderbooks": 3,
     "crawler_merge_orderbooks": 2
 }
+CRAWLER_MERGE_MAX_INTERVAL = 60  # 没有订单簿更新时，合并订单簿最长多久强制重新合并一次（秒）
 
 SLEEP_CONFIG.update(settings.CRAWLER_SLEEP_CONFIG)
 
+# 爬虫按交易对并发抓取：上述间隔为每个交易对的刷新周期（从本轮开始计）
+CRAWLER_START_SPREAD = 0.5  # 各交易对的启动偏移在周期前多大比例内随机分布
+CRAWLER_BACKOFF_MAX_CYCLES = 10  # 连续失败的交易对最多跳过的轮数
+CRAWLER_STALE_CYCLES = 3  # 超过多少个周期未成功更新的交易对记为过期并告警
+CRAWLER_MAX_CONCURRENCY = {  # 爬虫对同一交易所同时进行中的订单簿/ticker请求数，按交易所 slug 配置
+    'default': 4,
+    'binance': 8,
+    'okx': 8,
+    'bybit': 8,
+}
+
 EXCHANGE_FUNDING_RATE_KEY = 'crawler:funding_rate:%s'
 
 # 稳定币监控相关常量
-STABLECOIN_PRICE_KEY = 'stablecoin:price:%s'
+STABLECOIN_PRICE_KEY = 'stablecoin:price:%s'  # 旧版按交易对存储的价格键，仅用于兼容读取
+STABLECOIN_PRICES_KEY = 'stablecoin:prices'  # Hash: 交易对 -> 价格JSON
+STABLECOIN_PRICES_UPDATED_KEY = 'stablecoin:prices:updated'  # ZSET: 交易对，分数为最近更新时间（毫秒）
 STABLECOIN_LAST_UPDATE_KEY = 'stablecoin:last_update:%s'
 
 # 稳定币监控间隔和过期时间（秒）
 STABLECOIN_PRICE_MONITOR_INTERVAL = 600  # 每60秒更新一次
 STABLECOIN_PRICE_EXPIRE_TIME = 300  # 数据5分钟过期
 
+# WebSocket 流式行情（watch_tickers）配置
+STABLECOIN_STREAM_FLUSH_INTERVAL = 2  # 合并后的价格写入Redis的间隔（秒）
+STABLECOIN_STREAM_SYMBOLS_PER_WATCH = 100  # 每个 watch_tickers 订阅包含的交易对数量上限
+
 # 重试配置
 STABLECOIN_MAX_RETRIES = 3
 STABLECOIN_RETRY_DELAY = 5  # 秒
 
 # 批处理大小
 STABLECOIN_DB_BATCH_SIZE = 500  # 数据库批处理大小
+STABLECOIN_CNY_RATE_CACHE_TTL = 300  # CNY汇率进程内缓存时间（秒）
 REDIS_PIPELINE_BATCH_SIZE = 1000  # Redis批处理大小
 
 # 交易所批处理大小 - 根据不同交易所API限制优化
@@ -71,6 +103,18 @@ EXCHANGE_TICKERS_BATCH_SIZE = {
     'yobit': 400
 }
 
+# 交易所并发请求上限 - 同一交易所同时进行中的行情请求数
+EXCHANGE_TICKERS_MAX_CONCURRENCY = {
+    'default': 4,
+    'binance': 8,
+    'okx': 8,
+    'bybit': 8,
+    'lbank': 2,
+    'yobit': 1,
+}
+EXCHANGE_RATE_LIMIT_BURST = 5  # 令牌桶容量：按 CCXT rateLimit 恢复令牌，允许的突发请求数
+EXCHANGE_RATE_LIMIT_DEFAULT_MS = 2000  # 客户端未提供 rateLimit 时的请求间隔（毫秒），与 CCXT 默认值一致
+
 # 交易所特殊配置
 EXCHANGE_SPECIAL_CONFIG = {
     'yobit': {
@@ -137,6 +181,11 @@ EXCHANGE_PRIORITY = [
 ]
 
 EXCHANGE_BLOCKING = 'exchange:%s:%s'
+
+# 交易所/交易对/市场元数据进程内缓存（apps.exchange.metadata_cache）
+METADATA_VERSION_KEY = 'exchange:metadata:version'
+METADATA_INVALIDATE_CHANNEL = 'exchange:metadata:invalidate'
+METADATA_CACHE_CHECK_INTERVAL = 60  # 兜底：漏掉失效消息时，最长多久主动比对一次版本号（秒）
 EXCHANGE_SYMBOL_MARKETS = 'exchange_markets:%s'  # 'exchange_markets:bitmex'
 
 PENALTY_UNFINISHED_ORDERS = 'penalty_unfinished_orders'
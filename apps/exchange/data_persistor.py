@@ -2,27 +2,77 @@ import json
 import time
 from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import redis.asyncio as aioredis
 from asgiref.sync import sync_to_async
 from django.conf import settings  # Added for REDIS_URL
+from django.db import connection, transaction
 
 from apps.backoffice.models import MgObPersistence, ExchangeRate
 from common.helpers import getLogger
 from common.redis_client import get_async_redis_client
 from apps.exchange.consts import (
     STABLECOIN_PRICE_KEY,
+    STABLECOIN_PRICES_KEY,
+    STABLECOIN_PRICES_UPDATED_KEY,
     STABLECOIN_LAST_UPDATE_KEY,
     REDIS_PIPELINE_BATCH_SIZE,
     STABLECOIN_PRICE_EXPIRE_TIME,  # For Redis key expiration
+    STABLECOIN_DB_BATCH_SIZE,
+    STABLECOIN_CNY_RATE_CACHE_TTL,
     STABLECOIN_SYMBOLS  # 导入稳定币符号列表
 )
 from apps.exchange.data_structures import PriceUpdateInfo
+from apps.exchange.metadata_cache import bump_metadata_version_on_commit
 from apps.exchange.models import Asset, Market, TradingPair, Exchange
 
 logger = getLogger(__name__)
 
+# 写入一批价格：HSET 价格哈希，并以 Redis 服务器时间（毫秒）作为更新时间写入更新时间 ZSET。
+# 脚本原子执行，同一毫秒内先后写入的字段分数相同，读取端的游标按闭区间处理。
+# KEYS: 价格哈希, 更新时间ZSET; ARGV: pair1, json1, pair2, json2, ...
+WRITE_PRICES_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+for i = 1, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    redis.call('ZADD', KEYS[2], now, ARGV[i])
+end
+return now
+"""
+
+# 读取更新时间不早于游标的价格，同时删除超过有效期的字段；返回 {读取时刻(毫秒), 交易对列表, 价格JSON列表}
+# KEYS: 价格哈希, 更新时间ZSET; ARGV: 游标(毫秒，0表示全部), 有效期(毫秒)
+READ_PRICES_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local oldest = now - tonumber(ARGV[2])
+local function chunked(command, key, members)
+    local result = {}
+    for i = 1, #members, 1000 do
+        local part = redis.call(command, key, unpack(members, i, math.min(i + 999, #members)))
+        if type(part) == 'table' then
+            for _, value in ipairs(part) do
+                result[#result + 1] = value
+            end
+        end
+    end
+    return result
+end
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. oldest)
+if #stale > 0 then
+    chunked('HDEL', KEYS[1], stale)
+    chunked('ZREM', KEYS[2], stale)
+end
+local fields = redis.call('ZRANGEBYSCORE', KEYS[2], math.max(tonumber(ARGV[1]), oldest), '+inf')
+local values = {}
+if #fields > 0 then
+    values = chunked('HMGET', KEYS[1], fields)
+end
+return {now, fields, values}
+"""
+
 
 class RedisDataPersistor:
     """Redis数据持久化类，负责将价格数据更新到Redis"""
@@ -62,16 +112,16 @@ class RedisDataPersistor:
         for pu in price_updates:
             updates_by_exchange.setdefault(pu.source_exchange_id, []).append(pu)
 
-        pipeline = client.pipeline()
+        pipeline = client.pipeline(transaction=False)
         redis_update_count = 0
+        update_time = datetime.now(dt_timezone.utc).timestamp()
 
         try:
-            # 处理价格更新
+            # 所有交易对写入同一个价格哈希，每 REDIS_PIPELINE_BATCH_SIZE 个交易对一次脚本调用，整体一次往返
+            batch_args = []
             for exchange_id, ex_updates in updates_by_exchange.items():
                 for price_info in ex_updates:
                     pair_def = price_info.pair_def
-                    redis_key = STABLECOIN_PRICE_KEY % pair_def.raw_pair_string
-
                     data_to_store = {
                         'price': price_info.price,
                         'symbol': pair_def.identifier.base_asset,
@@ -81,42 +131,43 @@ class RedisDataPersistor:
                         'exchange_symbol': pair_def.exchange_symbol,
                         'timestamp': price_info.timestamp.isoformat(),
                     }
-
-                    await pipeline.set(redis_key, json.dumps(data_to_store), ex=STABLECOIN_PRICE_EXPIRE_TIME)
+                    batch_args.extend([pair_def.raw_pair_string, json.dumps(data_to_store)])
                     redis_update_count += 1
 
-                    # 定期执行pipeline
-                    if redis_update_count % REDIS_PIPELINE_BATCH_SIZE == 0:
-                        await pipeline.execute()
-                        pipeline = client.pipeline()
+                    if len(batch_args) >= REDIS_PIPELINE_BATCH_SIZE * 2:
+                        pipeline.eval(WRITE_PRICES_SCRIPT, 2, STABLECOIN_PRICES_KEY, STABLECOIN_PRICES_UPDATED_KEY,
+                                      *batch_args)
+                        batch_args = []
 
                 # 更新交易所最后更新时间
-                await pipeline.set(
-                    STABLECOIN_LAST_UPDATE_KEY % exchange_id,
-                    datetime.now(dt_timezone.utc).timestamp(),
-                    ex=STABLECOIN_PRICE_EXPIRE_TIME * 2
-                )
+                pipeline.set(STABLECOIN_LAST_UPDATE_KEY % exchange_id, update_time, ex=STABLECOIN_PRICE_EXPIRE_TIME * 2)
 
-            # 执行剩余命令
-            if pipeline.command_stack:
-                await pipeline.execute()
+            if batch_args:
+                pipeline.eval(WRITE_PRICES_SCRIPT, 2, STABLECOIN_PRICES_KEY, STABLECOIN_PRICES_UPDATED_KEY, *batch_args)
+            await pipeline.execute()
 
             logger.info(
-                f"RedisDataPersistor: 成功更新{redis_update_count}个价格键和{len(updates_by_exchange)}个交易所最后更新时间")
+                f"RedisDataPersistor: 成功更新{redis_update_count}个价格和{len(updates_by_exchange)}个交易所最后更新时间")
 
         except Exception as e:
             logger.error(f"RedisDataPersistor: Redis批量更新出错: {e}", exc_info=True)
 
     async def get_price(self, pair_string: str) -> Optional[dict]:
-        """从Redis获取价格数据"""
+        """从Redis获取价格数据，价格哈希中没有时读取旧版按交易对存储的键"""
         client = await self._get_redis_client()
         if not client:
             logger.warning("RedisDataPersistor: Redis客户端不可用，无法获取价格")
             return None
 
         try:
-            redis_key = STABLECOIN_PRICE_KEY % pair_string
-            price_data = await client.get(redis_key)
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hget(STABLECOIN_PRICES_KEY, pair_string)
+            pipeline.zscore(STABLECOIN_PRICES_UPDATED_KEY, pair_string)
+            pipeline.get(STABLECOIN_PRICE_KEY % pair_string)
+            price_data, updated_ms, legacy_data = await pipeline.execute()
+            if price_data and updated_ms and time.time() * 1000 - updated_ms > STABLECOIN_PRICE_EXPIRE_TIME * 1000:
+                price_data = None  # 已过期，等待下次读取全部价格时清理
+            price_data = price_data or legacy_data
             if price_data:
                 # 处理data可能是字节或字符串的情况
                 data_str = price_data.decode() if isinstance(price_data, bytes) else price_data
@@ -126,8 +177,43 @@ class RedisDataPersistor:
             logger.error(f"RedisDataPersistor: 从Redis获取价格数据失败: {e}", exc_info=True)
             return None
 
+    async def get_prices_since(self, cursor: int = 0) -> Tuple[Dict[str, dict], int]:
+        """
+        一次往返读取更新时间不早于 cursor（毫秒，Redis服务器时间）的价格，并清理过期字段。
+
+        Returns:
+            (交易对 -> 价格数据, 下一次调用使用的游标)；cursor 为0时返回全部未过期价格，
+            价格哈希为空时读取旧版按交易对存储的键。游标为闭区间，边界上的价格可能在下一次调用中重复返回。
+        """
+        client = await self._get_redis_client()
+        if not client:
+            logger.warning("RedisDataPersistor: Redis客户端不可用，无法获取价格")
+            return {}, cursor
+
+        read_at, fields, values = await client.eval(
+            READ_PRICES_SCRIPT, 2, STABLECOIN_PRICES_KEY, STABLECOIN_PRICES_UPDATED_KEY,
+            cursor, STABLECOIN_PRICE_EXPIRE_TIME * 1000)
+        result = {}
+        for pair, data in zip(fields, values):
+            if data:
+                pair_str = pair.decode() if isinstance(pair, bytes) else pair
+                data_str = data.decode() if isinstance(data, bytes) else data
+                result[pair_str] = json.loads(data_str)
+        if not result and not cursor:
+            result = await self._get_all_legacy_prices()
+        return result, int(read_at)
+
     async def get_all_prices(self) -> Dict[str, dict]:
-        """从Redis获取所有价格数据"""
+        """从Redis获取所有未过期的价格数据"""
+        try:
+            result, _ = await self.get_prices_since(0)
+            return result
+        except Exception as e:
+            logger.error(f"RedisDataPersistor: 从Redis获取所有价格数据失败: {e}", exc_info=True)
+            return {}
+
+    async def _get_all_legacy_prices(self) -> Dict[str, dict]:
+        """读取旧版按交易对存储的价格键（stablecoin:price:*），用于升级期间兼容"""
         client = await self._get_redis_client()
         if not client:
             logger.warning("RedisDataPersistor: Redis客户端不可用，无法获取价格")
@@ -170,6 +256,56 @@ class DatabasePersistor:
 
     def __init__(self):
         logger.info("DatabasePersistor: 初始化数据库持久化组件")
+        self._cny_rate: Optional[Decimal] = None
+        self._cny_rate_expires_at = 0.0
+
+    @sync_to_async
+    def _get_cny_rate_sync(self) -> Optional[Decimal]:
+        """查询最新的USD/CNY汇率，查询失败或没有记录时返回None"""
+        try:
+            rate = ExchangeRate.objects.filter(base_currency='USD', quote_currency='CNY').order_by(
+                '-updated_at').first()
+            return rate.rate if rate else None
+        except Exception as e:
+            logger.error(f"获取CNY汇率时出错: {e}")
+            return None
+
+    async def get_cny_rate(self) -> Decimal:
+        """获取CNY汇率，查询结果在进程内缓存 STABLECOIN_CNY_RATE_CACHE_TTL 秒"""
+        if self._cny_rate is not None and time.time() < self._cny_rate_expires_at:
+            return self._cny_rate
+        rate = await self._get_cny_rate_sync()
+        if rate is None:
+            logger.warning("无法获取CNY汇率，将使用默认值7.0")
+            return Decimal('7.0')  # 默认汇率，不缓存，下次调用重新查询
+        self._cny_rate = rate
+        self._cny_rate_expires_at = time.time() + STABLECOIN_CNY_RATE_CACHE_TTL
+        return rate
+
+    @staticmethod
+    def _bulk_update_mgob_sync(updates: List[Dict]) -> int:
+        """
+        以 UPDATE ... FROM (VALUES ...) 按 STABLECOIN_DB_BATCH_SIZE 分块批量更新价格，
+        每块一条语句同时写入买/卖/均价与USD、CNY价格；usd_price 为 None 的行保留原有的USD、CNY价格。
+        """
+        table = connection.ops.quote_name(MgObPersistence._meta.db_table)
+        updated = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            for i in range(0, len(updates), STABLECOIN_DB_BATCH_SIZE):
+                chunk = updates[i:i + STABLECOIN_DB_BATCH_SIZE]
+                values_sql = ", ".join(["(%s::bigint, %s::numeric, %s::numeric, %s::numeric)"] * len(chunk))
+                params = []
+                for update in chunk:
+                    params.extend([update['id'], update['avg_price'], update['usd_price'], update['cny_price']])
+                cursor.execute(
+                    f"UPDATE {table} AS m SET avg_price = v.price, buy_price = v.price, sell_price = v.price, "
+                    f"usd_price = COALESCE(v.usd_price, m.usd_price), cny_price = COALESCE(v.cny_price, m.cny_price), "
+                    f"updated_at = NOW() "
+                    f"FROM (VALUES {values_sql}) AS v(id, price, usd_price, cny_price) WHERE m.id = v.id",
+                    params
+                )
+                updated += cursor.rowcount
+        return updated
 
     @sync_to_async(thread_sensitive=True)
     def _get_assets_sync(self, symbols: List[str]) -> Dict[str, Asset]:
@@ -197,22 +333,7 @@ class DatabasePersistor:
         logger.info(f"DatabasePersistor: 正在更新{len(price_updates)}条价格记录到MgObPersistence表")
 
         # 1. 获取CNY汇率
-        @sync_to_async
-        def get_cny_rate():
-            try:
-                # 获取最新的CNY汇率
-                rate = ExchangeRate.objects.filter(base_currency='USD', quote_currency='CNY').order_by(
-                    '-updated_at').first()
-                if rate:
-                    return rate.rate
-                else:
-                    logger.warning("无法获取CNY汇率，将使用默认值7.0")
-                    return Decimal('7.0')  # 默认汇率，如果无法获取
-            except Exception as e:
-                logger.error(f"获取CNY汇率时出错: {e}")
-                return Decimal('7.0')  # 默认汇率
-
-        cny_rate = await get_cny_rate()
+        cny_rate = await self.get_cny_rate()
         logger.info(f"当前CNY汇率: {cny_rate}")
 
         # 2. 收集所有需要的交易所ID
@@ -284,6 +405,8 @@ class DatabasePersistor:
                 ])
                 for asset in new_assets:
                     existing_assets[asset.symbol.upper()] = asset
+                # bulk_create 不触发 post_save，需要手动让元数据缓存失效
+                bump_metadata_version_on_commit('Asset.bulk_create')
 
             return existing_assets
 
@@ -365,6 +488,7 @@ class DatabasePersistor:
             if trading_pairs_to_create:
                 try:
                     created_pairs = TradingPair.objects.bulk_create(trading_pairs_to_create)
+                    bump_metadata_version_on_commit('TradingPair.bulk_create')
                     # 更新引用
                     for i, tp in enumerate(created_pairs):
                         original = trading_pairs_to_create[i]
@@ -451,37 +575,8 @@ class DatabasePersistor:
             # 批量更新记录
             if all_mgob_updates:
                 try:
-                    from django.db import connection
-
-                    with connection.cursor() as cursor:
-                        cursor.execute("BEGIN")
-                        try:
-                            for update in all_mgob_updates:
-                                cursor.execute(
-                                    "UPDATE backoffice_mgobpersistence SET avg_price = %s, buy_price = %s, sell_price = %s, updated_at = NOW() WHERE id = %s",
-                                    [update['avg_price'], update['buy_price'], update['sell_price'], update['id']]
-                                )
-
-                                # 更新USD价格
-                                if update.get('usd_price') is not None:
-                                    cursor.execute(
-                                        "UPDATE backoffice_mgobpersistence SET usd_price = %s WHERE id = %s",
-                                        [update['usd_price'], update['id']]
-                                    )
-
-                                    # 同时更新CNY价格 - 使用USD价格乘以汇率
-                                    cursor.execute(
-                                        "UPDATE backoffice_mgobpersistence SET cny_price = %s WHERE id = %s",
-                                        [Decimal(str(update['usd_price'])) * cny_rate if update[
-                                                                                             'usd_price'] is not None else None,
-                                         update['id']]
-                                    )
-                            cursor.execute("COMMIT")
-                            logger.info(f"更新{len(all_mgob_updates)}条价格记录")
-                        except Exception as e:
-                            cursor.execute("ROLLBACK")
-                            raise e
-
+                    updated = self._bulk_update_mgob_sync(all_mgob_updates)
+                    logger.info(f"更新{updated}条价格记录")
                     successful += len(all_mgob_updates)
                 except Exception as e:
                     logger.error(f"批量更新MgObPersistence记录失败: {e}")
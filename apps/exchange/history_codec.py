@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订单簿与 ticker 快照的 Redis 编码。
+
+写入端通过 EXCHANGE_HISTORY_CODEC 选择编码器；读取端按首字节识别格式，同时兼容旧的 JSON 快照，
+滚动升级期间新旧数据可以混合存在：
+  - '{'  JSON（旧格式 / json 编码器）
+  - 0x01 订单簿 v1：定长头 + 附加字段 JSON + 各档位的 (int64 尾数, int8 小数位数)
+  - 0x02 ticker v1：定长头 + 统一数值字段 float64 + 附加字段 JSON（不含交易所原始 info）
+"""
+import json
+import math
+import struct
+from typing import Any, Dict, List, Tuple, Union
+
+from apps.exchange.consts import EXCHANGE_HISTORY_CODEC
+from apps.exchange.types import Orderbook, OrderEntry, TICK_DECIMALS, to_ticks
+
+ORDERBOOK_V1 = 0x01
+TICKER_V1 = 0x02
+
+_ORDERBOOK_HEADER = struct.Struct('<BqHHH')  # version, timestamp(ms), n_bids, n_asks, extras_len
+_TICKER_HEADER = struct.Struct('<Bq')  # version, timestamp(ms)
+_EXTRAS_LEN = struct.Struct('<H')
+_EXTRAS_MAX = 0xFFFF
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+_POW10 = [10 ** i for i in range(TICK_DECIMALS + 1)]
+
+# ccxt 统一 ticker 中的数值字段，按固定顺序存为 float64，None 存为 NaN
+TICKER_NUMERIC_FIELDS = (
+    'high', 'low', 'bid', 'bidVolume', 'ask', 'askVolume', 'vwap', 'open', 'close', 'last',
+    'previousClose', 'change', 'percentage', 'average', 'baseVolume', 'quoteVolume',
+)
+_TICKER_VALUES = struct.Struct('<%dd' % len(TICKER_NUMERIC_FIELDS))
+_TICKER_NUMERIC_SET = frozenset(TICKER_NUMERIC_FIELDS)
+
+RawSnapshot = Union[bytes, str]
+
+
+def _dump_extras(extras: Dict[str, Any]) -> bytes:
+    return json.dumps(extras, separators=(',', ':')).encode() if extras else b''
+
+
+def _to_scaled(value: Any) -> Tuple[int, int]:
+    """转换为 (尾数, 小数位数)，与 to_ticks 一样向下取整到18位小数"""
+    text = value if isinstance(value, str) else repr(value)
+    if text[:1].isdigit() and 'e' not in text and 'E' not in text:
+        int_part, _, frac = text.partition('.')
+        frac = frac[:TICK_DECIMALS].rstrip('0')
+        try:
+            return int(int_part + frac), len(frac)
+        except ValueError:
+            pass
+    ticks, scale = to_ticks(value), TICK_DECIMALS
+    while scale and ticks % 10 == 0:
+        ticks //= 10
+        scale -= 1
+    return ticks, scale
+
+
+class JsonHistoryCodec:
+    """旧格式：JSON 字符串"""
+
+    def encode_orderbook(self, data: Dict[str, Any]) -> str:
+        return json.dumps(data)
+
+    def encode_ticker(self, data: Dict[str, Any]) -> str:
+        return json.dumps(data)
+
+
+class BinaryHistoryCodec:
+    """定长二进制格式，数值超出 int64 尾数范围时整条快照退回 JSON"""
+
+    def encode_orderbook(self, data: Dict[str, Any]) -> RawSnapshot:
+        bids, asks = data['bids'], data['asks']
+        mantissas: List[int] = []
+        scales: List[int] = []
+        for price, amount, *_ in (*bids, *asks):
+            for value in (price, amount):
+                mantissa, scale = _to_scaled(value)
+                if not _INT64_MIN <= mantissa <= _INT64_MAX:
+                    return json.dumps(data)
+                mantissas.append(mantissa)
+                scales.append(scale)
+
+        extras = _dump_extras({k: v for k, v in data.items() if k not in ('timestamp', 'bids', 'asks')})
+        if len(extras) > _EXTRAS_MAX:
+            return json.dumps(data)
+        count = len(mantissas)
+        return b''.join((
+            _ORDERBOOK_HEADER.pack(ORDERBOOK_V1, int(data['timestamp']), len(bids), len(asks), len(extras)),
+            extras,
+            struct.pack('<%dq' % count, *mantissas),
+            struct.pack('<%db' % count, *scales),
+        ))
+
+    def encode_ticker(self, data: Dict[str, Any]) -> RawSnapshot:
+        values = []
+        extras = {}
+        for field in TICKER_NUMERIC_FIELDS:
+            value = data.get(field)
+            if value is None:
+                values.append(math.nan)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                values.append(float(value))
+            else:
+                values.append(math.nan)
+                extras[field] = value
+        # 交易所原始返回的 info 与统一字段重复，且占快照的大部分体积，不写入历史
+        extras.update({
+            k: v for k, v in data.items()
+            if k not in _TICKER_NUMERIC_SET and k not in ('timestamp', 'info')
+        })
+        extras_bytes = _dump_extras(extras)
+        if len(extras_bytes) > _EXTRAS_MAX:
+            return json.dumps(data)
+        return b''.join((
+            _TICKER_HEADER.pack(TICKER_V1, int(data['timestamp'])),
+            _TICKER_VALUES.pack(*values),
+            _EXTRAS_LEN.pack(len(extras_bytes)),
+            extras_bytes,
+        ))
+
+
+HISTORY_CODECS = {
+    'json': JsonHistoryCodec(),
+    'binary': BinaryHistoryCodec(),
+}
+
+
+def get_history_codec():
+    return HISTORY_CODECS[EXCHANGE_HISTORY_CODEC]
+
+
+def _is_json(raw: RawSnapshot) -> bool:
+    return isinstance(raw, str) or raw[:1] == b'{'
+
+
+def decode_orderbook(raw: RawSnapshot) -> Orderbook:
+    """解码订单簿快照，二进制格式直接构造整数刻度档位，不经过 JSON 和 Decimal"""
+    if _is_json(raw):
+        return Orderbook.from_json(json.loads(raw))
+
+    version, timestamp, n_bids, n_asks, extras_len = _ORDERBOOK_HEADER.unpack_from(raw)
+    if version != ORDERBOOK_V1:
+        raise ValueError(f"unsupported orderbook snapshot version {version}")
+    offset = _ORDERBOOK_HEADER.size
+    extras = json.loads(raw[offset:offset + extras_len]) if extras_len else {}
+    offset += extras_len
+    count = 2 * (n_bids + n_asks)
+    mantissas = struct.unpack_from('<%dq' % count, raw, offset)
+    scales = struct.unpack_from('<%db' % count, raw, offset + 8 * count)
+
+    pow10 = _POW10
+    entries = [
+        OrderEntry(mantissas[i] * pow10[TICK_DECIMALS - scales[i]],
+                   mantissas[i + 1] * pow10[TICK_DECIMALS - scales[i + 1]])
+        for i in range(0, count, 2)
+    ]
+    ob = Orderbook()
+    ob.timestamp = timestamp
+    ob.bids = entries[:n_bids]
+    ob.asks = entries[n_bids:]
+    ob.exchange = extras.get('exchange', '')
+    ob.nonce = extras.get('nonce')
+    ob.datetime = extras.get('datetime')
+    ob.source = extras.get('source')
+    return ob
+
+
+def decode_orderbook_timestamp(raw: RawSnapshot) -> Any:
+    """只读取订单簿快照的时间戳"""
+    if _is_json(raw):
+        return json.loads(raw).get('timestamp')
+    return _ORDERBOOK_HEADER.unpack_from(raw)[1]
+
+
+def decode_ticker(raw: RawSnapshot) -> Dict[str, Any]:
+    if _is_json(raw):
+        return json.loads(raw)
+
+    version, timestamp = _TICKER_HEADER.unpack_from(raw)
+    if version != TICKER_V1:
+        raise ValueError(f"unsupported ticker snapshot version {version}")
+    offset = _TICKER_HEADER.size
+    values = _TICKER_VALUES.unpack_from(raw, offset)
+    offset += _TICKER_VALUES.size
+    extras_len, = _EXTRAS_LEN.unpack_from(raw, offset)
+    offset += _EXTRAS_LEN.size
+
+    ticker: Dict[str, Any] = {'timestamp': timestamp}
+    ticker.update((field, None if math.isnan(value) else value) for field, value in zip(TICKER_NUMERIC_FIELDS, values))
+    if extras_len:
+        ticker.update(json.loads(raw[offset:offset + extras_len]))
+    return ticker
@@ -35,6 +35,12 @@ class Command(BaseCommand):
             default=STABLECOIN_PRICE_MONITOR_INTERVAL,
             help=f'默认监控间隔(秒)，默认值: {STABLECOIN_PRICE_MONITOR_INTERVAL}'
         )
+        parser.add_argument(
+            '--streaming',
+            dest='streaming',
+            action='store_true',
+            help='对支持 watch_tickers 的交易所使用 WebSocket 流式行情，不支持的交易所仍按间隔轮询'
+        )
 
     def handle(self, *args, **options):
         exclude_exchanges_cli = []
@@ -54,7 +60,8 @@ class Command(BaseCommand):
         orchestrator = StablecoinPriceServiceOrchestrator(
             exclude_exchanges_cli=exclude_exchanges_cli,
             only_exchanges_cli=only_exchanges_cli,
-            monitor_interval=monitor_interval
+            monitor_interval=monitor_interval,
+            streaming=options['streaming']
         )
 
         loop = asyncio.get_event_loop()
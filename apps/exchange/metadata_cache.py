@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易所 / 交易对 / 市场元数据的进程内缓存，供合并与抓取路径使用，稳定状态下不访问数据库。
+
+一致性依靠 Redis 中的版本号：
+  - 相关模型 post_save / post_delete 时（事务提交后）INCR 版本号并 PUBLISH 到失效频道；
+  - 每个进程在后台线程订阅该频道，收到更大的版本号后在下一次读取时重新加载；
+  - 订阅断开期间可能漏掉消息，因此每 METADATA_CACHE_CHECK_INTERVAL 秒还会主动比对一次版本号。
+
+注意：bulk_create / bulk_update / QuerySet.update() 等批量写入不会触发模型信号，
+修改 Asset / Exchange / TradingPair / Market 的批量写入方必须自行调用 bump_metadata_version_on_commit()。
+逐行 update_or_create 的同步任务应在 batched_metadata_bumps() 内执行，整次同步只递增一次版本号。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from common.helpers import getLogger
+from common.redis_client import async_local_redis, local_redis
+from apps.exchange.consts import (
+    METADATA_CACHE_CHECK_INTERVAL,
+    METADATA_INVALIDATE_CHANNEL,
+    METADATA_VERSION_KEY,
+)
+from apps.exchange.models import Asset, Exchange, ExchangeCate, Market, TradingPair
+
+logger = getLogger(__name__)
+
+
+class MetadataSnapshot:
+    """某个版本的元数据，加载后只读；市场对象上的 exchange / trading_pair 已指向快照内的实例"""
+
+    def __init__(self, version: int, exchanges: List[Exchange], trading_pairs: List[TradingPair],
+                 markets: List[Market]):
+        self.version = version
+        self.exchanges: Dict[int, Exchange] = {exchange.id: exchange for exchange in exchanges}
+        self.trading_pairs: Dict[int, TradingPair] = {pair.id: pair for pair in trading_pairs}
+        self.markets_by_pair: Dict[int, List[Market]] = {}
+        self.markets_by_exchange: Dict[int, List[Market]] = {}
+        for market in markets:
+            market.exchange = self.exchanges[market.exchange_id]
+            market.trading_pair = self.trading_pairs[market.trading_pair_id]
+            self.markets_by_pair.setdefault(market.trading_pair_id, []).append(market)
+            self.markets_by_exchange.setdefault(market.exchange_id, []).append(market)
+
+    def active_trading_pairs(self, symbol_displays=None) -> List[TradingPair]:
+        return [pair for pair in self.trading_pairs.values()
+                if pair.status == 'Active' and (symbol_displays is None or pair.symbol_display in symbol_displays)]
+
+    def exchange_trading_pairs(self, exchange_id: int) -> List[TradingPair]:
+        """在该交易所有市场的活跃交易对"""
+        return [market.trading_pair for market in self.markets_by_exchange.get(exchange_id, [])
+                if market.trading_pair.status == 'Active']
+
+    def spot_exchanges(self, trading_pair_id: int) -> List[Exchange]:
+        """上线了该交易对的活跃中心化交易所"""
+        return [market.exchange for market in self.markets_by_pair.get(trading_pair_id, [])
+                if market.exchange.exchange_category == ExchangeCate.CEX and market.exchange.is_active]
+
+
+class MetadataCache:
+    def __init__(self):
+        self._snapshot: Optional[MetadataSnapshot] = None
+        self._latest_version = 0  # 订阅或主动检查得到的最新版本号
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._subscriber = None
+
+    @staticmethod
+    def _redis_version() -> int:
+        return int(local_redis().get(METADATA_VERSION_KEY) or 0)
+
+    def _on_invalidate(self, message) -> None:
+        try:
+            self._latest_version = max(self._latest_version, int(message['data']))
+        except (TypeError, ValueError):
+            logger.warning(f"元数据失效消息格式错误: {message}")
+
+    def _subscribe(self) -> None:
+        if self._subscriber is not None:
+            return
+        try:
+            pubsub = local_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{METADATA_INVALIDATE_CHANNEL: self._on_invalidate})
+            self._subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception as e:
+            logger.warning(f"订阅元数据失效频道失败，仅依靠定期检查版本号: {e}")
+
+    def _version_check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < METADATA_CACHE_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        return True
+
+    def _is_stale(self) -> bool:
+        if self._snapshot is None:
+            return True
+        if self._version_check_due():
+            try:
+                self._latest_version = max(self._latest_version, self._redis_version())
+            except Exception as e:
+                logger.warning(f"读取元数据版本号失败，继续使用当前缓存: {e}")
+        return self._latest_version > self._snapshot.version
+
+    async def _ais_stale(self) -> bool:
+        """_is_stale 的异步版本，定期检查版本号时不阻塞事件循环"""
+        if self._snapshot is None:
+            return True
+        if self._version_check_due():
+            try:
+                version = await async_local_redis().get(METADATA_VERSION_KEY)
+                self._latest_version = max(self._latest_version, int(version or 0))
+            except Exception as e:
+                logger.warning(f"读取元数据版本号失败，继续使用当前缓存: {e}")
+        return self._latest_version > self._snapshot.version
+
+    def _load(self) -> MetadataSnapshot:
+        with self._lock:
+            if not self._is_stale():
+                return self._snapshot
+            self._subscribe()
+            # 先读版本号再查库：加载期间发生的修改会让版本号大于快照版本，下次读取时再次加载
+            version = self._redis_version()
+            snapshot = MetadataSnapshot(
+                version,
+                list(Exchange.objects.all()),
+                list(TradingPair.objects.select_related('base_asset', 'quote_asset')),
+                list(Market.objects.all()),
+            )
+            self._snapshot = snapshot
+            self._latest_version = max(self._latest_version, version)
+            self._checked_at = time.monotonic()
+            logger.info(f"元数据缓存已加载: 版本 {version}, {len(snapshot.exchanges)} 个交易所, "
+                        f"{len(snapshot.trading_pairs)} 个交易对")
+            return snapshot
+
+    def get(self) -> MetadataSnapshot:
+        if self._is_stale():
+            return self._load()
+        return self._snapshot
+
+    async def aget(self) -> MetadataSnapshot:
+        if await self._ais_stale():
+            return await sync_to_async(self._load)()
+        return self._snapshot
+
+
+metadata_cache = MetadataCache()
+
+
+def bump_metadata_version() -> int:
+    """递增元数据版本号并通知所有进程"""
+    r = local_redis()
+    version = r.incr(METADATA_VERSION_KEY)
+    r.publish(METADATA_INVALIDATE_CHANNEL, version)
+    return version
+
+
+# batched_metadata_bumps() 期间收集到的变更来源；为 None 时每次变更都单独递增版本号
+_batched_sources: ContextVar[Optional[Set[str]]] = ContextVar('metadata_batched_sources', default=None)
+
+
+@contextmanager
+def batched_metadata_bumps():
+    """
+    把上下文内的元数据变更（模型信号与 bump_metadata_version_on_commit）合并为退出时的一次版本号递增。
+    update_or_create 即使没有变化也会保存并触发信号，逐行递增会让所有进程几乎每次读取都重新加载元数据。
+    需在同步代码中、事务之外进入；上下文内的 asyncio.run / sync_to_async 会继承该上下文。
+    """
+    sources = set()
+    token = _batched_sources.set(sources)
+    try:
+        yield
+    finally:
+        _batched_sources.reset(token)
+        if sources:
+            bump_metadata_version_on_commit(', '.join(sorted(sources)))
+
+
+def bump_metadata_version_on_commit(source: str) -> None:
+    """当前事务提交后递增元数据版本号（不在事务中时立即执行），失败只记录日志"""
+    sources = _batched_sources.get()
+    if sources is not None:
+        sources.add(source)
+        return
+
+    def bump():
+        try:
+            bump_metadata_version()
+        except Exception as e:
+            logger.error(f"{source} 变更后更新元数据版本号失败: {e}")
+
+    transaction.on_commit(bump)
+
+
+def _on_metadata_changed(sender, **kwargs) -> None:
+    bump_metadata_version_on_commit(sender.__name__)
+
+
+def connect_signals() -> None:
+    for model in (Asset, Exchange, TradingPair, Market):
+        post_save.connect(_on_metadata_changed, sender=model, dispatch_uid=f'metadata_cache_save_{model.__name__}')
+        post_delete.connect(_on_metadata_changed, sender=model, dispatch_uid=f'metadata_cache_delete_{model.__name__}')
@@ -1,17 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pickle
-import time
-from typing import Optional
-
 from django.db import models
 from django.db.models import Q, UniqueConstraint, JSONField
 from django.utils.translation import gettext_lazy as _
 
 from common.helpers import getLogger
 from common.models import BaseModel
-from common.redis_client import local_redis
 
 logger = getLogger(__name__)
 
@@ -46,29 +41,6 @@ class MarketStatusChoices(models.TextChoices):
     PRE_LAUNCH = 'PreLaunch', '预上线'
 
 
-class CacheManager(models.Manager):
-    def filter(self, *args, expire: Optional[int] = None, **kwargs):
-        if not expire:
-            return super().filter(*args, **kwargs)
-        r = local_redis()
-        sub_keys = ",".join(f"{k}={v}" for k, v in kwargs.items())
-        try:
-            pickle_data = r.get(sub_keys)
-            assert pickle_data, f'{self} did not get pickle data by {sub_keys} '
-            json_data = pickle.loads(pickle_data)
-            res = json_data['data']
-        except:
-            res = super().filter(*args, **kwargs)
-            json_data = {'timestamp': time.time(), 'data': res.all()[:]}
-            pickle_data = pickle.dumps(json_data)
-            if len(pickle_data) < 5E7:
-                r.set(sub_keys, pickle_data, ex=expire)
-            else:
-                logger.warning(f'Cache too large for query {sub_keys}')
-        finally:
-            return res
-
-
 class Asset(BaseModel):
     symbol = models.CharField(
         max_length=50,
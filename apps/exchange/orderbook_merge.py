@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+from operator import attrgetter
+from typing import Iterable, List, Optional, Sequence
+
+from apps.exchange.types import OrderEntry
+
+_price_ticks = attrgetter('price_ticks')
+
+
+def merge_sorted_sides(
+        sides: Iterable[Sequence[OrderEntry]], reverse: bool = False, depth: Optional[int] = None
+) -> List[OrderEntry]:
+    """
+    k 路归并多个交易所同一方向的订单簿，相同价位的数量合并。
+
+    每个交易所的档位视为已排序的流（asks 价格升序，bids 价格降序，即 reverse=True），
+    通过堆逐档取出，达到 depth 档后立即停止，开销与输出深度而不是输入总档位数相关。
+    相同价位按 OrderEntry 的整数刻度比较和累加，不构造 Decimal。
+
+    Args:
+        sides: 各交易所同一方向的档位列表
+        reverse: True 表示价格降序（bids）
+        depth: 输出的最大档位数，None 表示全部合并
+    """
+    streams = [side for side in sides if side]
+    merged = heapq.merge(*streams, key=_price_ticks, reverse=reverse)
+
+    output: List[OrderEntry] = []
+    level_ticks: Optional[int] = None
+    level_entries: List[OrderEntry] = []
+    for entry in merged:
+        ticks = entry.price_ticks
+        if ticks == level_ticks:
+            level_entries.append(entry)
+            continue
+        if level_entries:
+            output.append(_aggregate_level(level_entries))
+            if depth is not None and len(output) >= depth:
+                return output
+        level_ticks, level_entries = ticks, [entry]
+
+    if level_entries:
+        output.append(_aggregate_level(level_entries))
+    return output
+
+
+def _aggregate_level(entries: List[OrderEntry]) -> OrderEntry:
+    if len(entries) == 1:
+        return entries[0]
+    return OrderEntry(entries[0].price_ticks, sum(ent.amount_ticks for ent in entries))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from apps.exchange.consts import EXCHANGE_RATE_LIMIT_BURST, EXCHANGE_RATE_LIMIT_DEFAULT_MS
+
+
+class AsyncTokenBucket:
+    """
+    进程内异步令牌桶，限制对同一交易所的请求速率。
+
+    令牌按 rate（个/秒）连续恢复，最多积累 capacity 个；acquire 在令牌不足时休眠到足够为止，
+    等待者按到达顺序依次获得令牌。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_ccxt(cls, client, burst: float = EXCHANGE_RATE_LIMIT_BURST) -> 'AsyncTokenBucket':
+        """按 CCXT 客户端的 rateLimit（两次请求的最小间隔，毫秒）构造"""
+        rate_limit_ms = getattr(client, 'rateLimit', None) or EXCHANGE_RATE_LIMIT_DEFAULT_MS
+        return cls(rate=1000.0 / rate_limit_ms, capacity=burst)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+def create_request_limits(client, exchange_id: str,
+                          max_concurrency: Dict[str, int]) -> Tuple[asyncio.Semaphore, AsyncTokenBucket]:
+    """
+    创建同一交易所所有请求共享的并发上限与令牌桶。
+    并发数取 max_concurrency[exchange_id]，未配置时取 'default'；令牌按 CCXT 客户端的 rateLimit 恢复。
+    """
+    concurrency = max_concurrency.get(exchange_id, max_concurrency['default'])
+    return asyncio.Semaphore(concurrency), AsyncTokenBucket.from_ccxt(client)
@@ -2,25 +2,64 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import random
 import socket
-import sys
 import time
-from typing import Iterable, Optional, Set, List
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, List, Tuple
 
+import ccxt
 from django.conf import settings
 
 from common.decorators import retry_on
 from common.helpers import search_limit, getLogger
-from apps.exchange.consts import SLEEP_CONFIG
-from apps.exchange.cache_ops import merge_orderbooks, set_24ticker, set_orderbook
+from apps.exchange.consts import (
+    CRAWLER_BACKOFF_MAX_CYCLES,
+    CRAWLER_MAX_CONCURRENCY,
+    CRAWLER_MERGE_MAX_INTERVAL,
+    CRAWLER_START_SPREAD,
+    CRAWLER_STALE_CYCLES,
+    EXCHANGE_TICKERS_BATCH_SIZE,
+    SLEEP_CONFIG,
+)
+from apps.exchange.async_cache_ops import (
+    adrain_dirty_orderbooks,
+    amerge_orderbooks,
+    aset_24ticker,
+    aset_24tickers,
+    aset_orderbook,
+    aset_orderbooks,
+)
+from apps.exchange.cache_ops import merge_source_symbols
+from apps.exchange.metadata_cache import MetadataSnapshot, metadata_cache
 from apps.exchange.models import Exchange, TradingPair
+from apps.exchange.rate_limit import AsyncTokenBucket, create_request_limits
 from apps.exchange.types import Orderbook
 from apps.exchange.ccxt_client import get_client
+from apps.exchange.utils import has_native_capability, mark_capability_unsupported
 
 HOSTNAME = socket.gethostname()
 
 logger = getLogger(__name__)
 
+
+@dataclass
+class SymbolCrawlState:
+    """单个交易对在某个抓取任务中的调度状态"""
+    offset: float  # 每轮内固定的启动偏移（秒），把同一交易所的请求分散到整个周期
+    failures: int = 0  # 连续失败次数
+    skip_cycles: int = 0  # 退避中，剩余跳过的轮数
+    last_success: Optional[float] = None  # 最近一次成功的 time.monotonic()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.skip_cycles = min(2 ** (self.failures - 1) - 1, CRAWLER_BACKOFF_MAX_CYCLES)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.last_success = time.monotonic()
+
+
 class CrawlerService(object):
     symbols: Iterable[TradingPair]
     symbol_names: Set[str]
@@ -39,6 +78,10 @@ class CrawlerService(object):
         self.logger = getLogger(f'crawler.service.{self.exchange_slug}')
         self.symbols: List[TradingPair] = []
         self.symbol_names: Set[str] = set()
+        self._crawl_states: Dict[str, Dict[str, SymbolCrawlState]] = {}
+        self._metadata_version: Optional[int] = None
+        self._request_semaphore: Optional[asyncio.Semaphore] = None
+        self._rate_limiter: Optional[AsyncTokenBucket] = None
 
     def _initialize_client(self):
         try:
@@ -72,12 +115,27 @@ class CrawlerService(object):
             logger.error(f"Failed to initialize CCXT client for {self.exchange_slug} (Name: {self.exchange_name}): {e}", exc_info=True)
             self.exchange_client = None
 
-    def init_symbols_of_exchange(self):
+    def _apply_metadata(self, snapshot: MetadataSnapshot) -> None:
+        self.exchange = snapshot.exchanges.get(self.exchange.id, self.exchange)
         if self.exchange_name == 'platform':
-            self.symbols = TradingPair.objects.filter(status='Active', symbol_display__in=settings.MERGE_SYMBOL_CONFIG.keys())
+            self.symbols = snapshot.active_trading_pairs(settings.MERGE_SYMBOL_CONFIG.keys())
         else:
-            self.symbols = self.exchange.symbols.filter(status='Active')
+            self.symbols = snapshot.exchange_trading_pairs(self.exchange.id)
         self.symbol_names = set([sym.symbol_display for sym in self.symbols])
+        self._metadata_version = snapshot.version
+
+    def init_symbols_of_exchange(self):
+        self._apply_metadata(metadata_cache.get())
+
+    async def refresh_metadata(self) -> bool:
+        """元数据缓存有新版本时刷新交易所状态与交易对列表，返回是否刷新"""
+        snapshot = await metadata_cache.aget()
+        if snapshot.version == self._metadata_version:
+            return False
+        self._apply_metadata(snapshot)
+        self.logger.info(f'{self.exchange_slug} metadata refreshed to version {snapshot.version}, '
+                         f'{len(self.symbols)} symbols')
+        return True
 
     def run(self, action_func):
         self.init_symbols_of_exchange()
@@ -93,12 +151,31 @@ class CrawlerService(object):
             ticker = await self.exchange_client.fetch_ticker(symbol.symbol_display)
             self.logger.debug(f"API call successful for {symbol.symbol_display}. Ticker data: {ticker}")
             ticker["timestamp"] = time.time() * 1000
-            set_24ticker(self.exchange_slug, symbol.symbol_display, ticker)
-            self.logger.debug(f"set_24ticker completed for {symbol.symbol_display}")
+            await aset_24ticker(self.exchange_slug, symbol.symbol_display, ticker)
+            self.logger.debug(f"aset_24ticker completed for {symbol.symbol_display}")
         except Exception as e:
             self.logger.error(f"Error during fetch_ticker API call or processing for {symbol.symbol_display}", exc_info=True)
             raise
 
+    async def fetch_24tickers(self, symbols: List[TradingPair]) -> Set[str]:
+        """一次 fetch_tickers 请求获取多个交易对的 ticker 并批量写入，返回已写入的交易对"""
+        assert self.exchange_client is not None, f'{self} attribute exchange_client is None'
+        names = [symbol.symbol_display for symbol in symbols]
+        tickers = await self.exchange_client.fetch_tickers(names)
+        timestamp = time.time() * 1000
+        found = {name: tickers[name] for name in names if tickers.get(name)}
+        for ticker in found.values():
+            ticker["timestamp"] = timestamp
+        await aset_24tickers(self.exchange_slug, found)
+        return set(found)
+
+    def _prepare_orderbook(self, data: dict, limit: int) -> dict:
+        ob = Orderbook.from_json(data)
+        ob.bids = ob.bids[:limit]
+        ob.asks = ob.asks[:limit]
+        ob.source = "crawler@{HOSTNAME}"
+        return ob.as_json()
+
     @retry_on()
     async def fetch_orderbook(self, symbol: TradingPair, limit: int) -> None:
         if not limit:
@@ -111,11 +188,23 @@ class CrawlerService(object):
             slimit = search_limit(limit)
             assert slimit >= limit, f'slimit {slimit} must be greater than limit {limit}'
             data = await self.exchange_client.fetch_order_book(symbol.symbol_display, limit=slimit)
-        ob = Orderbook.from_json(data)
-        ob.bids = ob.bids[:limit]
-        ob.asks = ob.asks[:limit]
-        ob.source = "crawler@{HOSTNAME}"
-        set_orderbook(self.exchange_slug, symbol.symbol_display, ob.as_json())
+        await aset_orderbook(self.exchange_slug, symbol.symbol_display, self._prepare_orderbook(data, limit))
+
+    async def fetch_orderbooks(self, symbols: List[TradingPair], limit: int) -> Set[str]:
+        """
+        一次 fetch_order_books 请求获取多个交易对的订单簿并批量写入，返回已写入的交易对。
+        需要 market_type 参数的交易对不走批量接口，留给逐个抓取
+        """
+        if not limit:
+            limit = settings.QUOTE_ORDERBOOK_LIMIT
+        assert self.exchange_client is not None, f'{self} attribute exchange_client is None'
+        names = [symbol.symbol_display for symbol in symbols if symbol.symbol_display not in ['BTC-USD', 'ETH-USD']]
+        if not names:
+            return set()
+        data = await self.exchange_client.fetch_order_books(names, limit=search_limit(limit))
+        books = {name: self._prepare_orderbook(data[name], limit) for name in names if data.get(name)}
+        await aset_orderbooks(self.exchange_slug, books)
+        return set(books)
 
     @retry_on()
     async def fetch_markets(self):
@@ -134,66 +223,197 @@ class CrawlerService(object):
                 self.logger.error('Crawler %s markets fail.', self.exchange_slug, exc_info=True)
             await asyncio.sleep(SLEEP_CONFIG['crawler_fetch_markets'])
 
+    def _request_limits(self) -> Tuple[asyncio.Semaphore, AsyncTokenBucket]:
+        """同一交易所所有抓取请求共享的并发上限与令牌桶（按 CCXT rateLimit 恢复）"""
+        if self._request_semaphore is None:
+            self._request_semaphore, self._rate_limiter = create_request_limits(
+                self.exchange_client, self.exchange_slug, CRAWLER_MAX_CONCURRENCY)
+        return self._request_semaphore, self._rate_limiter
+
+    def _symbol_states(self, job: str, period: float) -> Dict[str, SymbolCrawlState]:
+        states = self._crawl_states.setdefault(job, {})
+        for symbol in self.symbols:
+            if symbol.symbol_display not in states:
+                states[symbol.symbol_display] = SymbolCrawlState(offset=random.uniform(0, period * CRAWLER_START_SPREAD))
+        return states
+
+    async def _crawl_bulk(self, job: str, capability: str, bulk_fetch: Callable[[List[TradingPair]], Awaitable[Set[str]]],
+                          symbols: List[TradingPair]) -> Tuple[Set[str], int]:
+        """按批调用批量接口，返回已抓取的交易对和请求数。批量接口不可用时标记能力缓存，本轮其余交易对逐个抓取"""
+        semaphore, rate_limiter = self._request_limits()
+        batch_size = EXCHANGE_TICKERS_BATCH_SIZE.get(self.exchange_slug, EXCHANGE_TICKERS_BATCH_SIZE['default'])
+        batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+
+        async def crawl_batch(batch: List[TradingPair]) -> Set[str]:
+            async with semaphore:
+                await rate_limiter.acquire()
+                try:
+                    return await bulk_fetch(batch)
+                except ccxt.NotSupported as e:
+                    mark_capability_unsupported(self.exchange_client.id, capability)
+                    self.logger.warning(f'Crawler {self.exchange_slug} {capability} not supported, '
+                                        f'falling back to per-symbol {job}: {e}')
+                except Exception:
+                    self.logger.error(f'Crawler {self.exchange_slug} {job} bulk fetch of {len(batch)} symbols fail, '
+                                      f'falling back to per-symbol calls', exc_info=True)
+            return set()
+
+        fetched = await asyncio.gather(*(crawl_batch(batch) for batch in batches))
+        return set().union(*fetched), len(batches)
+
+    async def crawl_cycle(self, job: str, fetch: Callable[[TradingPair], Awaitable[None]], period: float,
+                          bulk_capability: Optional[str] = None,
+                          bulk_fetch: Optional[Callable[[List[TradingPair]], Awaitable[Set[str]]]] = None) -> float:
+        """
+        并发抓取一轮所有交易对，返回本轮耗时（秒）。
+
+        交易所原生支持 bulk_capability（如 fetchTickers）时，先用 bulk_fetch 按批抓取，
+        批量结果中缺失的交易对再逐个抓取。逐个抓取时每个交易对在本轮开始后按各自固定的偏移启动，
+        受交易所的并发上限与令牌桶约束；单个交易对失败只影响自身：按连续失败次数指数退避跳过后续若干轮。
+        """
+        semaphore, rate_limiter = self._request_limits()
+        states = self._symbol_states(job, period)
+        cycle_start = time.monotonic()
+
+        async def crawl_one(symbol: TradingPair, state: SymbolCrawlState) -> bool:
+            await asyncio.sleep(state.offset)
+            async with semaphore:
+                await rate_limiter.acquire()
+                try:
+                    await fetch(symbol)
+                except Exception:
+                    state.record_failure()
+                    self.logger.error(
+                        f'Crawler {self.exchange_slug} {symbol.symbol_display} {job} fail '
+                        f'({state.failures} in a row, skipping {state.skip_cycles} cycles)', exc_info=True)
+                    return False
+            state.record_success()
+            return True
+
+        due = []
+        skipped = 0
+        for symbol in self.symbols:
+            state = states[symbol.symbol_display]
+            if state.skip_cycles > 0:
+                state.skip_cycles -= 1
+                skipped += 1
+                continue
+            due.append(symbol)
+
+        bulk_fetched, requests = set(), 0
+        if bulk_fetch and due and self.exchange_client is not None \
+                and has_native_capability(self.exchange_client, bulk_capability):
+            bulk_fetched, requests = await self._crawl_bulk(job, bulk_capability, bulk_fetch, due)
+            for name in bulk_fetched:
+                states[name].record_success()
+            due = [symbol for symbol in due if symbol.symbol_display not in bulk_fetched]
+
+        results = await asyncio.gather(*(crawl_one(symbol, states[symbol.symbol_display]) for symbol in due))
+        requests += len(results)
+
+        now = time.monotonic()
+        wall_time = now - cycle_start
+        self._report_cycle(job, states, period, now, wall_time, len(bulk_fetched) + sum(results),
+                           len(results) - sum(results), skipped, requests)
+        return wall_time
+
+    def _report_cycle(self, job: str, states: Dict[str, SymbolCrawlState], period: float, now: float,
+                      wall_time: float, succeeded: int, failed: int, skipped: int, requests: int) -> None:
+        staleness = {name: (None if state.last_success is None else now - state.last_success)
+                     for name, state in states.items() if name in self.symbol_names}
+        known = [value for value in staleness.values() if value is not None]
+        max_staleness = f'{max(known):.1f}s' if known else 'n/a'
+        self.logger.info(f'Crawler {self.exchange_slug} {job} cycle: {succeeded} ok, {failed} failed, '
+                         f'{skipped} backing off, {requests} requests, wall time {wall_time:.2f}s, '
+                         f'max staleness {max_staleness}')
+        self.logger.debug(f'Crawler {self.exchange_slug} {job} staleness: ' + ', '.join(
+            f'{name}={"never" if value is None else f"{value:.1f}s"}' for name, value in sorted(staleness.items())))
+        if wall_time > period:
+            self.logger.warning(f'Crawler {self.exchange_slug} {job} cycle took {wall_time:.2f}s, '
+                                f'longer than its {period}s period')
+        stale = sorted(name for name, value in staleness.items()
+                       if value is None or value > period * CRAWLER_STALE_CYCLES)
+        if stale:
+            self.logger.warning(f'Crawler {self.exchange_slug} {job} stale symbols: {stale}')
+
     async def crawler_fetch_24tickers(self):
         self.logger.info(f"Starting crawler_fetch_24tickers loop for exchange {self.exchange_slug} (Name: {self.exchange_name})")
         if not self.symbols:
             self.logger.warning("Symbols list is empty, crawler loop will not run.")
             return
+        try:
+            period = SLEEP_CONFIG['crawler_fetch_24tickers']
+        except KeyError:
+            self.logger.warning("'crawler_fetch_24tickers' not found in SLEEP_CONFIG, using default 60s")
+            period = 60
         while True:
-            self.logger.debug(f"Starting new ticker fetch cycle for symbols: {self.symbol_names}")
-            for symbol in self.symbols:
-                self.logger.debug(f"Processing symbol: {symbol.symbol_display}")
-                try:
-                    await self.fetch_24ticker(symbol)
-                except Exception as e:
-                    self.logger.error(f'Error processing symbol {symbol.symbol_display} in main loop.', exc_info=True)
-            try:
-                sleep_time = SLEEP_CONFIG['crawler_fetch_24tickers']
-            except KeyError:
-                self.logger.warning("'crawler_fetch_24tickers' not found in SLEEP_CONFIG, using default 60s")
-                sleep_time = 60
-            self.logger.debug(f"Ticker fetch cycle complete. Sleeping for {sleep_time} seconds.")
-            await asyncio.sleep(sleep_time)
+            await self.refresh_metadata()
+            # 退避由 crawl_cycle 按轮处理，这里关闭 retry_on 的阻塞式重试
+            wall_time = await self.crawl_cycle(
+                'tickers',
+                lambda symbol: self.fetch_24ticker(symbol, max_retry=0),
+                period,
+                bulk_capability='fetchTickers',
+                bulk_fetch=self.fetch_24tickers
+            )
+            await asyncio.sleep(max(0, period - wall_time))
 
     async def crawler_fetch_orderbooks(self, limit: int = 15):
-        cnt = 0
+        period = SLEEP_CONFIG['crawler_fetch_orderbooks']
         while True:
-            cnt += 1
-            if cnt >= 10:
-                self.exchange.refresh_from_db()
-                cnt = 0
+            await self.refresh_metadata()
+            wall_time = 0
             if self.exchange.is_active:
-                await self.fetch_symbols_orderbooks(limit)
+                wall_time = await self.fetch_symbols_orderbooks(limit)
             else:
                 self.logger.error('exchange %s is not active', self.exchange_slug)
-            await asyncio.sleep(SLEEP_CONFIG['crawler_fetch_orderbooks'])
+            await asyncio.sleep(max(0, period - wall_time))
 
-    async def fetch_symbols_orderbooks(self, limit: int):
-        for symbol in self.symbols:
-            try:
-                await self.fetch_orderbook(symbol, limit)
-                self.logger.debug(
-                    'Crawler %s %s fetch orderbooks succeed',
-                    self.exchange_slug,
-                    symbol.symbol_display
-                )
-            except Exception as e:
-                self.logger.error(
-                    'Crawler %s %s fetch orderbooks fail',
-                    self.exchange_slug,
-                    symbol.symbol_display, exc_info=True
-                )
-                sys.exit(1)
+    async def fetch_symbols_orderbooks(self, limit: int) -> float:
+        return await self.crawl_cycle(
+            'orderbooks',
+            lambda symbol: self.fetch_orderbook(symbol, limit, max_retry=0),
+            SLEEP_CONFIG['crawler_fetch_orderbooks'],
+            bulk_capability='fetchOrderBooks',
+            bulk_fetch=lambda symbols: self.fetch_orderbooks(symbols, limit)
+        )
 
     async def merge_orderbooks(self, symbol: TradingPair):
-        await merge_orderbooks(symbol)
+        await amerge_orderbooks(symbol)
 
     async def crawler_merge_orderbooks(self):
+        """
+        只重新合并来源订单簿有更新的交易对：订单簿写入时把交易对加入待合并集合，这里每轮取走自己负责的部分。
+        合并失败的交易对下一轮重试；长时间没有更新的交易对每 CRAWLER_MERGE_MAX_INTERVAL 秒强制合并一次
+        """
+        sources: Dict[str, Set[str]] = {}
+        all_sources: Set[str] = set()
+        last_merged: Dict[str, float] = {}
+        retry: Set[str] = set()
         while True:
+            if await self.refresh_metadata() or not sources:
+                sources = {symbol.symbol_display: merge_source_symbols(symbol) for symbol in self.symbols}
+                all_sources = set().union(*sources.values())
+            try:
+                dirty = await adrain_dirty_orderbooks(all_sources)
+            except Exception:
+                self.logger.error('draining dirty orderbooks failed, merging all symbols', exc_info=True)
+                dirty = all_sources
+            now = time.monotonic()
+            merged = 0
             for symbol in self.symbols:
+                name = symbol.symbol_display
+                due = name not in last_merged or now - last_merged[name] >= CRAWLER_MERGE_MAX_INTERVAL
+                if not (due or name in retry or sources[name] & dirty):
+                    continue
                 try:
                     await self.merge_orderbooks(symbol)
-                    self.logger.debug('%s orderbook is merged' % symbol.symbol_display)
+                    self.logger.debug('%s orderbook is merged' % name)
+                    last_merged[name] = now
+                    retry.discard(name)
+                    merged += 1
                 except Exception as e:
-                    self.logger.error('%s orderbook merging failed' % symbol.symbol_display, exc_info=True)
+                    retry.add(name)
+                    self.logger.error('%s orderbook merging failed' % name, exc_info=True)
+            self.logger.debug(f'merged {merged}/{len(sources)} symbols, {len(dirty)} dirty sources')
             await asyncio.sleep(SLEEP_CONFIG['crawler_merge_orderbooks'])
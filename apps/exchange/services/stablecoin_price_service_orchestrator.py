@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
 from common.helpers import getLogger
 from apps.exchange.adapters import get_exchange_adapter
@@ -8,6 +8,7 @@ from apps.exchange.data_persistor import DataPersistor
 from apps.exchange.interfaces import ExchangeInterface
 from apps.exchange.market_data_provider import MarketDataProvider
 from apps.exchange.price_fetcher import PriceFetcher
+from apps.exchange.tasks.streaming_ticker_task import StreamingTickerTask
 from apps.exchange.tasks.ticker_task import TickerTask
 
 logger = getLogger(__name__)
@@ -18,11 +19,14 @@ class StablecoinPriceServiceOrchestrator:
             self,
             exclude_exchanges_cli: Optional[List[str]] = None,
             only_exchanges_cli: Optional[List[str]] = None,
-            monitor_interval: int = STABLECOIN_PRICE_MONITOR_INTERVAL
+            monitor_interval: int = STABLECOIN_PRICE_MONITOR_INTERVAL,
+            streaming: bool = False
     ):
         self.exclude_exchanges_cli = exclude_exchanges_cli or []
         self.only_exchanges_cli = only_exchanges_cli or []
         self.default_monitor_interval = monitor_interval
+        # 流式模式：支持 watch_tickers 的交易所改用 WebSocket 推送，其余交易所仍按间隔轮询
+        self.streaming = streaming
         
         # 初始化交易所特定的监控间隔
         self.exchange_intervals = dict(EXCHANGE_SPECIFIC_INTERVALS)
@@ -31,7 +35,7 @@ class StablecoinPriceServiceOrchestrator:
         self.price_fetcher = PriceFetcher()
         self.persistor = DataPersistor()
 
-        self.ticker_tasks: List[TickerTask] = []
+        self.ticker_tasks: List[Union[TickerTask, StreamingTickerTask]] = []
         self.adapters: Dict[str, ExchangeInterface] = {}
         self._is_running = False
         self._initialized = False
@@ -112,6 +116,15 @@ class StablecoinPriceServiceOrchestrator:
                         monitor_interval=exchange_interval,  # 使用交易所特定的间隔
                         task_id=f"{exchange_id}-task"
                     )
+                    if self.streaming:
+                        task = StreamingTickerTask(
+                            exchange_id=exchange_id,
+                            exchange_adapter=adapter,
+                            data_persistor=self.persistor,
+                            pairs_to_monitor=pairs_for_exchange,
+                            fallback_task=task,
+                            task_id=f"{exchange_id}-stream"
+                        )
                     self.ticker_tasks.append(task)
                     logger.info(f"Orchestrator: 为{exchange_id}创建了任务，监控{len(pairs_for_exchange)}个交易对，间隔{exchange_interval}秒")
                 except Exception as e:
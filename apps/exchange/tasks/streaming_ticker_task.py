@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import ccxt
+
+from common.helpers import getLogger
+from apps.exchange.adapters.base import BaseExchangeAdapter
+from apps.exchange.ccxt_client import get_client
+from apps.exchange.consts import (
+    STABLECOIN_MAX_RETRIES,
+    STABLECOIN_RETRY_DELAY,
+    STABLECOIN_STREAM_FLUSH_INTERVAL,
+    STABLECOIN_STREAM_SYMBOLS_PER_WATCH
+)
+from apps.exchange.data_persistor import DataPersistor
+from apps.exchange.data_structures import PairDefinition, PriceUpdateInfo
+from apps.exchange.tasks.ticker_task import TickerTask
+
+logger = getLogger(__name__)
+
+
+class StreamingTickerTask:
+    """
+    通过 CCXT Pro 的 watch_tickers 订阅行情推送，在内存中按交易对合并（只保留最新价格），
+    每 flush_interval 秒批量写入 Redis 一次。
+
+    交易所不支持 watch_tickers，或订阅连续失败超过 STABLECOIN_MAX_RETRIES 次时，
+    改为运行轮询用的 fallback_task（TickerTask）直到停止。对外接口与 TickerTask 一致。
+    """
+
+    def __init__(
+            self,
+            exchange_id: str,
+            exchange_adapter: BaseExchangeAdapter,
+            data_persistor: DataPersistor,
+            pairs_to_monitor: List[PairDefinition],
+            fallback_task: TickerTask,
+            flush_interval: float = STABLECOIN_STREAM_FLUSH_INTERVAL,
+            task_id: Optional[str] = None
+    ):
+        self.exchange_id = exchange_id
+        self.adapter = exchange_adapter
+        self.persistor = data_persistor
+        self.pairs_to_monitor = pairs_to_monitor
+        self.fallback_task = fallback_task
+        self.flush_interval = flush_interval
+        self.task_id = task_id or f"{exchange_id}-stream"
+
+        self.client = None
+        self._pair_def_map: Dict[str, PairDefinition] = {pd.exchange_symbol: pd for pd in pairs_to_monitor}
+        self._pending: Dict[str, PriceUpdateInfo] = {}  # raw_pair_string -> 最新价格
+        self._is_running = False
+        self._stop_event = asyncio.Event()
+        self._streaming_failed = asyncio.Event()
+
+    def _create_client(self):
+        client = get_client(self.exchange_id, sync_type="async", client_type="pro",
+                            extra_config=self.adapter.ccxt_config)
+        if client and client.has.get('watchTickers'):
+            return client
+        return None
+
+    async def start_monitoring(self):
+        log_prefix = f"[{self.task_id}]"
+        self._is_running = True
+        self._stop_event.clear()
+        self._streaming_failed.clear()
+        try:
+            self.client = self._create_client() if self.pairs_to_monitor else None
+            if not self.client:
+                logger.info(f"{log_prefix}: {self.exchange_id} 不支持 watch_tickers，改用轮询")
+                await self.fallback_task.start_monitoring()
+                return
+
+            symbols = list(self._pair_def_map)
+            groups = [symbols[i:i + STABLECOIN_STREAM_SYMBOLS_PER_WATCH]
+                      for i in range(0, len(symbols), STABLECOIN_STREAM_SYMBOLS_PER_WATCH)]
+            logger.info(f"{log_prefix}: 开始流式订阅{len(symbols)}个交易对（{len(groups)}个订阅），"
+                        f"每{self.flush_interval}秒写入Redis")
+            workers = [asyncio.create_task(self._watch(group)) for group in groups]
+            workers.append(asyncio.create_task(self._flush_loop()))
+            stop_waiter = asyncio.create_task(self._stop_event.wait())
+            failed_waiter = asyncio.create_task(self._streaming_failed.wait())
+            await asyncio.wait([stop_waiter, failed_waiter], return_when=asyncio.FIRST_COMPLETED)
+
+            for task in [*workers, stop_waiter, failed_waiter]:
+                task.cancel()
+            await asyncio.gather(*workers, stop_waiter, failed_waiter, return_exceptions=True)
+            await self._flush()
+
+            if self._streaming_failed.is_set() and not self._stop_event.is_set():
+                logger.warning(f"{log_prefix}: 流式订阅连续失败，改用轮询")
+                await self._close_client()
+                await self.fallback_task.start_monitoring()
+        finally:
+            await self._close_client()
+            self._is_running = False
+            logger.info(f"{log_prefix}: 流式监控已停止")
+
+    async def _watch(self, symbols: List[str]):
+        log_prefix = f"[{self.task_id}]"
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                tickers = await self.client.watch_tickers(symbols)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except ccxt.NotSupported as e:
+                logger.warning(f"{log_prefix}: watch_tickers 不可用: {e}")
+                self._streaming_failed.set()
+                return
+            except Exception as e:
+                failures += 1
+                if failures > STABLECOIN_MAX_RETRIES:
+                    logger.error(f"{log_prefix}: watch_tickers 连续失败{failures}次: {e}")
+                    self._streaming_failed.set()
+                    return
+                delay = STABLECOIN_RETRY_DELAY * (2 ** (failures - 1))
+                logger.warning(f"{log_prefix}: watch_tickers 出错，{delay}秒后重新订阅 ({failures}/{STABLECOIN_MAX_RETRIES}): {e}")
+                await asyncio.sleep(delay)
+                continue
+            self._coalesce(tickers)
+
+    def _coalesce(self, tickers: Dict[str, Dict]):
+        current_time = datetime.now(timezone.utc)
+        for symbol, raw_ticker in (tickers or {}).items():
+            pair_def = self._pair_def_map.get(symbol)
+            if not pair_def:
+                continue
+            price = self.adapter._extract_price_from_raw_ticker(raw_ticker)
+            if price is None:
+                continue
+            self._pending[pair_def.raw_pair_string] = PriceUpdateInfo(
+                pair_def=pair_def,
+                price=price,
+                source_exchange_id=self.exchange_id,
+                timestamp=current_time
+            )
+
+    async def _flush_loop(self):
+        while not self._stop_event.is_set():
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        updates, self._pending = list(self._pending.values()), {}
+        try:
+            await self.persistor.update_redis_prices(updates)
+            logger.debug(f"[{self.task_id}]: 已将{len(updates)}个流式价格写入Redis")
+        except Exception as e:
+            logger.error(f"[{self.task_id}]: 写入流式价格失败: {e}", exc_info=True)
+
+    async def _close_client(self):
+        if self.client:
+            try:
+                await self.client.close()
+            except Exception as e:
+                logger.error(f"[{self.task_id}]: 关闭 CCXT Pro 客户端失败: {e}")
+            self.client = None
+
+    def stop(self):
+        logger.info(f"[{self.task_id}]: 收到停止信号")
+        self._stop_event.set()
+        self.fallback_task.stop()
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
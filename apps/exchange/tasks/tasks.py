@@ -4,6 +4,7 @@ import time
 from decimal import Decimal
 
 import aiohttp
+from asgiref.sync import sync_to_async
 from celery import shared_task
 from django.utils import timezone
 from django.core.management import call_command
@@ -11,6 +12,7 @@ from django.core.management import call_command
 from common.helpers import getLogger
 from apps.exchange.ccxt_client import get_client
 from apps.exchange.consts import STABLECOIN_SYMBOLS
+from apps.exchange.metadata_cache import batched_metadata_bumps, bump_metadata_version_on_commit
 from apps.exchange.models import Exchange, TradingPair, Asset, Market, MarketStatusChoices, AssetStatusChoices, SymbolCat
 
 logger = getLogger(__name__)
@@ -61,8 +63,9 @@ def process_exchange(self, exchange_slug):
     start_time = time.time()
 
     try:
-        # 使用asyncio.run运行异步任务
-        result = asyncio.run(handle_exchange_async(exchange_slug))
+        # 使用asyncio.run运行异步任务；逐行写入触发的元数据版本号递增合并为一次
+        with batched_metadata_bumps():
+            result = asyncio.run(handle_exchange_async(exchange_slug))
         elapsed = time.time() - start_time
         logger.info(f"交易所 {exchange_slug} 处理完成，耗时: {elapsed:.2f}秒")
         return {'status': 'success', 'exchange': exchange_slug, 'elapsed': f"{elapsed:.2f}秒"}
@@ -349,6 +352,9 @@ async def handle_exchange_async(exchange_slug):
                 last_synced_at=timezone.now()
             )
             logger.info(f"已将 {delisted_count} 个市场标记为下架/暂停。")
+            if delisted_count:
+                # QuerySet.update 不触发模型信号，需要手动通知元数据缓存
+                await sync_to_async(bump_metadata_version_on_commit)('Market.update')
 
         logger.info(f"完成 {exchange_slug}: 处理了 {processed}, 新建 {created}, 更新 {updated}, 下架 {delisted_count}。")
         return {'processed': processed, 'created': created, 'updated': updated, 'delisted': delisted_count}
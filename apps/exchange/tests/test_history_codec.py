@@ -0,0 +1,121 @@
+import json
+
+from django.test import SimpleTestCase
+
+from apps.exchange.history_codec import (
+    BinaryHistoryCodec,
+    JsonHistoryCodec,
+    ORDERBOOK_V1,
+    TICKER_NUMERIC_FIELDS,
+    TICKER_V1,
+    decode_orderbook,
+    decode_orderbook_timestamp,
+    decode_ticker,
+)
+from apps.exchange.types import Orderbook
+
+ORDERBOOK = {
+    'timestamp': 1718000000123,
+    'bids': [[67000.5, 1.25], ['66999.99', '0.000001'], [66990, 3]],
+    'asks': [[67001.0, 0.5, 12], ['67002.12345678', '0.000000000000000001']],
+    'exchange': 'binance',
+    'nonce': 42,
+    'datetime': '2024-06-10T06:13:20.123Z',
+    'source': 'ws',
+}
+
+TICKER = {
+    'symbol': 'BTC/USDT',
+    'timestamp': 1718000000123,
+    'datetime': '2024-06-10T06:13:20.123Z',
+    'high': 68000.0,
+    'low': 66000,
+    'bid': 67000.5,
+    'ask': 67001.0,
+    'last': '67000.75',
+    'baseVolume': 1234.5,
+    'quoteVolume': None,
+    'info': {'raw': 'x' * 100},
+}
+
+
+class BinaryHistoryCodecTests(SimpleTestCase):
+    codec = BinaryHistoryCodec()
+
+    def test_orderbook_round_trip(self):
+        raw = self.codec.encode_orderbook(ORDERBOOK)
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(raw[0], ORDERBOOK_V1)
+
+        ob = decode_orderbook(raw)
+        expected = Orderbook.from_json(ORDERBOOK)
+        self.assertEqual(expected.as_json(), ob.as_json())
+        self.assertEqual([e.price_ticks for e in expected.bids], [e.price_ticks for e in ob.bids])
+        self.assertEqual([e.amount_ticks for e in expected.asks], [e.amount_ticks for e in ob.asks])
+        self.assertEqual(ORDERBOOK['timestamp'], ob.timestamp)
+        self.assertEqual(('binance', 42, 'ws'), (ob.exchange, ob.nonce, ob.source))
+
+    def test_empty_orderbook_round_trip(self):
+        data = {'timestamp': 1718000000000, 'bids': [], 'asks': []}
+        ob = decode_orderbook(self.codec.encode_orderbook(data))
+        self.assertEqual(([], []), (ob.bids, ob.asks))
+        self.assertEqual('', ob.exchange)
+
+    def test_orderbook_int64_overflow_falls_back_to_json(self):
+        data = dict(ORDERBOOK, asks=[[67001.0, 1e30]])
+        raw = self.codec.encode_orderbook(data)
+        self.assertIsInstance(raw, str)
+        self.assertEqual(data, json.loads(raw))
+        self.assertEqual(Orderbook.from_json(data).as_json(), decode_orderbook(raw).as_json())
+
+    def test_orderbook_oversized_extras_falls_back_to_json(self):
+        data = dict(ORDERBOOK, info='x' * 0x10000)
+        raw = self.codec.encode_orderbook(data)
+        self.assertIsInstance(raw, str)
+        self.assertEqual(Orderbook.from_json(data).as_json(), decode_orderbook(raw).as_json())
+
+    def test_ticker_round_trip_drops_info(self):
+        raw = self.codec.encode_ticker(TICKER)
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(raw[0], TICKER_V1)
+
+        expected = {field: None for field in TICKER_NUMERIC_FIELDS}
+        expected.update({k: v for k, v in TICKER.items() if k != 'info'})
+        self.assertEqual(expected, decode_ticker(raw))
+
+    def test_ticker_oversized_extras_falls_back_to_json(self):
+        data = dict(TICKER, symbol='x' * 0x10000)
+        raw = self.codec.encode_ticker(data)
+        self.assertIsInstance(raw, str)
+        self.assertEqual(data, decode_ticker(raw))
+
+    def test_decode_orderbook_timestamp(self):
+        self.assertEqual(ORDERBOOK['timestamp'], decode_orderbook_timestamp(self.codec.encode_orderbook(ORDERBOOK)))
+
+    def test_unsupported_version(self):
+        raw = self.codec.encode_orderbook(ORDERBOOK)
+        with self.assertRaises(ValueError):
+            decode_orderbook(b'\x7f' + raw[1:])
+        with self.assertRaises(ValueError):
+            decode_ticker(b'\x7f' + self.codec.encode_ticker(TICKER)[1:])
+
+
+class JsonSnapshotCompatibilityTests(SimpleTestCase):
+    """滚动升级期间 Redis 中仍有旧的 JSON 快照，读取端需同时接受 str 与 bytes"""
+    codec = JsonHistoryCodec()
+
+    def test_decode_orderbook(self):
+        raw = self.codec.encode_orderbook(ORDERBOOK)
+        expected = Orderbook.from_json(ORDERBOOK).as_json()
+        self.assertEqual(expected, decode_orderbook(raw).as_json())
+        self.assertEqual(expected, decode_orderbook(raw.encode()).as_json())
+
+    def test_decode_ticker(self):
+        raw = self.codec.encode_ticker(TICKER)
+        self.assertEqual(TICKER, decode_ticker(raw))
+        self.assertEqual(TICKER, decode_ticker(raw.encode()))
+
+    def test_decode_orderbook_timestamp(self):
+        raw = self.codec.encode_orderbook(ORDERBOOK)
+        self.assertEqual(ORDERBOOK['timestamp'], decode_orderbook_timestamp(raw))
+        self.assertEqual(ORDERBOOK['timestamp'], decode_orderbook_timestamp(raw.encode()))
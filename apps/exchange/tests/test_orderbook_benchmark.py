@@ -0,0 +1,140 @@
+import json
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import groupby
+from operator import attrgetter
+
+from django.test import SimpleTestCase
+
+from apps.exchange.consts import MERGE_ORDERBOOK_DEPTH
+from apps.exchange.orderbook_merge import merge_sorted_sides
+from apps.exchange.types import Orderbook, OrderEntry
+from common.helpers import dec, getLogger
+
+logger = getLogger(__name__)
+
+EXCHANGE_COUNT = 20
+SYMBOL_COUNT = 50
+LEVELS = 15
+
+
+class LegacyOrderEntry:
+    """优化前的 OrderEntry：每个实例带 __dict__，解析时即构造 Decimal"""
+    price: Decimal
+    amount: Decimal
+
+    @classmethod
+    def from_json(cls, data):
+        order = LegacyOrderEntry()
+        order.price = dec(str(data[0]))
+        order.amount = dec(str(data[1]))
+        return order
+
+    @property
+    def price_str(self):
+        return '{:f}'.format(self.price)
+
+    def as_json(self):
+        return [self.price_str, float(self.amount)]
+
+
+def legacy_merge_order_list(old, new, reverse=False):
+    output = []
+    mixed = sorted(old + new, key=lambda ent: ent.price)
+    for k, _ents in groupby(mixed, key=lambda ent: ent.price_str):
+        ents = list(_ents)
+        order = LegacyOrderEntry()
+        order.price = dec(k)
+        order.amount = dec(sum(e.amount for e in ents))
+        output.append(order)
+    return sorted(output, key=attrgetter("price"), reverse=reverse)
+
+
+def legacy_parse_and_merge(payloads):
+    books = []
+    for payload in payloads:
+        data = json.loads(payload)
+        books.append(([LegacyOrderEntry.from_json(d) for d in data['bids']],
+                      [LegacyOrderEntry.from_json(d) for d in data['asks']]))
+    bids, asks = [], []
+    for book_bids, book_asks in books:
+        bids = legacy_merge_order_list(bids, book_bids, reverse=True)
+        asks = legacy_merge_order_list(asks, book_asks)
+    return bids, asks
+
+
+def parse_and_merge(payloads):
+    books = [Orderbook.from_json(json.loads(payload)) for payload in payloads]
+    bids = merge_sorted_sides([ob.bids for ob in books], reverse=True)
+    asks = merge_sorted_sides([ob.asks for ob in books])
+    return bids, asks
+
+
+def make_payloads(rng, exchange_count=EXCHANGE_COUNT, levels=LEVELS):
+    """生成同一交易对在多个交易所的订单簿，价格集中在中间价附近以制造同价位"""
+    mid = rng.uniform(0.01, 60000)
+    tick = mid / 10000
+    payloads = []
+    for _ in range(exchange_count):
+        bids = [[round(mid - tick * (i + rng.randint(0, 2)), 8), round(rng.uniform(0, 50), 6)] for i in range(levels)]
+        asks = [[round(mid + tick * (i + 1 + rng.randint(0, 2)), 8), round(rng.uniform(0, 50), 6)] for i in range(levels)]
+        bids = sorted({p: a for p, a in bids}.items(), reverse=True)
+        asks = sorted({p: a for p, a in asks}.items())
+        payloads.append(json.dumps({'timestamp': int(time.time() * 1000), 'bids': bids, 'asks': asks}))
+    return payloads
+
+
+class OrderbookMergeBenchmark(SimpleTestCase):
+    """对比优化前后订单簿类型在解析+合并路径上的吞吐量与峰值内存"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(42)
+        cls.symbols = [make_payloads(rng) for _ in range(SYMBOL_COUNT)]
+
+    def test_merge_matches_legacy(self):
+        for payloads in self.symbols:
+            legacy_bids, legacy_asks = legacy_parse_and_merge(payloads)
+            bids, asks = parse_and_merge(payloads)
+            self.assertEqual([e.as_json() for e in legacy_bids], [e.as_json() for e in bids])
+            self.assertEqual([e.as_json() for e in legacy_asks], [e.as_json() for e in asks])
+            self.assertEqual([e.price for e in legacy_bids], [e.price for e in bids])
+            self.assertEqual([e.amount for e in legacy_asks], [e.amount for e in asks])
+
+    def test_depth_limited_merge_is_prefix(self):
+        books = [Orderbook.from_json(json.loads(payload)) for payload in self.symbols[0]]
+        full = merge_sorted_sides([ob.asks for ob in books])
+        limited = merge_sorted_sides([ob.asks for ob in books], depth=MERGE_ORDERBOOK_DEPTH)
+        self.assertEqual([e.as_json() for e in full[:MERGE_ORDERBOOK_DEPTH]], [e.as_json() for e in limited])
+
+    def test_entry_memory_footprint(self):
+        self.assertFalse(hasattr(OrderEntry(), '__dict__'))
+        self.assertFalse(hasattr(Orderbook(), '__dict__'))
+
+    def test_parse_merge_throughput_and_peak_memory(self):
+        legacy_seconds, legacy_peak = self._measure(legacy_parse_and_merge)
+        seconds, peak = self._measure(parse_and_merge)
+
+        levels = SYMBOL_COUNT * EXCHANGE_COUNT * LEVELS * 2
+        logger.debug(f"parse+merge {SYMBOL_COUNT} symbols x {EXCHANGE_COUNT} exchanges x {LEVELS} levels: "
+                     f"legacy {levels / legacy_seconds:,.0f} levels/s peak {legacy_peak / 1024:,.1f} KiB, "
+                     f"slotted {levels / seconds:,.0f} levels/s peak {peak / 1024:,.1f} KiB")
+
+        self.assertLess(peak, legacy_peak)
+
+    def _measure(self, parse_merge):
+        tracemalloc.start()
+        try:
+            for payloads in self.symbols:
+                parse_merge(payloads)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        start = time.perf_counter()
+        for payloads in self.symbols:
+            parse_merge(payloads)
+        return time.perf_counter() - start, peak
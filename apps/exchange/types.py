@@ -1,16 +1,53 @@
 import time
 from datetime import datetime
-from decimal import Decimal
+from decimal import Context as DecimalContext, Decimal
 from typing import Any, Dict, List, Optional, Union
 
-import ntplib
 from dateutil.parser import parse
-from django.conf import settings
 from pytz import timezone
 
+from common.clock import ntp_clock
 from common.helpers import dec, decstr, d2
 from apps.exchange.models import Asset
 
+# 订单簿档位的价格和数量以 10^18 整数刻度存储（与 dec() 的18位小数精度一致），
+# 解析、合并和序列化只做整数运算，Decimal 在访问 price/amount 时才生成
+TICK_DECIMALS = 18
+TICK_SCALE = 10 ** TICK_DECIMALS
+_TICK_CONTEXT = DecimalContext(prec=60)
+
+
+def to_ticks(value: Any) -> int:
+    """转换为整数刻度，结果与 dec(str(value)) 一致（向下取整到18位小数，无法解析时为0）"""
+    if isinstance(value, Decimal):
+        text = str(value)
+    elif isinstance(value, str):
+        text = value
+    else:
+        text = repr(value)
+    # 常见的非负十进制字符串直接按位拼接，避免构造 Decimal
+    if text[:1].isdigit() and 'e' not in text and 'E' not in text:
+        int_part, _, frac = text.partition('.')
+        try:
+            return int(int_part + frac[:TICK_DECIMALS].ljust(TICK_DECIMALS, '0'))
+        except ValueError:
+            pass
+    try:
+        return int(dec(text).scaleb(TICK_DECIMALS, _TICK_CONTEXT))
+    except (ValueError, OverflowError):
+        return 0
+
+
+def ticks_to_decimal(ticks: int) -> Decimal:
+    return Decimal(ticks).scaleb(-TICK_DECIMALS, _TICK_CONTEXT)
+
+
+def ticks_to_str(ticks: int) -> str:
+    """与 '{:f}'.format(ticks_to_decimal(ticks)) 相同的定点字符串"""
+    sign = '-' if ticks < 0 else ''
+    digits = str(abs(ticks)).rjust(TICK_DECIMALS + 1, '0')
+    return f'{sign}{digits[:-TICK_DECIMALS]}.{digits[-TICK_DECIMALS:]}'
+
 
 class Ticker:
     timestamp: float
@@ -30,6 +67,8 @@ class Ticker:
 
 
 class KlineEntry:
+    __slots__ = ('open', 'high', 'low', 'close', 'volume', 'timestamp')
+
     open: Union[Decimal, str]
     high: Union[Decimal, str]
     low: Union[Decimal, str]
@@ -60,43 +99,73 @@ class KlineEntry:
 
 
 class OrderEntry:
-    price: Decimal
-    amount: Decimal
+    __slots__ = ('price_ticks', 'amount_ticks', '_price', '_amount')
+
+    def __init__(self, price_ticks: int = 0, amount_ticks: int = 0):
+        self.price_ticks = price_ticks
+        self.amount_ticks = amount_ticks
+        self._price: Optional[Decimal] = None
+        self._amount: Optional[Decimal] = None
 
     @classmethod
     def from_json(cls, data: List[Any]) -> 'OrderEntry':
-        order = OrderEntry()
-        order.price = dec(str(data[0]))
-        order.amount = dec(str(data[1]))
-        return order
+        return cls(to_ticks(data[0]), to_ticks(data[1]))
+
+    @property
+    def price(self) -> Decimal:
+        if self._price is None:
+            self._price = ticks_to_decimal(self.price_ticks)
+        return self._price
+
+    @price.setter
+    def price(self, value: Decimal) -> None:
+        self.price_ticks = to_ticks(value)
+        self._price = None
+
+    @property
+    def amount(self) -> Decimal:
+        if self._amount is None:
+            self._amount = ticks_to_decimal(self.amount_ticks)
+        return self._amount
+
+    @amount.setter
+    def amount(self, value: Decimal) -> None:
+        self.amount_ticks = to_ticks(value)
+        self._amount = None
 
     @property
     def price_str(self) -> str:
-        return '{:f}'.format(self.price)
+        return ticks_to_str(self.price_ticks)
 
     def as_json(self) -> List[Any]:
-        return [self.price_str, float(self.amount)]
+        # int / int 为正确舍入，与 float(Decimal) 结果一致
+        return [self.price_str, self.amount_ticks / TICK_SCALE]
 
     def __str__(self) -> str:
         return '[{}, {}]'.format(self.price_str, self.amount)
 
 
 class Orderbook:
+    __slots__ = ('timestamp', 'bids', 'asks', 'exchange', 'source', 'nonce', 'datetime')
+
     timestamp: Union[int, float, None]
     bids: List[OrderEntry]
     asks: List[OrderEntry]
-    exchange: Optional[str] = None
-    source: Optional[str] = None
+    exchange: Optional[str]
+    source: Optional[str]
 
     # bitmex specific fields
-    nonce: Optional[str] = None
-    datetime: Optional[str] = None
+    nonce: Optional[str]
+    datetime: Optional[str]
 
     def __init__(self):
         self.bids = []
         self.asks = []
-        self.timestamp = time.time() * 1000
+        self.timestamp = ntp_clock.now() * 1000
         self.exchange = None
+        self.source = None
+        self.nonce = None
+        self.datetime = None
 
     def mid_price(self) -> Decimal:
         return self.asks[0].price / d2 + self.bids[0].price / d2
@@ -111,13 +180,8 @@ class Orderbook:
         ob.datetime = data.get('datetime')
         ob.source = data.get('source')
 
-        ob.timestamp = data['timestamp']
-        if not ob.timestamp:
-            try:
-                ntp_time = ntplib.NTPClient().request(settings.NTP_TIME_SERVER).tx_time
-                ob.timestamp = int(ntp_time * 1000)  # ms
-            except Exception:
-                ob.timestamp = time.time() * 1000
+        # 缺少时间戳时使用校时时钟，解析过程不做网络I/O
+        ob.timestamp = data['timestamp'] or ntp_clock.now_ms()
         return ob
 
     @classmethod
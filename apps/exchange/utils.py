@@ -1,6 +1,6 @@
 import asyncio
 # import json # Removed as no longer used
-from typing import Dict, List, Optional, Union, Any, Set
+from typing import Dict, List, Optional, Union, Any, Set, Tuple
 
 import ccxt
 import ccxt.async_support as async_ccxt_module
@@ -159,6 +159,26 @@ async def get_exchange_capability_support(ccxt_module: Any, capability_name: str
     return results
 
 
+_CAPABILITY_CACHE: Dict[Tuple[str, str], bool] = {}
+
+
+def has_native_capability(client: Any, capability_name: str) -> bool:
+    """
+    交易所是否原生支持某个功能（模拟实现视为不支持），直接读取已有客户端的 has 声明，
+    结果按 (交易所, 功能) 在进程内缓存。
+    """
+    key = (client.id, capability_name)
+    if key not in _CAPABILITY_CACHE:
+        has = getattr(client, 'has', None) or {}
+        _CAPABILITY_CACHE[key] = has.get(capability_name) is True
+    return _CAPABILITY_CACHE[key]
+
+
+def mark_capability_unsupported(exchange_id: str, capability_name: str) -> None:
+    """运行时调用失败（如 NotSupported）时，把该功能标记为不支持，后续改走回退路径"""
+    _CAPABILITY_CACHE[(exchange_id, capability_name)] = False
+
+
 async def execute_exchange_method_async(exchange_id: str, method_name: str, params: Optional[Dict[str, Any]] = None, max_retries: int = 3, retry_delay_seconds: int = 5) -> Optional[Dict[str, Any]]:
     """
     使用ccxt.async_support安全地从指定交易所执行指定的方法，
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import threading
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from decimal import Decimal
@@ -9,7 +11,12 @@ from typing import Dict, List, Optional
 
 import ccxt.async_support as async_ccxt
 
-from apps.price_oracle.constants import STABLECOIN_SYMBOLS, EXCHANGE_PRIORITY
+from apps.price_oracle.constants import (
+    CCXT_CLIENT_MAX_ERRORS,
+    CCXT_MARKETS_REFRESH_INTERVAL,
+    EXCHANGE_PRIORITY,
+    STABLECOIN_SYMBOLS,
+)
 from common.helpers import getLogger
 
 logger = getLogger(__name__)
@@ -48,10 +55,17 @@ class ExchangeAdapter(ABC):
 
 
 class CCXTAdapter(ExchangeAdapter):
-    """通用CCXT适配器，支持所有交易所"""
+    """
+    通用CCXT适配器，支持所有交易所。
+
+    实例由 AdapterPool 长期持有：客户端及其 aiohttp 会话跨采集周期复用，
+    市场信息每 CCXT_MARKETS_REFRESH_INTERVAL 秒刷新一次，连续失败 CCXT_CLIENT_MAX_ERRORS 次后重建客户端。
+    """
 
     def __init__(self, exchange_id: str):
         super().__init__(exchange_id)
+        self._markets_loaded_at: Optional[float] = None
+        self._consecutive_errors = 0
         self._create_client()
 
     def _create_client(self):
@@ -84,13 +98,42 @@ class CCXTAdapter(ExchangeAdapter):
             logger.error(f"创建CCXT客户端失败 {self.exchange_id}: {e}")
             self.client = None
 
+    async def _ensure_markets(self):
+        """按刷新间隔加载市场信息；刷新失败但已有旧数据时继续使用旧数据"""
+        if self._markets_loaded_at is not None and \
+                time.monotonic() - self._markets_loaded_at < CCXT_MARKETS_REFRESH_INTERVAL:
+            return
+        try:
+            await self.client.load_markets(reload=self._markets_loaded_at is not None)
+        except Exception as e:
+            if not self.client.markets:
+                raise
+            logger.warning(f"{self.exchange_id} 刷新市场信息失败，继续使用旧数据: {e}")
+        self._markets_loaded_at = time.monotonic()
+
+    async def _recycle_client(self):
+        """关闭并重建客户端，沿用已加载的市场信息"""
+        old_client = self.client
+        await self.close()
+        self._create_client()
+        if self.client and old_client and old_client.markets:
+            self.client.set_markets(old_client.markets, old_client.currencies)
+        self._consecutive_errors = 0
+        logger.warning(f"{self.exchange_id} 连续失败{CCXT_CLIENT_MAX_ERRORS}次，已重建CCXT客户端")
+
     async def get_prices(self) -> List[PriceData]:
         """获取价格数据"""
         if not self.client:
-            logger.warning(f"CCXT客户端未初始化: {self.exchange_id}")
-            return []
+            # 上次创建失败的客户端在每次采集时重试创建，池中的适配器可以自行恢复
+            self._create_client()
+            self._markets_loaded_at = None
+            if not self.client:
+                logger.warning(f"CCXT客户端未初始化: {self.exchange_id}")
+                return []
 
         try:
+            await self._ensure_markets()
+
             # 获取所有tickers
             logger.debug(f"开始获取 {self.exchange_id} tickers...")
 
@@ -150,10 +193,14 @@ class CCXTAdapter(ExchangeAdapter):
                     ticker = tickers[symbol]
                     logger.debug(f"{self.exchange_id} {symbol}: {ticker}")
 
+            self._consecutive_errors = 0
             return prices
 
         except Exception as e:
             logger.error(f"{self.exchange_id} 获取价格失败: {e}")
+            self._consecutive_errors += 1
+            if self._consecutive_errors >= CCXT_CLIENT_MAX_ERRORS:
+                await self._recycle_client()
             return []
 
     def _extract_price(self, ticker: Dict) -> Optional[float]:
@@ -226,20 +273,83 @@ class AdapterFactory:
         return [ex for ex in EXCHANGE_PRIORITY if ex in cls.ADAPTERS]
 
 
+class AdapterPool:
+    """
+    按交易所长期持有适配器，跨采集周期复用客户端与连接。
+
+    异步客户端绑定在创建它的事件循环上，事件循环变化时旧的适配器无法继续使用，会被丢弃重建；
+    需要跨多次调用复用时，应在 get_pool_loop() 返回的常驻事件循环中运行采集。
+    """
+
+    def __init__(self):
+        self._adapters: Dict[str, ExchangeAdapter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, exchange: str) -> Optional[ExchangeAdapter]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._adapters:
+                self._discard(list(self._adapters.values()), self._loop)
+            self._adapters = {}
+            self._loop = loop
+
+        exchange_lower = exchange.lower()
+        adapter = self._adapters.get(exchange_lower)
+        if adapter is None:
+            adapter = AdapterFactory.get_adapter(exchange_lower)
+            if adapter is not None:
+                self._adapters[exchange_lower] = adapter
+        return adapter
+
+    @staticmethod
+    async def _close_adapters(adapters: List[ExchangeAdapter]):
+        await asyncio.gather(*(adapter.close() for adapter in adapters), return_exceptions=True)
+
+    def _discard(self, adapters: List[ExchangeAdapter], loop: asyncio.AbstractEventLoop):
+        """丢弃绑定在旧事件循环上的适配器：旧循环未关闭时在其上关闭，否则其连接已无法关闭"""
+        if loop.is_closed():
+            logger.warning(f"事件循环已关闭，{len(adapters)} 个旧的交易所适配器的连接无法关闭")
+            return
+        logger.warning(f"事件循环已变化，在原事件循环上关闭 {len(adapters)} 个旧的交易所适配器")
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_adapters(adapters), loop)
+            return
+        # 旧循环空闲（如 interval 模式启动后的 get_pool_loop() 循环）：当前线程已有运行中的事件循环，
+        # 不能嵌套 run_until_complete，在临时线程中驱动旧循环完成关闭；关闭会话不涉及网络请求，等待很短
+        closer = threading.Thread(target=loop.run_until_complete, args=(self._close_adapters(adapters),),
+                                  name='adapter-pool-close', daemon=True)
+        closer.start()
+        closer.join()
+
+    async def close(self):
+        """关闭所有适配器，进程或采集循环退出时调用"""
+        adapters, self._adapters = list(self._adapters.values()), {}
+        await self._close_adapters(adapters)
+
+
+adapter_pool = AdapterPool()
+_POOL_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_pool_loop() -> asyncio.AbstractEventLoop:
+    """进程内常驻的事件循环，多次单次采集（如定时任务）在其中运行以复用 adapter_pool 中的客户端"""
+    global _POOL_LOOP
+    if _POOL_LOOP is None or _POOL_LOOP.is_closed():
+        _POOL_LOOP = asyncio.new_event_loop()
+    return _POOL_LOOP
+
+
 # 便捷函数
 async def get_exchange_prices(exchange: str) -> List[PriceData]:
-    """获取交易所价格的便捷函数"""
-    adapter = AdapterFactory.get_adapter(exchange)
+    """获取交易所价格的便捷函数，适配器从 adapter_pool 获取并保持打开"""
+    adapter = adapter_pool.get(exchange)
     if not adapter:
         return []
 
     try:
-        prices = await adapter.get_prices()
-        await adapter.close()
-        return prices
+        return await adapter.get_prices()
     except Exception as e:
         logger.error(f"获取 {exchange} 价格失败: {e}")
-        await adapter.close()
         return []
 
 
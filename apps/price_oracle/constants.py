@@ -53,3 +53,7 @@ EXCHANGE_PRIORITY = [
     'hitbtc',
     'coinup',  # CoinUp - CP/USDT专用
 ]
+
+# CCXT 客户端池配置
+CCXT_MARKETS_REFRESH_INTERVAL = 3600  # 市场信息（load_markets）刷新间隔（秒），独立于价格采集周期
+CCXT_CLIENT_MAX_ERRORS = 3  # 连续失败多少次后重建客户端
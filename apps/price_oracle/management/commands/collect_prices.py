@@ -6,7 +6,7 @@ import time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from common.helpers import getLogger
-from apps.price_oracle.adapters import AdapterFactory, get_exchange_prices
+from apps.price_oracle.adapters import AdapterFactory, adapter_pool, get_exchange_prices, get_pool_loop
 from apps.price_oracle.redis_service import redis_service
 from apps.price_oracle.scheduler import IndependentScheduler
 
@@ -45,17 +45,13 @@ class Command(BaseCommand):
             self.run_once(exchanges)
 
     def run_once(self, exchanges: list):
-        """单次采集 - 并行执行"""
-        loop = asyncio.new_event_loop()
+        """单次采集 - 并行执行。使用进程内常驻的事件循环，定时任务多次调用时复用交易所客户端"""
+        loop = get_pool_loop()
         asyncio.set_event_loop(loop)
-        
-        try:
-            # 并行采集所有交易所
-            total_saved = loop.run_until_complete(self.collect_all_exchanges_parallel(exchanges))
-            self.stdout.write(f"✅ 采集完成，共保存 {total_saved} 个价格到Redis")
-            
-        finally:
-            loop.close()
+
+        # 并行采集所有交易所
+        total_saved = loop.run_until_complete(self.collect_all_exchanges_parallel(exchanges))
+        self.stdout.write(f"✅ 采集完成，共保存 {total_saved} 个价格到Redis")
 
     async def collect_all_exchanges_parallel(self, exchanges: list) -> int:
         """并行采集所有交易所"""
@@ -88,6 +84,7 @@ class Command(BaseCommand):
         try:
             loop.run_until_complete(self.independent_collect_loop(exchanges))
         finally:
+            loop.run_until_complete(adapter_pool.close())
             loop.close()
 
     async def independent_collect_loop(self, exchanges: list):
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+import ntplib
+from django.conf import settings
+
+from common.helpers import getLogger
+
+logger = getLogger(__name__)
+
+NTP_SYNC_INTERVAL = 300  # NTP 偏移的后台同步间隔（秒）
+NTP_REQUEST_TIMEOUT = 2  # 单次 NTP 请求超时（秒）
+
+
+class NtpClock:
+    """
+    进程级校时时钟。
+
+    后台守护线程按固定间隔向 NTP 服务器同步本机时钟偏移，now() 只读取内存中的偏移，
+    不做任何网络I/O，可以在反序列化等热路径中调用。同步失败时沿用上一次的偏移（初始为0，即本机时间）。
+    线程在首次调用时启动；prefork 子进程中线程不会被继承，按进程号检测后重新启动。
+    """
+
+    def __init__(self, server: str, sync_interval: float = NTP_SYNC_INTERVAL, timeout: float = NTP_REQUEST_TIMEOUT):
+        self.server = server
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self.offset = 0.0
+        self.last_sync = None  # 最近一次成功同步的本机时间
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='ntp-clock-sync', daemon=True)
+            thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.sync()
+            time.sleep(self.sync_interval)
+
+    def sync(self) -> bool:
+        """向 NTP 服务器同步一次偏移，仅由后台线程调用"""
+        try:
+            response = ntplib.NTPClient().request(self.server, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"NTP sync with {self.server} failed, keeping offset {self.offset:.3f}s: {e}")
+            return False
+        self.offset = response.offset
+        self.last_sync = time.time()
+        logger.debug(f"NTP offset synced with {self.server}: {self.offset:.3f}s")
+        return True
+
+    def now(self) -> float:
+        """校正后的当前时间（秒），不阻塞"""
+        self._ensure_started()
+        return time.time() + self.offset
+
+    def now_ms(self) -> int:
+        """校正后的当前时间（毫秒），不阻塞"""
+        return int(self.now() * 1000)
+
+
+ntp_clock = NtpClock(getattr(settings, 'NTP_TIME_SERVER', 'pool.ntp.org'))
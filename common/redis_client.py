@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import asyncio
 import json
 import time
+from urllib.parse import quote
 from typing import Optional, Dict, Any, List, Tuple, Union
 
 import redis.asyncio as aioredis
@@ -147,11 +149,11 @@ def global_redis():
     return GlobalRedisWrapper
 
 
-def get_async_redis_client(redis_url: str):
+def get_async_redis_client(redis_url: str, decode_responses: bool = True):
     """创建异步Redis客户端，处理连接池的生命周期管理"""
     return aioredis.from_url(
         redis_url, 
-        decode_responses=True,
+        decode_responses=decode_responses,
         # 设置连接池参数，避免事件循环关闭问题
         max_connections=20,
         retry_on_timeout=True,
@@ -160,3 +162,33 @@ def get_async_redis_client(redis_url: str):
         socket_keepalive_options={},
         health_check_interval=30
     )
+
+
+# 异步客户端按事件循环缓存：连接绑定创建它的事件循环，循环更换时重新创建
+_ASYNC_CLIENTS: Dict[str, Tuple[asyncio.AbstractEventLoop, AsyncRedis]] = {}
+
+
+def _trading_redis_url() -> str:
+    password = settings.TRADING_REDIS.get("password")
+    auth = f":{quote(password, safe='')}@" if password else ""
+    return f"redis://{auth}{settings.TRADING_REDIS['host']}:{settings.TRADING_REDIS['port']}/{settings.TRADING_REDIS['db']}"
+
+
+def _get_async_client(name: str, redis_url: str) -> AsyncRedis:
+    loop = asyncio.get_running_loop()
+    cached = _ASYNC_CLIENTS.get(name)
+    if cached and cached[0] is loop:
+        return cached[1]
+    client = get_async_redis_client(redis_url, decode_responses=False)
+    _ASYNC_CLIENTS[name] = (loop, client)
+    return client
+
+
+def async_local_redis() -> AsyncRedis:
+    """local_redis 的异步版本（TRADING_REDIS），返回 bytes"""
+    return _get_async_client("local", _trading_redis_url())
+
+
+def async_global_redis() -> AsyncRedis:
+    """global_redis 所用 Django 缓存的异步原生连接，返回 bytes；键名与序列化需经 django_redis 客户端处理"""
+    return _get_async_client("global", settings.CACHES["default"]["LOCATION"])
@@ -32,6 +32,11 @@ DEFAULT_BEAT_SCHEDULE = {
         'options': {'queue': 'klines'},  # K线专用队列
         'kwargs': {'count': 24, 'only_missing': True},  # 只处理缺失数据的资产
     },
+    'refill_missing_cmc_klines': {
+        'task': 'apps.cmc_proxy.tasks.refill_missing_klines',
+        'schedule': 30.0,  # 每30秒补齐一次列表接口中缺失K线的资产
+        'options': {'queue': 'klines'},  # K线专用队列
+    },
     'daily_token_holdings_update': {
         'task': 'apps.token_holdings.tasks.update_token_holdings_daily_task',
         'schedule': crontab(hour=4, minute=0),  # 每天凌晨4点执行